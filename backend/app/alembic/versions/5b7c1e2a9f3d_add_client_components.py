@@ -0,0 +1,39 @@
+"""Add client componentId
+
+Revision ID: 5b7c1e2a9f3d
+Revises: 1d52089deb4c
+Create Date: 2026-10-19 09:12:44.318201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision = '5b7c1e2a9f3d'
+down_revision = '1d52089deb4c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Columns used by app.models.Clients that were added to the live database by hand
+    op.execute("""
+    ALTER TABLE clients ADD COLUMN IF NOT EXISTS "parameterOne" TEXT;
+    ALTER TABLE clients ADD COLUMN IF NOT EXISTS "parameterTwo" TEXT;
+    ALTER TABLE clients ADD COLUMN IF NOT EXISTS "parameterThree" TEXT;
+    ALTER TABLE clients ADD COLUMN IF NOT EXISTS "groupName" TEXT;
+    """)
+
+    # NULL means "not labelled yet", see app.graph.refresh_components
+    op.execute("""
+    ALTER TABLE clients ADD COLUMN "componentId" INTEGER;
+    CREATE INDEX ix_clients_componentid ON clients ("componentId");
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP INDEX IF EXISTS ix_clients_componentid;
+    ALTER TABLE clients DROP COLUMN IF EXISTS "componentId";
+    """)
@@ -0,0 +1,104 @@
+"""Add relations_listing
+
+Revision ID: 8e4d2f6a1c9b
+Revises: 5b7c1e2a9f3d
+Create Date: 2026-10-19 10:41:07.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision = '8e4d2f6a1c9b'
+down_revision = '5b7c1e2a9f3d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Denormalised copy of relations carrying both clients' name and image,
+    # so relation listings don't have to join clients twice by TEXT userId
+    op.execute("""
+    CREATE TABLE relations_listing
+    (
+        id                    INTEGER PRIMARY KEY REFERENCES relations (id) ON DELETE CASCADE,
+        "fromClientId"        TEXT               NOT NULL,
+        "toClientId"          TEXT               NOT NULL,
+        status                SMALLINT DEFAULT 1 NOT NULL,
+        from_client_name      TEXT               NOT NULL,
+        to_client_name        TEXT               NOT NULL,
+        "fromClientInstagram" TEXT,
+        "toClientInstagram"   TEXT
+    );
+
+    CREATE INDEX ix_relations_listing_fromclientid ON relations_listing ("fromClientId", id);
+    CREATE INDEX ix_relations_listing_toclientid ON relations_listing ("toClientId", id);
+    """)
+
+    # Keep it in sync from every write path: relation inserts/updates, client renames.
+    # Relation deletes (and client deletes, through relations) cascade on the FK.
+    op.execute("""
+    CREATE FUNCTION relations_listing_upsert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO relations_listing
+            (id, "fromClientId", "toClientId", status, from_client_name, to_client_name,
+             "fromClientInstagram", "toClientInstagram")
+        SELECT NEW.id, NEW."fromClientId", NEW."toClientId", NEW.status, f.name, t.name,
+               f.instagram, t.instagram
+        FROM clients f, clients t
+        WHERE f."userId" = NEW."fromClientId" AND t."userId" = NEW."toClientId"
+        ON CONFLICT (id) DO UPDATE SET
+            "fromClientId" = EXCLUDED."fromClientId",
+            "toClientId" = EXCLUDED."toClientId",
+            status = EXCLUDED.status,
+            from_client_name = EXCLUDED.from_client_name,
+            to_client_name = EXCLUDED.to_client_name,
+            "fromClientInstagram" = EXCLUDED."fromClientInstagram",
+            "toClientInstagram" = EXCLUDED."toClientInstagram";
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER relations_listing_sync
+        AFTER INSERT OR UPDATE ON relations
+        FOR EACH ROW EXECUTE FUNCTION relations_listing_upsert();
+
+    CREATE FUNCTION relations_listing_client_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE relations_listing
+        SET from_client_name = NEW.name, "fromClientInstagram" = NEW.instagram
+        WHERE "fromClientId" = NEW."userId";
+        UPDATE relations_listing
+        SET to_client_name = NEW.name, "toClientInstagram" = NEW.instagram
+        WHERE "toClientId" = NEW."userId";
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER relations_listing_client_sync
+        AFTER UPDATE OF name, instagram ON clients
+        FOR EACH ROW
+        WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.instagram IS DISTINCT FROM NEW.instagram)
+        EXECUTE FUNCTION relations_listing_client_update();
+    """)
+
+    op.execute("""
+    INSERT INTO relations_listing
+        (id, "fromClientId", "toClientId", status, from_client_name, to_client_name,
+         "fromClientInstagram", "toClientInstagram")
+    SELECT r.id, r."fromClientId", r."toClientId", r.status, f.name, t.name, f.instagram, t.instagram
+    FROM relations r
+    JOIN clients f ON f."userId" = r."fromClientId"
+    JOIN clients t ON t."userId" = r."toClientId";
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER IF EXISTS relations_listing_client_sync ON clients;
+    DROP TRIGGER IF EXISTS relations_listing_sync ON relations;
+    DROP FUNCTION IF EXISTS relations_listing_client_update();
+    DROP FUNCTION IF EXISTS relations_listing_upsert();
+    DROP TABLE IF EXISTS relations_listing;
+    """)
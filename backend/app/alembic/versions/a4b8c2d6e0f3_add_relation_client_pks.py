@@ -0,0 +1,179 @@
+"""Add integer client keys to relations
+
+Revision ID: a4b8c2d6e0f3
+Revises: c3a9e5d7b2f1
+Create Date: 2026-10-19 16:12:38.530941
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision = 'a4b8c2d6e0f3'
+down_revision = 'c3a9e5d7b2f1'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10_000
+
+
+def upgrade():
+    # clients.id next to the TEXT "userId" references, so graph joins compare integers
+    op.execute("""
+    ALTER TABLE relations ADD COLUMN from_client_pk INTEGER;
+    ALTER TABLE relations ADD COLUMN to_client_pk INTEGER;
+    ALTER TABLE relations_listing ADD COLUMN from_client_pk INTEGER;
+    ALTER TABLE relations_listing ADD COLUMN to_client_pk INTEGER;
+    """)
+
+    # Writers that only set the userIds (bulk loads, older code) get the keys filled in
+    op.execute("""
+    CREATE FUNCTION relations_fill_client_pks() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.from_client_pk IS NULL OR (TG_OP = 'UPDATE' AND NEW."fromClientId" IS DISTINCT FROM OLD."fromClientId") THEN
+            SELECT id INTO NEW.from_client_pk FROM clients WHERE "userId" = NEW."fromClientId";
+        END IF;
+        IF NEW.to_client_pk IS NULL OR (TG_OP = 'UPDATE' AND NEW."toClientId" IS DISTINCT FROM OLD."toClientId") THEN
+            SELECT id INTO NEW.to_client_pk FROM clients WHERE "userId" = NEW."toClientId";
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER relations_fill_client_pks
+        BEFORE INSERT OR UPDATE ON relations
+        FOR EACH ROW EXECUTE FUNCTION relations_fill_client_pks();
+    """)
+
+    # Backfill in batches of relation ids, each committed on its own so the
+    # table is never locked for the whole run
+    connection = op.get_bind()
+    first_id, last_id = connection.execute(sa.text("SELECT min(id), max(id) FROM relations")).one()
+    with op.get_context().autocommit_block():
+        for start in range(first_id or 0, (last_id or 0) + 1, BACKFILL_BATCH_SIZE):
+            connection.execute(
+                sa.text("""
+                UPDATE relations r
+                SET from_client_pk = f.id, to_client_pk = t.id
+                FROM clients f, clients t
+                WHERE f."userId" = r."fromClientId" AND t."userId" = r."toClientId"
+                  AND r.id >= :start AND r.id < :end
+                """),
+                {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+            )
+            connection.execute(
+                sa.text("""
+                UPDATE relations_listing l
+                SET from_client_pk = r.from_client_pk, to_client_pk = r.to_client_pk
+                FROM relations r
+                WHERE r.id = l.id AND l.id >= :start AND l.id < :end
+                """),
+                {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+            )
+
+    op.execute("""
+    ALTER TABLE relations ALTER COLUMN from_client_pk SET NOT NULL;
+    ALTER TABLE relations ALTER COLUMN to_client_pk SET NOT NULL;
+    ALTER TABLE relations ADD CONSTRAINT relations_from_client_pk_fkey
+        FOREIGN KEY (from_client_pk) REFERENCES clients (id) ON DELETE CASCADE;
+    ALTER TABLE relations ADD CONSTRAINT relations_to_client_pk_fkey
+        FOREIGN KEY (to_client_pk) REFERENCES clients (id) ON DELETE CASCADE;
+    CREATE INDEX ix_relations_from_client_pk ON relations (from_client_pk);
+    CREATE INDEX ix_relations_to_client_pk ON relations (to_client_pk);
+
+    ALTER TABLE relations_listing ALTER COLUMN from_client_pk SET NOT NULL;
+    ALTER TABLE relations_listing ALTER COLUMN to_client_pk SET NOT NULL;
+    DROP INDEX ix_relations_listing_fromclientid;
+    DROP INDEX ix_relations_listing_toclientid;
+    CREATE INDEX ix_relations_listing_from_client_pk ON relations_listing (from_client_pk, id);
+    CREATE INDEX ix_relations_listing_to_client_pk ON relations_listing (to_client_pk, id);
+    """)
+
+    # The listing triggers look clients up by id from now on
+    op.execute("""
+    CREATE OR REPLACE FUNCTION relations_listing_upsert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO relations_listing
+            (id, "fromClientId", "toClientId", from_client_pk, to_client_pk, status,
+             from_client_name, to_client_name, "fromClientInstagram", "toClientInstagram")
+        SELECT NEW.id, NEW."fromClientId", NEW."toClientId", NEW.from_client_pk, NEW.to_client_pk,
+               NEW.status, f.name, t.name, f.instagram, t.instagram
+        FROM clients f, clients t
+        WHERE f.id = NEW.from_client_pk AND t.id = NEW.to_client_pk
+        ON CONFLICT (id) DO UPDATE SET
+            "fromClientId" = EXCLUDED."fromClientId",
+            "toClientId" = EXCLUDED."toClientId",
+            from_client_pk = EXCLUDED.from_client_pk,
+            to_client_pk = EXCLUDED.to_client_pk,
+            status = EXCLUDED.status,
+            from_client_name = EXCLUDED.from_client_name,
+            to_client_name = EXCLUDED.to_client_name,
+            "fromClientInstagram" = EXCLUDED."fromClientInstagram",
+            "toClientInstagram" = EXCLUDED."toClientInstagram";
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION relations_listing_client_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE relations_listing
+        SET from_client_name = NEW.name, "fromClientInstagram" = NEW.instagram
+        WHERE from_client_pk = NEW.id;
+        UPDATE relations_listing
+        SET to_client_name = NEW.name, "toClientInstagram" = NEW.instagram
+        WHERE to_client_pk = NEW.id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade():
+    op.execute("""
+    CREATE OR REPLACE FUNCTION relations_listing_upsert() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO relations_listing
+            (id, "fromClientId", "toClientId", status, from_client_name, to_client_name,
+             "fromClientInstagram", "toClientInstagram")
+        SELECT NEW.id, NEW."fromClientId", NEW."toClientId", NEW.status, f.name, t.name,
+               f.instagram, t.instagram
+        FROM clients f, clients t
+        WHERE f."userId" = NEW."fromClientId" AND t."userId" = NEW."toClientId"
+        ON CONFLICT (id) DO UPDATE SET
+            "fromClientId" = EXCLUDED."fromClientId",
+            "toClientId" = EXCLUDED."toClientId",
+            status = EXCLUDED.status,
+            from_client_name = EXCLUDED.from_client_name,
+            to_client_name = EXCLUDED.to_client_name,
+            "fromClientInstagram" = EXCLUDED."fromClientInstagram",
+            "toClientInstagram" = EXCLUDED."toClientInstagram";
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION relations_listing_client_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE relations_listing
+        SET from_client_name = NEW.name, "fromClientInstagram" = NEW.instagram
+        WHERE "fromClientId" = NEW."userId";
+        UPDATE relations_listing
+        SET to_client_name = NEW.name, "toClientInstagram" = NEW.instagram
+        WHERE "toClientId" = NEW."userId";
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS relations_fill_client_pks ON relations;
+    DROP FUNCTION IF EXISTS relations_fill_client_pks();
+
+    DROP INDEX IF EXISTS ix_relations_listing_from_client_pk;
+    DROP INDEX IF EXISTS ix_relations_listing_to_client_pk;
+    CREATE INDEX ix_relations_listing_fromclientid ON relations_listing ("fromClientId", id);
+    CREATE INDEX ix_relations_listing_toclientid ON relations_listing ("toClientId", id);
+    ALTER TABLE relations_listing DROP COLUMN IF EXISTS from_client_pk;
+    ALTER TABLE relations_listing DROP COLUMN IF EXISTS to_client_pk;
+
+    ALTER TABLE relations DROP COLUMN IF EXISTS from_client_pk;
+    ALTER TABLE relations DROP COLUMN IF EXISTS to_client_pk;
+    """)
@@ -0,0 +1,137 @@
+"""Add client group versions
+
+Revision ID: b5d1f7a3c9e2
+Revises: a4b8c2d6e0f3
+Create Date: 2026-10-19 18:04:51.207316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision = 'b5d1f7a3c9e2'
+down_revision = 'a4b8c2d6e0f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Members of a group, in the order group graphs are paginated
+    op.execute("""
+    CREATE INDEX ix_clients_groupname ON clients ("groupName", id);
+    """)
+
+    # One row per groupName with a version bumped by triggers whenever the
+    # group's graph changes, so cached group graphs are keyed by version.
+    # A group is bumped once per transaction (bumped_by holds the last one):
+    # readers see all of a transaction's changes at once, and updating the
+    # same row for every statement of a bulk import gets slower and slower
+    op.execute("""
+    CREATE TABLE client_groups (
+        name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1,
+        bumped_by BIGINT NOT NULL DEFAULT txid_current()
+    );
+    INSERT INTO client_groups (name)
+    SELECT DISTINCT "groupName" FROM clients WHERE "groupName" IS NOT NULL;
+    """)
+
+    # Statement level triggers, multi-row inserts and deletes run them once
+    op.execute("""
+    CREATE FUNCTION clients_bump_group_versions() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO client_groups AS g (name)
+            SELECT DISTINCT "groupName" FROM new_rows WHERE "groupName" IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET version = g.version + 1, bumped_by = txid_current()
+            WHERE g.bumped_by <> txid_current();
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO client_groups AS g (name)
+            SELECT DISTINCT "groupName" FROM old_rows WHERE "groupName" IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET version = g.version + 1, bumped_by = txid_current()
+            WHERE g.bumped_by <> txid_current();
+        ELSE
+            -- Only the columns group graphs show. The groups of related
+            -- clients too: their graphs show the client as an external node
+            INSERT INTO client_groups AS g (name)
+            SELECT DISTINCT changed.name FROM (
+                SELECT n.id, o."groupName" AS old_group, n."groupName" AS new_group
+                FROM old_rows o JOIN new_rows n ON n.id = o.id
+                WHERE (o."groupName", o."userId", o.name, o.instagram)
+                      IS DISTINCT FROM (n."groupName", n."userId", n.name, n.instagram)
+            ) c, LATERAL (
+                VALUES (c.old_group), (c.new_group)
+                UNION ALL
+                SELECT nb."groupName" FROM relations r JOIN clients nb ON nb.id = r.to_client_pk
+                WHERE r.from_client_pk = c.id
+                UNION ALL
+                SELECT nb."groupName" FROM relations r JOIN clients nb ON nb.id = r.from_client_pk
+                WHERE r.to_client_pk = c.id
+            ) AS changed (name)
+            WHERE changed.name IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET version = g.version + 1, bumped_by = txid_current()
+            WHERE g.bumped_by <> txid_current();
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER clients_group_versions_insert
+        AFTER INSERT ON clients REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION clients_bump_group_versions();
+    CREATE TRIGGER clients_group_versions_update
+        AFTER UPDATE ON clients REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION clients_bump_group_versions();
+    CREATE TRIGGER clients_group_versions_delete
+        AFTER DELETE ON clients REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION clients_bump_group_versions();
+
+    -- Both ends' groups: edges leaving a group are part of its graph too
+    CREATE FUNCTION relations_bump_group_versions() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO client_groups AS g (name)
+            SELECT DISTINCT c."groupName"
+            FROM new_rows r JOIN clients c ON c.id IN (r.from_client_pk, r.to_client_pk)
+            WHERE c."groupName" IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET version = g.version + 1, bumped_by = txid_current()
+            WHERE g.bumped_by <> txid_current();
+        END IF;
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            INSERT INTO client_groups AS g (name)
+            SELECT DISTINCT c."groupName"
+            FROM old_rows r JOIN clients c ON c.id IN (r.from_client_pk, r.to_client_pk)
+            WHERE c."groupName" IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET version = g.version + 1, bumped_by = txid_current()
+            WHERE g.bumped_by <> txid_current();
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER relations_group_versions_insert
+        AFTER INSERT ON relations REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_bump_group_versions();
+    CREATE TRIGGER relations_group_versions_update
+        AFTER UPDATE ON relations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_bump_group_versions();
+    CREATE TRIGGER relations_group_versions_delete
+        AFTER DELETE ON relations REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_bump_group_versions();
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER IF EXISTS relations_group_versions_insert ON relations;
+    DROP TRIGGER IF EXISTS relations_group_versions_update ON relations;
+    DROP TRIGGER IF EXISTS relations_group_versions_delete ON relations;
+    DROP FUNCTION IF EXISTS relations_bump_group_versions();
+    DROP TRIGGER IF EXISTS clients_group_versions_insert ON clients;
+    DROP TRIGGER IF EXISTS clients_group_versions_update ON clients;
+    DROP TRIGGER IF EXISTS clients_group_versions_delete ON clients;
+    DROP FUNCTION IF EXISTS clients_bump_group_versions();
+    DROP TABLE IF EXISTS client_groups;
+    DROP INDEX IF EXISTS ix_clients_groupname;
+    """)
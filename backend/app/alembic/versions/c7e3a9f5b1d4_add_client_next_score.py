@@ -0,0 +1,159 @@
+"""Add client reachedNeighbours and nextScore
+
+Revision ID: c7e3a9f5b1d4
+Revises: b5d1f7a3c9e2
+Create Date: 2026-10-19 19:26:03.841275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+# revision identifiers, used by Alembic.
+revision = 'c7e3a9f5b1d4'
+down_revision = 'b5d1f7a3c9e2'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10_000
+
+
+def upgrade():
+    # Distinct clients with "isReached" = 1 related either way, kept up to date
+    # by the triggers below
+    op.execute("""
+    ALTER TABLE clients ADD COLUMN "reachedNeighbours" INTEGER NOT NULL DEFAULT 0;
+    """)
+
+    connection = op.get_bind()
+    first_id, last_id = connection.execute(sa.text("SELECT min(id), max(id) FROM clients")).one()
+    with op.get_context().autocommit_block():
+        for start in range(first_id or 0, (last_id or 0) + 1, BACKFILL_BATCH_SIZE):
+            connection.execute(
+                sa.text("""
+                UPDATE clients c
+                SET "reachedNeighbours" = d.reached
+                FROM (
+                    SELECT n.pk, count(DISTINCT n.other) AS reached
+                    FROM (
+                        SELECT r.from_client_pk AS pk, r.to_client_pk AS other FROM relations r
+                        UNION ALL
+                        SELECT r.to_client_pk, r.from_client_pk FROM relations r
+                    ) n
+                    JOIN clients o ON o.id = n.other
+                    WHERE o."isReached" = 1 AND n.pk >= :start AND n.pk < :end
+                    GROUP BY n.pk
+                ) d
+                WHERE c.id = d.pk
+                """),
+                {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+            )
+
+    # Same expression as app.models.NEXT_SCORE. NULL for reached clients, so
+    # the partial index only holds the queue
+    op.execute("""
+    ALTER TABLE clients ADD COLUMN "nextScore" INTEGER GENERATED ALWAYS AS (
+        CASE WHEN "isReached" = 1 THEN NULL ELSE
+            100 * COALESCE(priority, 0)
+            - 40 * COALESCE("howHardToReach", 0)
+            + CASE "openForConnections" WHEN 1 THEN 50 WHEN 2 THEN 20 ELSE 0 END
+            + 30 * CASE WHEN "reachedNeighbours" > 5 THEN 5 ELSE "reachedNeighbours" END
+        END
+    ) STORED;
+    CREATE INDEX ix_clients_nextscore ON clients ("nextScore" DESC, id)
+        WHERE "nextScore" IS NOT NULL;
+    """)
+
+    # New relations add to the counts of both ends, per statement, unless the
+    # ends were already related by another relation
+    op.execute("""
+    CREATE FUNCTION relations_count_reached_neighbours() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            UPDATE clients c
+            SET "reachedNeighbours" = c."reachedNeighbours" + d.reached
+            FROM (
+                SELECT n.pk, count(DISTINCT n.other) AS reached
+                FROM (
+                    SELECT from_client_pk AS pk, to_client_pk AS other FROM new_rows
+                    UNION ALL
+                    SELECT to_client_pk, from_client_pk FROM new_rows
+                ) n
+                JOIN clients o ON o.id = n.other
+                WHERE o."isReached" = 1
+                  AND NOT EXISTS (
+                      SELECT 1 FROM relations r
+                      WHERE ((r.from_client_pk = n.pk AND r.to_client_pk = n.other)
+                             OR (r.from_client_pk = n.other AND r.to_client_pk = n.pk))
+                        AND NOT EXISTS (SELECT 1 FROM new_rows x WHERE x.id = r.id)
+                  )
+                GROUP BY n.pk
+            ) d
+            WHERE c.id = d.pk;
+        END IF;
+        -- Removed relations recount instead: when clients are deleted their
+        -- relations go by cascade, after the reached ends can be looked up
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE clients c
+            SET "reachedNeighbours" = (
+                SELECT count(DISTINCT o.id)
+                FROM relations r
+                JOIN clients o ON o.id = CASE WHEN r.from_client_pk = c.id THEN r.to_client_pk ELSE r.from_client_pk END
+                WHERE (r.from_client_pk = c.id OR r.to_client_pk = c.id) AND o."isReached" = 1
+            )
+            WHERE c.id IN (
+                SELECT from_client_pk FROM old_rows UNION SELECT to_client_pk FROM old_rows
+            );
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER relations_reached_neighbours_insert
+        AFTER INSERT ON relations REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_count_reached_neighbours();
+    CREATE TRIGGER relations_reached_neighbours_update
+        AFTER UPDATE ON relations REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_count_reached_neighbours();
+    CREATE TRIGGER relations_reached_neighbours_delete
+        AFTER DELETE ON relations REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION relations_count_reached_neighbours();
+
+    -- A client becoming (un)reached changes the counts of all its neighbours,
+    -- by one however many relations they share
+    CREATE FUNCTION clients_count_reached_neighbours() RETURNS trigger AS $$
+    BEGIN
+        UPDATE clients c
+        SET "reachedNeighbours" = c."reachedNeighbours" + d.reached
+        FROM (
+            SELECT CASE WHEN from_client_pk = NEW.id THEN to_client_pk ELSE from_client_pk END AS pk,
+                   CASE WHEN NEW."isReached" = 1 THEN 1 ELSE -1 END AS reached
+            FROM relations
+            WHERE from_client_pk = NEW.id OR to_client_pk = NEW.id
+            GROUP BY 1
+        ) d
+        WHERE c.id = d.pk;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER clients_reached_neighbours
+        AFTER UPDATE OF "isReached" ON clients
+        FOR EACH ROW
+        WHEN ((OLD."isReached" IS NOT DISTINCT FROM 1) <> (NEW."isReached" IS NOT DISTINCT FROM 1))
+        EXECUTE FUNCTION clients_count_reached_neighbours();
+    """)
+
+
+def downgrade():
+    op.execute("""
+    DROP TRIGGER IF EXISTS clients_reached_neighbours ON clients;
+    DROP FUNCTION IF EXISTS clients_count_reached_neighbours();
+    DROP TRIGGER IF EXISTS relations_reached_neighbours_insert ON relations;
+    DROP TRIGGER IF EXISTS relations_reached_neighbours_update ON relations;
+    DROP TRIGGER IF EXISTS relations_reached_neighbours_delete ON relations;
+    DROP FUNCTION IF EXISTS relations_count_reached_neighbours();
+    DROP INDEX IF EXISTS ix_clients_nextscore;
+    ALTER TABLE clients DROP COLUMN IF EXISTS "nextScore";
+    ALTER TABLE clients DROP COLUMN IF EXISTS "reachedNeighbours";
+    """)
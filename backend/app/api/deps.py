@@ -1,7 +1,11 @@
-from collections.abc import Generator
-from typing import Annotated
+import functools
+import inspect
+from collections.abc import Callable, Generator
+from typing import Annotated, Any
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import ValidationError
@@ -10,23 +14,41 @@ from sqlmodel import Session
 from app.core import security
 from app.core.config import settings
 from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.replicas import replicas
+from app.core.revocations import token_revocations
+from app.models import TokenClaims, TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
 
 
+# A Session checks a connection out of the pool when its first statement runs
+# and returns it when its transaction ends (commit, rollback or close), so
+# declaring a session costs nothing until it is used. Endpoints end it on
+# return, see SessionReleasingRoute
+
+
 def get_db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
 
 
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    with Session(replicas.engine_for(request, engine)) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+# For read-only endpoints, may read from a replica lagging a few seconds behind
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def decode_token(token: str, typ: str | None = None) -> TokenPayload:
+    """
+    The payload of a token of type ``typ``, access tokens have none.
+    """
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -37,7 +59,19 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
+    if token_data.typ != typ:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    return token_data
+
+
+def load_active_user(session: Session, token_data: TokenPayload) -> User:
     user = session.get(User, token_data.sub)
+    # Give the connection back while the endpoint does its own work. The user
+    # is detached but loaded, session.add() attaches it again for updates
+    session.close()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -45,12 +79,100 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_current_user(session: SessionDep, token: TokenDep) -> User:
+    return load_active_user(session, decode_token(token))
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def get_current_claims(session: SessionDep, token: TokenDep) -> TokenClaims:
+    """
+    The user's claims from a self-contained access token, without a query
+    unless its tokens were revoked since it was issued. Tokens without claims
+    are checked against the database.
+    """
+    token_data = decode_token(token)
+    if (
+        token_data.sub is None
+        or token_data.email is None
+        or token_data.is_active is None
+        or token_data.is_superuser is None
+        or token_data.iat is None
+        or not token_revocations.trusts(token_data.sub, token_data.iat)
+    ):
+        user = load_active_user(session, token_data)
+        return TokenClaims.model_validate(user, from_attributes=True)
+    if not token_data.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return TokenClaims(
+        id=token_data.sub,
+        email=token_data.email,
+        is_active=token_data.is_active,
+        is_superuser=token_data.is_superuser,
+    )
+
+
+# The user's id, email and flags, without loading the user with ACCESS_TOKEN_CLAIMS
+CurrentClaims = Annotated[TokenClaims, Depends(get_current_claims)]
+
+
+def get_current_active_superuser(current_user: CurrentClaims) -> TokenClaims:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def _close_sessions(values: dict[str, Any]) -> None:
+    for value in values.values():
+        if isinstance(value, Session):
+            value.close()
+
+
+def release_sessions(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Wrap an endpoint to close the sessions it was given as soon as it returns.
+
+    FastAPI closes dependencies with ``yield`` only after the response has
+    been serialized, holding a pooled connection all that time when the
+    endpoint ran a query outside of a commit. Returned objects stay usable,
+    detached with what they loaded: objects expired by a commit have to be
+    refreshed before they are returned.
+    """
+    if getattr(endpoint, "releases_sessions", False):
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                # Closing may roll back, a database round trip
+                await run_in_threadpool(_close_sessions, kwargs)
+
+        async_wrapper.releases_sessions = True  # type: ignore[attr-defined]
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _close_sessions(kwargs)
+
+    wrapper.releases_sessions = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+class SessionReleasingRoute(APIRoute):
+    """
+    Route class closing the endpoint's sessions when it returns, for
+    ``APIRouter(route_class=SessionReleasingRoute)``.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, release_sessions(endpoint), **kwargs)
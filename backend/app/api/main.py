@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import items, login, users, utils, clients, relations
+from app.api.routes import items, login, users, utils, clients, relations, changes
 
 api_router = APIRouter()
 api_router.include_router(login.router, tags=["login"])
@@ -9,3 +9,4 @@ api_router.include_router(utils.router, prefix="/utils", tags=["utils"])
 api_router.include_router(items.router, prefix="/items", tags=["items"])
 api_router.include_router(clients.router, prefix="/clients", tags=["clients"])
 api_router.include_router(relations.router, prefix="/relations", tags=["relations"])
+api_router.include_router(changes.router, prefix="/changes", tags=["changes"])
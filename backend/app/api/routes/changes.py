@@ -0,0 +1,42 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from app.change_feed import change_feed, format_event, matches
+from app.core.config import settings
+
+router = APIRouter()
+
+
+@router.get("/", response_class=StreamingResponse)
+async def stream_changes(
+    request: Request, group_name: str | None = None, client_id: str | None = None
+) -> StreamingResponse:
+    """
+    Stream client and relation changes as Server-Sent Events, optionally only
+    those touching a group or a client (by userId).
+    """
+
+    async def events() -> AsyncIterator[str]:
+        with change_feed.subscribe() as queue:
+            # Tells EventSource clients how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), timeout=settings.CHANGE_FEED_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if matches(event, group_name, client_id):
+                    yield format_event(event)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,35 +1,72 @@
 import csv
+from collections import defaultdict
 from io import StringIO
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from sqlalchemy.orm import aliased
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File, status
 from sqlalchemy.exc import IntegrityError, DataError
-from sqlmodel import func, select
-from sqlalchemy import select as sa_select, delete
-
-from app.api.deps import CurrentUser, SessionDep
+from sqlmodel import col, func, select
+from sqlalchemy import Integer, String, any_, bindparam, delete, insert
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.api.deps import CurrentClaims, ReadSessionDep, SessionDep, SessionReleasingRoute
+from app.core.config import settings
 from app.models import Clients, ClientCreate, ClientsPublic, ClientPublic, RelationsPublic, Relations, \
-    RelationWithRelations, ClientUpdate
+    RelationPublic, RelationWithRelations, ClientUpdate, ClientComponentsPublic, RelationsListing, ClientGraph, \
+    ClientGroup, GroupGraph, ClientsNextPublic, IntroductionChain, IntroductionsPublic, GraphNodes, \
+    ClientsBatchLookup, ClientsBatchPublic
 import logging
 
+from app.change_feed import notify_change
+from app.graph import MAX_INTRODUCTION_DEPTH, NeighbourhoodTooLarge, find_introductions, get_components, \
+    invalidate_components, join_components, load_neighbourhood, merge_components, refresh_components
+from app.compression import PrecompressedBody
+from app.fieldsets import FieldSet, fields_query, parse_fields, sparse_model, sparse_page_model, sparse_response
+from app.graph_payload import GRAPH_RESPONSES, NODE_FIELDS, GraphBuilder, encode_graph, graph_media_type, \
+    graph_response, group_graph_cache, relation_columns
 from app.image import download_image
+from app.query_stats import query_budget
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
 @router.get("/", response_model=ClientsPublic)
-def get_clients(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def get_clients(
+    session: ReadSessionDep,
+    primary_session: SessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    component_id: int | None = None,
+    fields: Annotated[str | None, fields_query(ClientPublic)] = None,
+) -> Any:
     """
-    Retrieve clients.
+    Retrieve clients, optionally only the members of one connected component
+    and only some of their fields.
     """
+    field_set = parse_fields(fields, ClientPublic)
 
     count_statement = select(func.count()).select_from(Clients)
+    statement = select(Clients)
+    if field_set is not None:
+        statement = select(*(getattr(Clients, name) for name in field_set))
+    if component_id is not None:
+        # Labelling components writes, read the fresh labels where they were written
+        session = primary_session
+        refresh_components(session)
+        count_statement = count_statement.where(Clients.componentId == component_id)
+        statement = statement.where(Clients.componentId == component_id)
     count = session.exec(count_statement).one()
 
-    statement = select(Clients).offset(skip).limit(limit)
+    statement = statement.offset(skip).limit(limit)
+    if field_set is not None:
+        rows = session.connection().execute(statement).mappings()
+        return sparse_response(
+            sparse_page_model(ClientPublic, field_set), {"data": [dict(row) for row in rows], "count": count}
+        )
     users = session.exec(statement).all()
     # logger.info(f"users: {users}")
     # logger.info(f"count: {count}")
@@ -38,8 +75,9 @@ def get_clients(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
 
 
 @router.post("/", response_model=Clients)
+@query_budget(9)
 def create_client(
-        *, session: SessionDep, current_user: CurrentUser, client_in: ClientCreate
+        *, session: SessionDep, current_user: CurrentClaims, client_in: ClientCreate
 ) -> Any:
     """
     Create new Client.
@@ -53,38 +91,64 @@ def create_client(
     if instagram_image_path is None:
         instagram_image_path = 'default.png'  # Set a default image path if download fails
 
+    # Validate every referenced client with one query, before inserting anything
+    other_user_ids = list(dict.fromkeys(user_id for user_id in client_in.otherRelations if user_id))
+    neighbours: dict[str, tuple[int | None, int | None, str | None]] = {}
+    if other_user_ids:
+        rows = session.exec(
+            select(Clients.userId, Clients.id, Clients.componentId, Clients.groupName).where(
+                col(Clients.userId) == any_(bindparam("user_ids", other_user_ids, type_=ARRAY(String)))
+            )
+        ).all()
+        neighbours = {
+            user_id: (client_id, component_id, group_name)
+            for user_id, client_id, component_id, group_name in rows
+        }
+    missing = [user_id for user_id in other_user_ids if user_id not in neighbours]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Clients with ids {', '.join(missing)} do not exist")
+
     # Create the client instance with the Instagram image path
     client_data = client_in.dict(exclude={"otherRelations"})
     client_data["instagram"] = instagram_image_path
 
     client = Clients.model_validate(client_data, update={"owner_id": current_user.id})
     session.add(client)
+    session.flush()
+    join_components(session, client, [component_id for _, component_id, _ in neighbours.values()])
+
+    # The client and all its relations are committed together
+    if other_user_ids:
+        session.execute(
+            insert(Relations),
+            [
+                {
+                    "fromClientId": client.userId,
+                    "toClientId": user_id,
+                    "from_client_pk": client.id,
+                    "to_client_pk": neighbours[user_id][0],
+                    "status": 1,
+                }
+                for user_id in other_user_ids
+            ],
+        )
+    # One event for the client and its relations, sent on commit
+    notify_change(
+        session,
+        "clients",
+        "create",
+        id=client.id,
+        client_ids=[client.userId, *other_user_ids],
+        group_names=[client.groupName, *(group_name for _, _, group_name in neighbours.values())],
+        data=ClientPublic.model_validate(client).model_dump(mode="json"),
+    )
     session.commit()
     session.refresh(client)
-
-    with session.no_autoflush:  # Use no_autoflush to prevent premature flushing
-        # Process otherRelations
-        if len(client_in.otherRelations) > 0 and client_in.otherRelations[0] != "":
-            for userId in client_in.otherRelations:
-                # Check if the toClientId exists in the clients table using a database query
-                existing_client = session.execute(
-                    sa_select(Clients).where(Clients.userId == userId)
-                ).scalar_one_or_none()
-
-                if not existing_client:
-                    session.rollback()  # Rollback the transaction if the userId does not exist
-                    raise HTTPException(status_code=400, detail=f"Client with id {userId} does not exist")
-
-                relation = Relations(fromClientId=client.userId, toClientId=userId)
-                session.add(relation)
-
-    session.commit()
     return client
 
 
-
 @router.post("/file")
-async def create_clients_from_file(*, group_name: str, session: SessionDep, current_user: CurrentUser,
+async def create_clients_from_file(*, group_name: str, session: SessionDep, current_user: CurrentClaims,
                                    file: UploadFile = File(...)) -> Any:
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Only .csv files are allowed")
@@ -144,22 +208,29 @@ async def create_clients_from_file(*, group_name: str, session: SessionDep, curr
             session.commit()
             session.refresh(client)
 
-            other_relations[client.userId] = client_create.otherRelations
+            assert client.id is not None
+            other_relations[client.id] = (client.userId, client_create.otherRelations)
         except IntegrityError:
             session.rollback()
             print(f"Client with userId {client.userId} already exists. Skipping this entry.")
             continue
 
     # Process otherRelations
-    for from_client_id, relations in other_relations.items():
+    for from_client_pk, (from_client_id, relations) in other_relations.items():
         for to_client_id in relations:
             try:
                 # Check if the toClientId exists in the clients table using a database query
                 existing_client = session.query(Clients).filter_by(userId=to_client_id).first()
 
                 if existing_client:
-                    relation = Relations(fromClientId=from_client_id, toClientId=existing_client.userId)
+                    relation = Relations(
+                        fromClientId=from_client_id,
+                        toClientId=existing_client.userId,
+                        from_client_pk=from_client_pk,
+                        to_client_pk=existing_client.id,
+                    )
                     session.add(relation)
+                    merge_components(session, from_client_pk, existing_client.id)
                     session.commit()
                     session.refresh(relation)
             except DataError as e:
@@ -171,15 +242,170 @@ async def create_clients_from_file(*, group_name: str, session: SessionDep, curr
                 print(f"Unexpected error: {e}")
                 session.rollback()
 
+    # Imported clients are still unlabelled, label them together with everything they touched
+    refresh_components(session)
+    # A single event for the whole import, subscribers refetch the group
+    notify_change(session, "clients", "import", group_names=[group_name])
+    session.commit()
+
     return {"message": "Clients and relations created successfully"}
 
 
+@router.get("/components", response_model=ClientComponentsPublic)
+def get_client_components(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+    """
+    Retrieve connected components of the client graph, largest first.
+    """
+    data, count = get_components(session, skip=skip, limit=limit)
+    return ClientComponentsPublic(data=data, count=count)
+
+
+def _build_group_graph(
+    session: SessionDep,
+    group_name: str,
+    version: int,
+    skip: int,
+    limit: int,
+    include_external: bool,
+    node_fields: FieldSet,
+) -> GroupGraph:
+    in_group = Clients.groupName == group_name
+    count = session.exec(select(func.count()).select_from(Clients).where(in_group)).one()
+    members = session.exec(
+        select(Clients.id, *(getattr(Clients, name) for name in node_fields))
+        .where(in_group)
+        .order_by(col(Clients.id))
+        .offset(skip)
+        .limit(limit)
+    ).all()
+
+    builder = GraphBuilder(node_fields)
+    for member_pk, *values in members:
+        builder.add_node(member_pk, values)
+
+    member_pks = [member_pk for member_pk, *_ in members]
+    if member_pks:
+        group_pks = select(Clients.id).where(in_group)
+        from_page = col(RelationsListing.from_client_pk).in_(member_pks)
+        # Every relation is listed on one page only: the page of its from
+        # side, or of its to side when the from side is outside the group
+        if include_external:
+            to_page = col(RelationsListing.to_client_pk).in_(member_pks)
+            condition = from_page | (to_page & col(RelationsListing.from_client_pk).not_in(group_pks))
+        else:
+            condition = from_page & col(RelationsListing.to_client_pk).in_(group_pks)
+        relations = session.exec(
+            select(RelationsListing)
+            .where(condition)
+            .order_by(col(RelationsListing.id))
+            .options(relation_columns(node_fields))
+        ).all()
+        builder.add_relations(relations, depth=1)
+
+    return GroupGraph(
+        nodes=builder.nodes, edges=builder.edges, count=count, version=version, members=len(members)
+    )
+
+
+@router.get("/groups/{group_name}/graph", response_model=GroupGraph, responses=GRAPH_RESPONSES)
+@query_budget(4)
+def get_group_graph(
+    group_name: str,
+    session: SessionDep,
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    include_external: bool = False,
+    fields: Annotated[str | None, fields_query(GraphNodes)] = None,
+) -> Any:
+    """
+    Retrieve the graph of an import batch (groupName): a page of its members
+    and the relations among them, or with include_external also the relations
+    to clients outside the group. count is the total number of members.
+    fields restricts the node columns.
+    """
+    node_fields = parse_fields(fields, GraphNodes) or NODE_FIELDS
+    version = session.exec(select(ClientGroup.version).where(ClientGroup.name == group_name)).first()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+
+    media_type = graph_media_type(request)
+    cache_key = (group_name, version, skip, limit, include_external, node_fields, media_type)
+    body = group_graph_cache.get(cache_key)
+    if body is None:
+        graph = _build_group_graph(session, group_name, version, skip, limit, include_external, node_fields)
+        body = PrecompressedBody(encode_graph(graph, media_type, node_fields), media_type)
+        group_graph_cache.put(cache_key, body)
+    return body.response(request, vary="Accept")
+
+
+@router.get("/next", response_model=ClientsNextPublic)
+@query_budget(1)
+def get_next_clients(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+    """
+    Retrieve the clients not reached yet, the ones to reach next first.
+
+    Ranked by the precomputed nextScore (see app.models.NEXT_SCORE), read
+    from a partial index in score order.
+    """
+    statement = (
+        select(Clients)
+        .where(col(Clients.nextScore).is_not(None))
+        .order_by(col(Clients.nextScore).desc(), col(Clients.id))
+        .offset(skip)
+        .limit(limit)
+    )
+    return ClientsNextPublic(data=session.exec(statement).all())
+
+
+# get many clients by userId and/or id
+@router.post("/batch", response_model=ClientsBatchPublic)
+@query_budget(1)
+def get_clients_batch(session: SessionDep, lookup: ClientsBatchLookup) -> Any:
+    """
+    Retrieve many clients at once, by userId and/or id. Ids that match no
+    client are listed in missingUserIds and missingIds.
+    """
+    user_ids = list(dict.fromkeys(lookup.userIds))
+    ids = list(dict.fromkeys(lookup.ids))
+    clients: list[ClientPublic] = []
+    if user_ids or ids:
+        rows = session.exec(
+            select(Clients).where(
+                (col(Clients.userId) == any_(bindparam("user_ids", user_ids, type_=ARRAY(String))))
+                | (col(Clients.id) == any_(bindparam("ids", ids, type_=ARRAY(Integer))))
+            )
+        ).all()
+        clients = [ClientPublic.model_validate(row) for row in rows]
+
+    found_user_ids = {client.userId: client for client in clients}
+    found_ids = {client.id: client for client in clients}
+    return ClientsBatchPublic(
+        byUserId={user_id: found_user_ids[user_id] for user_id in user_ids if user_id in found_user_ids},
+        byId={client_pk: found_ids[client_pk] for client_pk in ids if client_pk in found_ids},
+        missingUserIds=[user_id for user_id in user_ids if user_id not in found_user_ids],
+        missingIds=[client_pk for client_pk in ids if client_pk not in found_ids],
+    )
+
+
 # get client by id
 @router.get("/{client_id}", response_model=ClientPublic)
-def get_client_by_id(client_id: str, session: SessionDep) -> Any:
+@query_budget(1)
+def get_client_by_id(
+    client_id: str, session: SessionDep, fields: Annotated[str | None, fields_query(ClientPublic)] = None
+) -> Any:
     """
     Retrieve client by id.
     """
+    field_set = parse_fields(fields, ClientPublic)
+    if field_set is not None:
+        row = session.connection().execute(
+            select(*(getattr(Clients, name) for name in field_set)).where(Clients.userId == client_id)
+        ).mappings().first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Client not found")
+        return sparse_response(sparse_model(ClientPublic, field_set), dict(row))
+
     statement = select(Clients).where(Clients.userId == client_id)
     client = session.exec(statement).first()
     if not client:
@@ -190,13 +416,14 @@ def get_client_by_id(client_id: str, session: SessionDep) -> Any:
 # get client by id
 @router.patch("/{client_id}", response_model=ClientPublic)
 def patch_client(client_id: int, client_update: ClientUpdate, session: SessionDep,
-                 current_user: CurrentUser) -> Any:
+                 current_user: CurrentClaims) -> Any:
     print(client_update)
     # Fetch the client
     client = session.query(Clients).filter(Clients.id == client_id).first()
 
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
+    old_group_name = client.groupName
 
     # Update the client fields
     for var, value in vars(client_update).items():
@@ -205,6 +432,16 @@ def patch_client(client_id: int, client_update: ClientUpdate, session: SessionDe
 
     # Commit the changes
     session.add(client)
+    session.flush()
+    notify_change(
+        session,
+        "clients",
+        "update",
+        id=client.id,
+        client_ids=[client.userId],
+        group_names=[old_group_name, client.groupName],
+        data=ClientPublic.model_validate(client).model_dump(mode="json"),
+    )
     session.commit()
     session.refresh(client)
 
@@ -212,125 +449,211 @@ def patch_client(client_id: int, client_update: ClientUpdate, session: SessionDe
 
 
 @router.delete("/{client_id}")
-def delete_client(client_id: int, session: SessionDep, current_user: CurrentUser) -> None:
-    statement = delete(Clients).where(Clients.id == client_id).returning(Clients.id)
-    result = session.exec(statement).scalar_one_or_none()
+def delete_client(client_id: int, session: SessionDep, current_user: CurrentClaims) -> None:
+    statement = delete(Clients).where(Clients.id == client_id).returning(
+        col(Clients.id), col(Clients.componentId), col(Clients.userId), col(Clients.groupName)
+    )
+    result = session.execute(statement).one_or_none()
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Client with id {client_id} not found"
         )
+    # Removing a client can split its component
+    invalidate_components(session, [result.componentId])
+    notify_change(
+        session, "clients", "delete", id=client_id, client_ids=[result.userId], group_names=[result.groupName]
+    )
     session.commit()
     return None
 
 
+def _client_neighbourhood(
+    session: SessionDep,
+    client_pk: int,
+    skip: int,
+    limit: int,
+    columns: LoaderOption | None = None,
+    second_hop: bool = True,
+) -> tuple[int, list[RelationsListing], list[RelationsListing]]:
+    """
+    Number of relations of a client, one page of them and all the relations of
+    the neighbours on that page (the second hop), in at most three queries.
+    ``columns`` restricts the relation columns loaded, without ``second_hop``
+    the relations of the neighbours are not loaded.
+    """
+    touches_client = (RelationsListing.from_client_pk == client_pk) | (RelationsListing.to_client_pk == client_pk)
+
+    # Count total relations for the client
+    count_statement = select(func.count()).select_from(RelationsListing).where(touches_client)
+    count = session.exec(count_statement).one()
+
+    if count == 0:
+        return 0, [], []
+
+    relations_statement = (
+        select(RelationsListing)
+        .where(touches_client)
+        .order_by(col(RelationsListing.id))
+        .offset(skip)
+        .limit(limit)
+    )
+    if columns is not None:
+        relations_statement = relations_statement.options(columns)
+    relations = list(session.exec(relations_statement).all())
+    if not second_hop:
+        return count, relations, []
+
+    # Fetch relations of relations (2 levels deep) for all neighbours in one query
+    neighbour_pks = {
+        relation.from_client_pk if relation.to_client_pk == client_pk else relation.to_client_pk
+        for relation in relations
+    }
+    inner_relations_statement = (
+        select(RelationsListing)
+        .where(
+            col(RelationsListing.from_client_pk).in_(neighbour_pks)
+            | col(RelationsListing.to_client_pk).in_(neighbour_pks)
+        )
+        .order_by(col(RelationsListing.id))
+    )
+    if columns is not None:
+        inner_relations_statement = inner_relations_statement.options(columns)
+    inner_relations = list(session.exec(inner_relations_statement).all())
+    return count, relations, inner_relations
+
+
 @router.get("/{client_id}/relations", response_model=RelationsPublic | Clients)
-def get_client_relations(client_id: str, session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+@query_budget(4)
+def get_client_relations(
+    client_id: str,
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Annotated[str | None, fields_query(RelationPublic)] = None,
+) -> Any:
     """
     Retrieve relations associated with a client, including client data.
+    fields restricts the attributes of the relations on the page, whose own
+    relations are only loaded when one of them is relations.
     """
-    from_client = aliased(Clients)
-    to_client = aliased(Clients)
-    inner_from_client = aliased(Clients)
-    inner_to_client = aliased(Clients)
-
+    field_set = parse_fields(fields, RelationPublic)
+    flat_fields = None if field_set is None or "relations" in field_set else field_set
     # Query the client to check if it exists
     client = session.exec(select(Clients).where(Clients.userId == client_id)).first()
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    # Count total relations for the client
-    count_statement = (
-        select(func.count())
-        .where((Relations.fromClientId == client_id) | (Relations.toClientId == client_id))
+    # The API takes the userId, the graph is walked on the integer keys
+    client_pk = client.id
+    assert client_pk is not None
+    columns = None
+    if flat_fields is not None:
+        columns = load_only(*(getattr(RelationsListing, name) for name in flat_fields))
+    count, relations, inner_relations = _client_neighbourhood(
+        session, client_pk, skip, limit, columns, second_hop=flat_fields is None
     )
-    count = session.exec(count_statement).one()
-
-    print("************")
-    print(count)
-    print(client)
 
     if count == 0:
         return client
 
-    # Query relations with client data for both source and target clients
-    # relations_statement = (
-    #     select(
-    #         Relations,
-    #         from_client.name.label("from_client_name"),
-    #         to_client.name.label("to_client_name"),
-    #     )
-    #     .join(from_client, Relations.fromClientId == from_client.userId)
-    #     .join(to_client, Relations.toClientId == to_client.userId)
-    #     .where((Relations.fromClientId == client_id) | (Relations.toClientId == client_id))
-    #     .offset(skip)
-    #     .limit(limit)
-    # )
-        # Query relations with client data for both source and target clients
-    relations_statement = (
-        select(
-            Relations,
-            from_client.name.label("from_client_name"),
-            from_client.instagram.label("fromClientInstagram"),
-            to_client.name.label("to_client_name"),
-            to_client.instagram.label("toClientInstagram"),
-        )
-        .join(from_client, Relations.fromClientId == from_client.userId)
-        .join(to_client, Relations.toClientId == to_client.userId)
-        .where((Relations.fromClientId == client_id) | (Relations.toClientId == client_id))
-        .offset(skip)
-        .limit(limit)
-    )
-    relations = session.exec(relations_statement).all()
+    inner_by_client: dict[int, list[dict[str, Any]]] = defaultdict(list)
+    for inner_relation in inner_relations:
+        inner_relation_dict = inner_relation.model_dump()
+        inner_by_client[inner_relation.from_client_pk].append(inner_relation_dict)
+        if inner_relation.to_client_pk != inner_relation.from_client_pk:
+            inner_by_client[inner_relation.to_client_pk].append(inner_relation_dict)
 
     # Create a list of dictionaries with the expected format
     data = []
-    for relation, from_client_name, from_client_instagram, to_client_name, to_client_instagram in relations:
-        relation_dict = relation.dict()
-        relation_dict["from_client_name"] = from_client_name
-        relation_dict["to_client_name"] = to_client_name
-        relation_dict["fromClientInstagram"] = from_client_instagram
-        relation_dict["toClientInstagram"] = to_client_instagram
-
-        inner_id = 0
-        if relation.toClientId == client_id:
-            inner_id=relation.fromClientId
+    for relation in relations:
+        if flat_fields is not None:
+            data.append({name: getattr(relation, name) for name in flat_fields})
+            continue
+        relation_dict = relation.model_dump()
+        if relation.to_client_pk == client_pk:
+            inner_pk = relation.from_client_pk
         else:
-            inner_id=relation.toClientId
-        # Fetch relations of relations (2 levels deep)
-        inner_relations_statement = (
-            select(
-                Relations,
-                inner_from_client.name.label("from_client_name"),
-                inner_from_client.instagram.label("fromClientInstagram"),
-                inner_to_client.instagram.label("toClientInstagram"),
-                inner_to_client.name.label("to_client_name"),
-            )
-            .join(inner_from_client, Relations.fromClientId == inner_from_client.userId)
-            .join(inner_to_client, Relations.toClientId == inner_to_client.userId)
-            .where(
-                (Relations.fromClientId == inner_id)
-                | (Relations.toClientId == inner_id)
-            )
-            .where(
-                Relations.id != relation.id  # Make sure not to include the parent relation itself
-            )
-        )
+            inner_pk = relation.to_client_pk
+        # Make sure not to include the parent relation itself
+        relation_dict["relations"] = [
+            inner for inner in inner_by_client[inner_pk] if inner["id"] != relation.id
+        ]
+        data.append(relation_dict)
 
-        inner_relations = session.exec(inner_relations_statement).all()
+    if field_set is not None:
+        return sparse_response(sparse_page_model(RelationPublic, field_set), {"data": data, "count": count})
+    return RelationsPublic(data=data, count=count)
 
-        inner_data = []
-        for inner_relation, inner_from_client_name, inner_from_client_instagram, inner_to_client_instagram, inner_to_client_name in inner_relations:
-            inner_relation_dict = inner_relation.dict()
-            inner_relation_dict["from_client_name"] = inner_from_client_name
-            inner_relation_dict["to_client_name"] = inner_to_client_name
-            inner_relation_dict["fromClientInstagram"] = inner_from_client_instagram
-            inner_relation_dict["toClientInstagram"] = inner_to_client_instagram
-            inner_data.append(inner_relation_dict)
 
-        relation_dict["relations"] = inner_data
+@router.get("/{client_id}/graph", response_model=ClientGraph, responses=GRAPH_RESPONSES)
+@query_budget(4)
+def get_client_graph(
+    client_id: str,
+    session: SessionDep,
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Annotated[str | None, fields_query(GraphNodes)] = None,
+) -> Any:
+    """
+    Retrieve the same neighbourhood as the relations endpoint as a compact
+    graph: a node table (the client first) and edges indexing into it.
+    fields restricts the node columns.
+    """
+    node_fields = parse_fields(fields, GraphNodes) or NODE_FIELDS
+    client = session.exec(select(Clients).where(Clients.userId == client_id)).first()
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+    assert client.id is not None
 
-        data.append(relation_dict)
+    count, relations, inner_relations = _client_neighbourhood(
+        session, client.id, skip, limit, relation_columns(node_fields)
+    )
 
-    logger.info(f"data: {data}")
-    return RelationsPublic(data=data, count=count)
+    builder = GraphBuilder(node_fields)
+    builder.add_node(client.id, [getattr(client, name) for name in node_fields])
+    builder.add_relations(relations, depth=1)
+    builder.add_relations(inner_relations, depth=2)
+    return graph_response(request, builder.build(count), node_fields)
+
+
+@router.get("/{client_id}/introductions", response_model=IntroductionsPublic)
+@query_budget(MAX_INTRODUCTION_DEPTH + 2)
+def get_client_introductions(
+    client_id: str,
+    session: SessionDep,
+    k: Annotated[int, Query(ge=1, le=100)] = 5,
+    max_depth: Annotated[int, Query(ge=1, le=MAX_INTRODUCTION_DEPTH)] = 3,
+) -> Any:
+    """
+    Retrieve the k cheapest chains of relations from reached clients to a
+    client, each at most max_depth relations long, cheapest first. 422 when
+    there are too many relations within max_depth to search.
+    """
+    client = session.exec(select(Clients).where(Clients.userId == client_id)).first()
+    if not client:
+        raise HTTPException(status_code=404, detail="Client not found")
+
+    assert client.id is not None
+    try:
+        neighbourhood = load_neighbourhood(session, client, max_depth, settings.INTRODUCTION_MAX_RELATIONS)
+    except NeighbourhoodTooLarge:
+        raise HTTPException(
+            status_code=422, detail=f"Too many relations within {max_depth} hops, try a lower max_depth"
+        )
+    chains = find_introductions(neighbourhood, client.id, k, max_depth)
+
+    # All clients on the chains in one query
+    clients_by_pk: dict[int | None, Clients] = {}
+    chain_pks = {client_pk for _cost, chain in chains for client_pk in chain}
+    if chain_pks:
+        chain_clients = session.exec(select(Clients).where(col(Clients.id).in_(chain_pks))).all()
+        clients_by_pk = {chain_client.id: chain_client for chain_client in chain_clients}
+    data = [
+        IntroductionChain(
+            cost=cost, clients=[ClientPublic.model_validate(clients_by_pk[client_pk]) for client_pk in chain]
+        )
+        for cost, chain in chains
+    ]
+    return IntroductionsPublic(data=data, count=len(data))
@@ -3,15 +3,23 @@ from typing import Any
 from fastapi import APIRouter, HTTPException
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
+from app.api.deps import (
+    CurrentClaims,
+    ReadSessionDep,
+    SessionDep,
+    SessionReleasingRoute,
+)
 from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get("/", response_model=ItemsPublic)
 def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+    session: ReadSessionDep,
+    current_user: CurrentClaims,
+    skip: int = 0,
+    limit: int = 100,
 ) -> Any:
     """
     Retrieve items.
@@ -41,7 +49,7 @@ def read_items(
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_item(session: SessionDep, current_user: CurrentClaims, id: int) -> Any:
     """
     Get item by ID.
     """
@@ -55,7 +63,7 @@ def read_item(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
 
 @router.post("/", response_model=ItemPublic)
 def create_item(
-    *, session: SessionDep, current_user: CurrentUser, item_in: ItemCreate
+    *, session: SessionDep, current_user: CurrentClaims, item_in: ItemCreate
 ) -> Any:
     """
     Create new item.
@@ -69,7 +77,7 @@ def create_item(
 
 @router.put("/{id}", response_model=ItemPublic)
 def update_item(
-    *, session: SessionDep, current_user: CurrentUser, id: int, item_in: ItemUpdate
+    *, session: SessionDep, current_user: CurrentClaims, id: int, item_in: ItemUpdate
 ) -> Any:
     """
     Update an item.
@@ -88,7 +96,7 @@ def update_item(
 
 
 @router.delete("/{id}")
-def delete_item(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_item(session: SessionDep, current_user: CurrentClaims, id: int) -> Message:
     """
     Delete an item.
     """
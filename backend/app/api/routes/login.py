@@ -1,46 +1,158 @@
+import ipaddress
+import math
 from datetime import timedelta
 from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    CurrentUser,
+    SessionDep,
+    SessionReleasingRoute,
+    decode_token,
+    get_current_active_superuser,
+    load_active_user,
+)
 from app.core import security
 from app.core.config import settings
-from app.core.security import get_password_hash
-from app.models import Message, NewPassword, Token, UserPublic
+from app.core.rate_limit import get_login_limiter
+from app.core.revocations import CLAIMED_FIELDS
+from app.core.security import get_password_hash_async
+from app.email_queue import enqueue_email
+from app.models import Message, NewPassword, Token, TokenRefresh, User, UserPublic
 from app.utils import (
     generate_password_reset_token,
     generate_reset_password_email,
-    send_email,
     verify_password_reset_token,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
+
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host.strip())
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(proxy, strict=False)
+        for proxy in settings.TRUSTED_PROXY_IPS
+    )
+
+
+def client_ip(request: Request) -> str:
+    """
+    The IP of the client, taken from X-Forwarded-For when the request comes
+    from a trusted proxy.
+
+    Each proxy appends the address it got the request from, the client is the
+    last one not added by a trusted proxy, the ones before it can be forged.
+    """
+    host = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(host):
+        return host
+    forwarded = ",".join(request.headers.getlist("x-forwarded-for")).split(",")
+    for address in reversed([address.strip() for address in forwarded]):
+        if address and not is_trusted_proxy(address):
+            return address
+        host = address or host
+    return host
+
+
+def throttle_login(request: Request, username: str) -> list[str]:
+    """
+    Record a login attempt per client IP and username, or reject it with 429.
+
+    Returns the throttle keys, so a successful login can give its attempt back.
+    """
+    if not settings.LOGIN_RATE_LIMIT_ENABLED:
+        return []
+    limiter = get_login_limiter()
+    window = settings.LOGIN_RATE_LIMIT_WINDOW_SECONDS
+    limits = {
+        f"ip:{client_ip(request)}": settings.LOGIN_RATE_LIMIT_PER_IP,
+        f"user:{username.lower()}": settings.LOGIN_RATE_LIMIT_PER_USERNAME,
+    }
+    recorded: list[str] = []
+    for key, limit in limits.items():
+        retry_after = limiter.hit(key, limit, window)
+        if retry_after:
+            for recorded_key in recorded:
+                limiter.undo(recorded_key)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        recorded.append(key)
+    return recorded
+
+
+def create_tokens(user: User) -> Token:
+    if not settings.ACCESS_TOKEN_CLAIMS:
+        access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+        return Token(
+            access_token=security.create_access_token(
+                user.id, expires_delta=access_token_expires
+            )
+        )
+    claims = {name: getattr(user, name) for name in CLAIMED_FIELDS}
+    return Token(
+        access_token=security.create_access_token(
+            user.id,
+            expires_delta=timedelta(
+                minutes=settings.ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES
+            ),
+            claims=claims,
+        ),
+        refresh_token=security.create_refresh_token(
+            user.id,
+            expires_delta=timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+        ),
+    )
+
+
+# Endpoints hashing passwords are async, see app.core.security. Their database
+# (and rate limiter) calls go to the threadpool to keep the event loop free
 
 
 @router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+async def login_access_token(
+    request: Request,
+    session: SessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
+    throttle_keys = await run_in_threadpool(throttle_login, request, form_data.username)
+    user = await crud.authenticate_async(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    elif not user.is_active:
+    # Only failed attempts count towards the limits
+    limiter = get_login_limiter()
+    for key in throttle_keys:
+        await run_in_threadpool(limiter.undo, key)
+    if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    return Token(
-        access_token=security.create_access_token(
-            user.id, expires_delta=access_token_expires
-        )
+    return create_tokens(user)
+
+
+@router.post("/login/refresh-token")
+def refresh_token(session: SessionDep, body: TokenRefresh) -> Token:
+    """
+    Get new access and refresh tokens for a refresh token
+    """
+    user = load_active_user(
+        session, decode_token(body.refresh_token, security.REFRESH_TOKEN_TYPE)
     )
+    return create_tokens(user)
 
 
 @router.post("/login/test-token", response_model=UserPublic)
@@ -67,7 +179,8 @@ def recover_password(email: str, session: SessionDep) -> Message:
     email_data = generate_reset_password_email(
         email_to=user.email, email=email, token=password_reset_token
     )
-    send_email(
+    enqueue_email(
+        session=session,
         email_to=user.email,
         subject=email_data.subject,
         html_content=email_data.html_content,
@@ -76,14 +189,14 @@ def recover_password(email: str, session: SessionDep) -> Message:
 
 
 @router.post("/reset-password/")
-def reset_password(session: SessionDep, body: NewPassword) -> Message:
+async def reset_password(session: SessionDep, body: NewPassword) -> Message:
     """
     Reset password
     """
     email = verify_password_reset_token(token=body.token)
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token")
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await run_in_threadpool(crud.get_user_by_email, session=session, email=email)
     if not user:
         raise HTTPException(
             status_code=404,
@@ -91,10 +204,13 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
-    user.hashed_password = hashed_password
-    session.add(user)
-    session.commit()
+    hashed_password = await get_password_hash_async(password=body.new_password)
+    await run_in_threadpool(
+        crud.update_password_hash,
+        session=session,
+        db_user=user,
+        hashed_password=hashed_password,
+    )
     return Message(message="Password updated successfully")
 
 
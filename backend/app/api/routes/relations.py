@@ -1,59 +1,75 @@
-from typing import Any
+from typing import Annotated, Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlmodel import select, func
+from sqlmodel import col, select, func
 from sqlalchemy import delete
-from sqlalchemy.orm import aliased
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Relations, RelationsCreate, RelationsPublic, Clients
+from app.api.deps import (
+    CurrentClaims,
+    ReadSessionDep,
+    SessionDep,
+    SessionReleasingRoute,
+    get_current_claims,
+)
+from app.change_feed import notify_change
+from app.fieldsets import fields_query, parse_fields, sparse_page_model, sparse_response
+from app.graph import invalidate_components, merge_components
+from app.models import (
+    Clients,
+    RelationPublic,
+    Relations,
+    RelationsCreate,
+    RelationsListing,
+    RelationsPublic,
+)
+from app.query_stats import query_budget
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get("/", response_model=RelationsPublic)
-def get_relations(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+@query_budget(2)
+def get_relations(
+    session: ReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Annotated[str | None, fields_query(RelationPublic)] = None,
+) -> Any:
     """
     Retrieve relations with client names.
     """
-    from_client = aliased(Clients)
-    to_client = aliased(Clients)
-
-    count_statement = select(func.count()).select_from(Relations)
+    field_set = parse_fields(fields, RelationPublic)
+    count_statement = select(func.count()).select_from(RelationsListing)
     count = session.exec(count_statement).one()
 
-    statement = (
-        select(
-            Relations,
-            from_client.name.label("from_client_name"),
-            to_client.name.label("to_client_name"),
+    if field_set is not None:
+        # Listed on their own, relations have no relations of their own
+        columns = [name for name in field_set if name != "relations"] or ["id"]
+        rows = session.connection().execute(
+            select(*(getattr(RelationsListing, name) for name in columns))
+            .order_by(col(RelationsListing.id))
+            .offset(skip)
+            .limit(limit)
+        ).mappings()
+        data = [{**row, "relations": []} for row in rows]
+        return sparse_response(
+            sparse_page_model(RelationPublic, field_set), {"data": data, "count": count}
         )
-        .join(from_client, Relations.fromClientId == from_client.userId)
-        .join(to_client, Relations.toClientId == to_client.userId)
+
+    statement = (
+        select(RelationsListing)
+        .order_by(col(RelationsListing.id))
         .offset(skip)
         .limit(limit)
     )
     relations = session.exec(statement).all()
-    # logger.info(relations)
-    # Create a list of dictionaries with the expected format
-    data = [
-        {
-            "id": relation.id,
-            "fromClientId": relation.fromClientId,
-            "toClientId": relation.toClientId,
-            "status": relation.status,
-            "from_client_name": from_client_name,
-            "to_client_name": to_client_name,
-        }
-        for relation, from_client_name, to_client_name in relations
-    ]
+    data = [relation.model_dump() for relation in relations]
     return RelationsPublic(data=data, count=count)
 
 
-@router.post("/", response_model=Relations)
+@router.post("/", dependencies=[Depends(get_current_claims)], response_model=Relations)
 def create_relation(
         *,
         session: SessionDep,
-        current_user: CurrentUser,
         relation_in: RelationsCreate
 ) -> Any:
     """
@@ -68,8 +84,24 @@ def create_relation(
     ).scalar_one_or_none()
     print(from_client, to_client)
     if from_client is not None and to_client is not None:
-        relation = Relations(fromClientId=from_client.userId, toClientId=to_client.userId, owner_id=current_user.id)
+        relation = Relations(
+            fromClientId=from_client.userId,
+            toClientId=to_client.userId,
+            from_client_pk=from_client.id,
+            to_client_pk=to_client.id,
+        )
         session.add(relation)
+        merge_components(session, from_client.id, to_client.id)
+        session.flush()
+        notify_change(
+            session,
+            "relations",
+            "create",
+            id=relation.id,
+            client_ids=[from_client.userId, to_client.userId],
+            group_names=[from_client.groupName, to_client.groupName],
+            data=relation.model_dump(mode="json"),
+        )
         session.commit()
         session.refresh(relation)
         return relation
@@ -78,13 +110,33 @@ def create_relation(
 
 
 @router.delete("/{relation_id}")
-def delete_relation(relation_id: int, session: SessionDep, current_user: CurrentUser) -> None:
-    statement = delete(Relations).where(Relations.id == relation_id).returning(Relations.id)
-    result = session.exec(statement).scalar_one_or_none()
-    if not result:
+def delete_relation(relation_id: int, session: SessionDep, current_user: CurrentClaims) -> None:
+    statement = delete(Relations).where(Relations.id == relation_id).returning(
+        col(Relations.from_client_pk),
+        col(Relations.to_client_pk),
+        col(Relations.fromClientId),
+        col(Relations.toClientId),
+    )
+    result = session.execute(statement).one_or_none()
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Relation with id {relation_id} not found"
         )
+    # Removing an edge can split the component, relabel it lazily
+    ends = session.exec(
+        select(Clients.componentId, Clients.groupName).where(
+            col(Clients.id).in_([result.from_client_pk, result.to_client_pk])
+        )
+    ).all()
+    invalidate_components(session, [component_id for component_id, _ in ends])
+    notify_change(
+        session,
+        "relations",
+        "delete",
+        id=relation_id,
+        client_ids=[result.fromClientId, result.toClientId],
+        group_names=[group_name for _, group_name in ends],
+    )
     session.commit()
     return None
@@ -1,16 +1,21 @@
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import col, delete, func, select
 
 from app import crud
 from app.api.deps import (
     CurrentUser,
+    ReadSessionDep,
     SessionDep,
+    SessionReleasingRoute,
     get_current_active_superuser,
 )
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.revocations import claims_changed, revoke_tokens
+from app.core.security import get_password_hash_async, verify_password_async
+from app.email_queue import enqueue_email
 from app.models import (
     Item,
     Message,
@@ -23,9 +28,9 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
+from app.utils import generate_new_account_email
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.get(
@@ -33,7 +38,7 @@ router = APIRouter()
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(session: ReadSessionDep, skip: int = 0, limit: int = 100) -> Any:
     """
     Retrieve users.
     """
@@ -66,11 +71,14 @@ def create_user(*, session: SessionDep, user_in: UserCreate) -> Any:
         email_data = generate_new_account_email(
             email_to=user_in.email, username=user_in.email, password=user_in.password
         )
-        send_email(
+        enqueue_email(
+            session=session,
             email_to=user_in.email,
             subject=email_data.subject,
             html_content=email_data.html_content,
         )
+        # Committing the outbox row expired the user
+        session.refresh(user)
     return user
 
 
@@ -89,6 +97,8 @@ def update_user_me(
                 status_code=409, detail="User with this email already exists"
             )
     user_data = user_in.model_dump(exclude_unset=True)
+    if claims_changed(current_user, user_data):
+        revoke_tokens(session, current_user.id)  # type: ignore[arg-type]
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
@@ -97,22 +107,28 @@ def update_user_me(
 
 
 @router.patch("/me/password", response_model=Message)
-def update_password_me(
+async def update_password_me(
     *, session: SessionDep, body: UpdatePassword, current_user: CurrentUser
 ) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    if not await verify_password_async(
+        body.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(
             status_code=400, detail="New password cannot be the same as the current one"
         )
-    hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    session.add(current_user)
-    session.commit()
+    hashed_password = await get_password_hash_async(body.new_password)
+    # The database calls of async endpoints go to the threadpool
+    await run_in_threadpool(
+        crud.update_password_hash,
+        session=session,
+        db_user=current_user,
+        hashed_password=hashed_password,
+    )
     return Message(message="Password updated successfully")
 
 
@@ -191,6 +207,8 @@ def update_user(
                 status_code=409, detail="User with this email already exists"
             )
 
+    if claims_changed(db_user, user_in.model_dump(exclude_unset=True)):
+        revoke_tokens(session, user_id)
     db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
     return db_user
 
@@ -217,5 +235,6 @@ def delete_user(
     statement = delete(Item).where(col(Item.owner_id) == user_id)
     session.exec(statement)  # type: ignore
     session.delete(user)
+    revoke_tokens(session, user_id)
     session.commit()
     return Message(message="User deleted successfully")
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
-from app.utils import generate_test_email, send_email
+from app.api.deps import SessionDep, SessionReleasingRoute, get_current_active_superuser
+from app.email_queue import enqueue_email
+from app.models import Message, SlowQueriesPublic
+from app.slow_queries import slow_query_log
+from app.utils import generate_test_email
 
-router = APIRouter()
+router = APIRouter(route_class=SessionReleasingRoute)
 
 
 @router.post(
@@ -13,14 +15,28 @@ router = APIRouter()
     dependencies=[Depends(get_current_active_superuser)],
     status_code=201,
 )
-def test_email(email_to: EmailStr) -> Message:
+def test_email(email_to: EmailStr, session: SessionDep) -> Message:
     """
     Test emails.
     """
     email_data = generate_test_email(email_to=email_to)
-    send_email(
+    enqueue_email(
+        session=session,
         email_to=email_to,
         subject=email_data.subject,
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+@router.get(
+    "/slow-queries/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=SlowQueriesPublic,
+)
+def get_slow_queries(skip: int = 0, limit: int = 100) -> SlowQueriesPublic:
+    """
+    Recent slow queries of this worker process, newest first.
+    """
+    entries = slow_query_log.entries()
+    return SlowQueriesPublic(data=entries[skip : skip + limit], count=len(entries))
@@ -0,0 +1,3 @@
+from app.benchmarks.run import main
+
+main()
@@ -0,0 +1,253 @@
+"""
+Synthetic client graph generator.
+
+Produces clients and relations shaped like production data: a power-law
+degree distribution (Chung-Lu model over Pareto distributed weights), a few
+hub clients with thousands of relations and clients spread unevenly over
+dozens of groupName values. The graph is either bulk inserted into the
+database or written as CSV files for the ``/clients/file`` import:
+
+    python -m app.benchmarks.generate --clients 100000 --avg-degree 8 --hubs 20 db
+    python -m app.benchmarks.generate --clients 5000 csv --output-dir ./synthetic
+
+The import takes the groupName as a parameter, so there is one CSV file per
+group. Files are numbered and every relation is listed in the later of its
+two clients' files, so importing them in order keeps all relations.
+"""
+import argparse
+import bisect
+import csv
+import itertools
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from sqlmodel import Session
+
+from app.benchmarks.seed import client_row, insert_batches, remove_seeded_data
+from app.core.db import engine
+from app.graph import refresh_components
+from app.models import Clients, Relations
+
+CSV_HEADER = [
+    "instagram",
+    "nickname",
+    "name",
+    "userId",
+    "openForConnections",
+    "isReached",
+    "howHardToReach",
+    "priority",
+    "parameterOne",
+    "parameterTwo",
+    "parameterThree",
+    "otherRelations",
+]
+
+
+@dataclass
+class SyntheticGraph:
+    # userId -> groupName, in creation order
+    groups: dict[str, str] = field(default_factory=dict)
+    edges: list[tuple[str, str]] = field(default_factory=list)
+
+
+def generate_graph(
+    *,
+    clients: int,
+    avg_degree: float = 6.0,
+    exponent: float = 2.3,
+    hubs: int = 0,
+    hub_degree: int = 2_000,
+    groups: int = 30,
+    uniform: bool = False,
+    prefix: str = "synthetic-",
+    seed: int = 0,
+) -> SyntheticGraph:
+    """
+    Generate a simple undirected graph (no self loops, no duplicate edges).
+
+    Degrees follow a power law with the given exponent unless uniform is set,
+    and the first hubs clients get about hub_degree relations each.
+    """
+    rng = random.Random(seed)
+    graph = SyntheticGraph()
+    user_ids = [f"{prefix}{i}" for i in range(clients)]
+    if clients < 2:
+        graph.groups = {user_id: f"{prefix}group-0" for user_id in user_ids}
+        return graph
+
+    # Zipf-like group sizes: a few large import batches and a long tail
+    group_names = [f"{prefix}group-{i}" for i in range(groups)]
+    group_weights = [1 / (rank + 1) for rank in range(groups)]
+    graph.groups = dict(
+        zip(
+            user_ids,
+            rng.choices(group_names, weights=group_weights, k=clients),
+            strict=True,
+        )
+    )
+
+    if uniform:
+        weights = [1.0] * clients
+    else:
+        weights = [rng.paretovariate(exponent - 1) for _ in range(clients)]
+    cum_weights = list(itertools.accumulate(weights))
+    total = cum_weights[-1]
+
+    def pick() -> str:
+        return user_ids[bisect.bisect(cum_weights, rng.random() * total)]
+
+    seen: set[tuple[str, str]] = set()
+
+    def add_edge(a: str, b: str) -> bool:
+        if a == b:
+            return False
+        key = (a, b) if a < b else (b, a)
+        if key in seen:
+            return False
+        seen.add(key)
+        graph.edges.append((a, b))
+        return True
+
+    for hub in user_ids[:hubs]:
+        wanted = min(hub_degree, clients - 1)
+        added = attempts = 0
+        while added < wanted and attempts < wanted * 10:
+            attempts += 1
+            added += add_edge(hub, pick())
+
+    wanted_edges = int(clients * avg_degree / 2)
+    attempts = 0
+    while len(graph.edges) < wanted_edges and attempts < wanted_edges * 10:
+        attempts += 1
+        add_edge(pick(), pick())
+
+    return graph
+
+
+def write_to_database(session: Session, graph: SyntheticGraph, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    insert_batches(
+        session,
+        Clients,
+        [client_row(user_id, rng, group) for user_id, group in graph.groups.items()],
+    )
+    insert_batches(
+        session,
+        Relations,
+        [{"fromClientId": a, "toClientId": b, "status": 1} for a, b in graph.edges],
+    )
+    session.commit()
+    refresh_components(session)
+
+
+def write_csv_files(
+    graph: SyntheticGraph, output_dir: Path, seed: int = 0
+) -> list[Path]:
+    """
+    Write one create_clients_from_file CSV per group, return them in import order.
+    """
+    rng = random.Random(seed)
+    group_order = {
+        group: index
+        for index, group in enumerate(dict.fromkeys(sorted(graph.groups.values())))
+    }
+    position = {user_id: index for index, user_id in enumerate(graph.groups)}
+
+    def import_order(user_id: str) -> tuple[int, int]:
+        return group_order[graph.groups[user_id]], position[user_id]
+
+    other_relations: dict[str, list[str]] = {user_id: [] for user_id in graph.groups}
+    for a, b in graph.edges:
+        later, earlier = (a, b) if import_order(a) > import_order(b) else (b, a)
+        other_relations[later].append(earlier)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = {
+        group: output_dir / f"{index + 1:03d}-{group}.csv"
+        for group, index in group_order.items()
+    }
+    handles = {group: path.open("w", newline="") for group, path in files.items()}
+    try:
+        writers = {group: csv.writer(handle) for group, handle in handles.items()}
+        for writer in writers.values():
+            writer.writerow(CSV_HEADER)
+        for user_id, group in graph.groups.items():
+            row = client_row(user_id, rng, group)
+            open_for_connections = row["openForConnections"]
+            assert isinstance(open_for_connections, int)
+            writers[group].writerow(
+                [
+                    row["instagram"],
+                    row["nickname"],
+                    row["name"],
+                    user_id,
+                    ["NO", "YES", "UNKNOWN"][open_for_connections],
+                    "YES" if row["isReached"] else "NO",
+                    row["howHardToReach"],
+                    row["priority"],
+                    row["parameterOne"],
+                    row["parameterTwo"],
+                    "",
+                    ",".join(other_relations[user_id]),
+                ]
+            )
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return [files[group] for group in group_order]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--avg-degree", type=float, default=6.0)
+    parser.add_argument(
+        "--exponent", type=float, default=2.3, help="power-law exponent of the degrees"
+    )
+    parser.add_argument(
+        "--uniform", action="store_true", help="uniform instead of power-law degrees"
+    )
+    parser.add_argument("--hubs", type=int, default=10)
+    parser.add_argument("--hub-degree", type=int, default=2_000)
+    parser.add_argument("--groups", type=int, default=30)
+    parser.add_argument("--prefix", default="synthetic-", help="userId prefix")
+    parser.add_argument("--seed", type=int, default=0)
+    target = parser.add_subparsers(dest="target", required=True)
+    db = target.add_parser("db", help="bulk insert into the configured database")
+    db.add_argument(
+        "--replace",
+        action="store_true",
+        help="first delete clients previously generated with the same prefix",
+    )
+    csv_target = target.add_parser("csv", help="write CSV files for /clients/file")
+    csv_target.add_argument("--output-dir", type=Path, required=True)
+    args = parser.parse_args()
+
+    graph = generate_graph(
+        clients=args.clients,
+        avg_degree=args.avg_degree,
+        exponent=args.exponent,
+        hubs=args.hubs,
+        hub_degree=args.hub_degree,
+        groups=args.groups,
+        uniform=args.uniform,
+        prefix=args.prefix,
+        seed=args.seed,
+    )
+    print(f"Generated {len(graph.groups)} clients and {len(graph.edges)} relations")
+
+    if args.target == "db":
+        with Session(engine) as session:
+            if args.replace:
+                remove_seeded_data(session, prefix=args.prefix)
+            write_to_database(session, graph, seed=args.seed)
+        print("Inserted into the database")
+    else:
+        files = write_csv_files(graph, args.output_dir, seed=args.seed)
+        print(f"Wrote {len(files)} files to {args.output_dir}, import them in order")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+API benchmark.
+
+Seeds a database with synthetic data, calls the hot endpoints in-process
+through the ASGI app and reports latency percentiles and throughput per
+scenario as JSON, so runs on different commits can be compared:
+
+    python -m app.benchmarks --clients 10000 --relations 50000 --output before.json
+    python -m app.benchmarks --clients 10000 --relations 50000 --baseline before.json
+
+By default it runs against the configured Postgres database (migrated with
+``alembic upgrade head``); seeded rows are removed afterwards. ``--sqlite``
+uses a throwaway SQLite database instead, no server needed. Nothing goes over
+the network: Instagram image downloads are skipped during the benchmark.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from collections.abc import Callable, Generator, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import Engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, create_engine
+
+from app.api.deps import get_db, get_read_db
+from app.benchmarks.seed import (
+    PASSWORD,
+    PREFIX,
+    SeededData,
+    prepare_sqlite,
+    remove_seeded_data,
+    seed_database,
+)
+from app.core.config import settings
+from app.core.db import engine as default_engine
+from app.main import app
+
+Scenario = Callable[[TestClient, int], httpx.Response]
+
+
+def summarize(durations: list[float], errors: int) -> dict[str, float | int]:
+    total = sum(durations)
+    if len(durations) > 1:
+        percentiles = statistics.quantiles(durations, n=100, method="inclusive")
+    else:
+        percentiles = durations * 99
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(durations) * 1000, 3),
+        "p50_ms": round(percentiles[49] * 1000, 3),
+        "p95_ms": round(percentiles[94] * 1000, 3),
+        "p99_ms": round(percentiles[98] * 1000, 3),
+        "max_ms": round(max(durations) * 1000, 3),
+        "requests_per_second": round(len(durations) / total, 2) if total else 0.0,
+    }
+
+
+def measure(
+    client: TestClient, scenario: Scenario, requests: int, warmup: int
+) -> dict[str, float | int]:
+    for i in range(warmup):
+        scenario(client, i)
+    durations = []
+    errors = 0
+    for i in range(requests):
+        start = time.perf_counter()
+        response = scenario(client, warmup + i)
+        durations.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors += 1
+    return summarize(durations, errors)
+
+
+def import_csv(rows: int, batch: int, targets: list[str], rng: random.Random) -> str:
+    lines = [
+        "instagram,nickname,name,userId,openForConnections,isReached,"
+        "howHardToReach,priority,parameterOne,parameterTwo,parameterThree,otherRelations"
+    ]
+    for i in range(rows):
+        user_id = f"{PREFIX}import-{batch}-{i}"
+        relations = ",".join(rng.sample(targets, min(3, len(targets))))
+        lines.append(
+            f'default.png,{user_id},Imported {user_id},{user_id},YES,NO,3,1,,,,"{relations}"'
+        )
+    return "\n".join(lines) + "\n"
+
+
+def build_scenarios(
+    seeded: SeededData, auth_headers: dict[str, str], import_rows: int, seed: int
+) -> dict[str, Scenario]:
+    api = settings.API_V1_STR
+    rng = random.Random(seed)
+    clients = seeded.client_user_ids
+    page_count = max(len(clients) // 100, 1)
+    relation_pages = max(seeded.relations // 100, 1)
+
+    def get_clients(client: TestClient, _i: int) -> httpx.Response:
+        skip = rng.randrange(page_count) * 100
+        return client.get(f"{api}/clients/", params={"skip": skip, "limit": 100})
+
+    def get_relations(client: TestClient, _i: int) -> httpx.Response:
+        skip = rng.randrange(relation_pages) * 100
+        return client.get(f"{api}/relations/", params={"skip": skip, "limit": 100})
+
+    def get_client_relations(client: TestClient, _i: int) -> httpx.Response:
+        return client.get(f"{api}/clients/{rng.choice(clients)}/relations")
+
+    def import_clients(client: TestClient, i: int) -> httpx.Response:
+        content = import_csv(import_rows, i, clients, rng)
+        return client.post(
+            f"{api}/clients/file",
+            params={"group_name": f"{PREFIX}import"},
+            files={"file": ("clients.csv", content, "text/csv")},
+            headers=auth_headers,
+        )
+
+    def login(client: TestClient, _i: int) -> httpx.Response:
+        return client.post(
+            f"{api}/login/access-token",
+            data={"username": rng.choice(seeded.user_emails), "password": PASSWORD},
+        )
+
+    scenarios: dict[str, Scenario] = {
+        "get_clients": get_clients,
+        "get_relations": get_relations,
+        "get_client_relations": get_client_relations,
+        "login": login,
+    }
+    if import_rows:
+        scenarios["create_clients_from_file"] = import_clients
+    return scenarios
+
+
+def get_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+@contextmanager
+def use_engine(db_engine: Engine) -> Generator[None, None, None]:
+    def get_benchmark_db() -> Iterator[Session]:
+        with Session(db_engine) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = get_benchmark_db
+    app.dependency_overrides[get_read_db] = get_benchmark_db
+    try:
+        yield
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+        app.dependency_overrides.pop(get_read_db, None)
+
+
+def create_sqlite_engine(path: str | None) -> Engine:
+    if path:
+        return create_engine(f"sqlite:///{path}")
+    return create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+
+def run_benchmark(
+    *,
+    db_engine: Engine,
+    clients: int,
+    relations: int,
+    users: int,
+    items: int,
+    requests: int,
+    warmup: int,
+    import_rows: int,
+    only: list[str] | None = None,
+    seed: int = 0,
+    keep_data: bool = False,
+) -> dict[str, Any]:
+    with Session(db_engine) as session:
+        remove_seeded_data(session)
+        seeded_at = time.perf_counter()
+        seeded = seed_database(
+            session,
+            clients=clients,
+            relations=relations,
+            users=max(users, 1),
+            items=items,
+            seed=seed,
+        )
+        seed_seconds = time.perf_counter() - seeded_at
+
+    results: dict[str, Any] = {}
+    try:
+        with (
+            use_engine(db_engine),
+            patch("app.api.routes.clients.download_image", return_value=None),
+            TestClient(app) as client,
+        ):
+            token = client.post(
+                f"{settings.API_V1_STR}/login/access-token",
+                data={"username": seeded.user_emails[0], "password": PASSWORD},
+            ).json()["access_token"]
+            auth_headers = {"Authorization": f"Bearer {token}"}
+            scenarios = build_scenarios(seeded, auth_headers, import_rows, seed)
+            for name, scenario in scenarios.items():
+                if only and name not in only:
+                    continue
+                # Imports are slow and grow the data set, run fewer of them
+                count = (
+                    max(requests // 10, 1)
+                    if name == "create_clients_from_file"
+                    else requests
+                )
+                results[name] = measure(client, scenario, count, min(warmup, count))
+    finally:
+        if not keep_data:
+            with Session(db_engine) as session:
+                remove_seeded_data(session)
+
+    return {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "database": db_engine.dialect.name,
+        "dataset": {
+            "clients": clients,
+            "relations": seeded.relations,
+            "users": len(seeded.user_emails),
+            "items": seeded.items,
+            "import_rows": import_rows,
+            "seed": seed,
+            "seed_seconds": round(seed_seconds, 3),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any]) -> str:
+    lines = [
+        f"{'scenario':<26}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}"
+    ]
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "requests_per_second"):
+            old, new = before[metric], result[metric]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            lines.append(f"{name:<26}{metric:<22}{old:>12}{new:>12}{change:>10}")
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=2_000)
+    parser.add_argument("--relations", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--items", type=int, default=1_000)
+    parser.add_argument(
+        "--requests", type=int, default=200, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=10, help="unmeasured requests per scenario"
+    )
+    parser.add_argument(
+        "--import-rows", type=int, default=100, help="rows per CSV import, 0 to skip"
+    )
+    parser.add_argument(
+        "--scenario", action="append", dest="only", help="only run these scenarios"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--sqlite",
+        nargs="?",
+        const="",
+        metavar="PATH",
+        help="use a SQLite stand-in database (in memory unless PATH is given)",
+    )
+    parser.add_argument(
+        "--keep-data", action="store_true", help="don't remove the seeded rows"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="write the results as JSON to this file"
+    )
+    parser.add_argument(
+        "--baseline", type=Path, help="compare with a previous results file"
+    )
+    args = parser.parse_args()
+
+    if args.sqlite is not None:
+        db_engine = create_sqlite_engine(args.sqlite)
+        prepare_sqlite(db_engine)
+    else:
+        db_engine = default_engine
+
+    report = run_benchmark(
+        db_engine=db_engine,
+        clients=args.clients,
+        relations=args.relations,
+        users=args.users,
+        items=args.items,
+        requests=args.requests,
+        warmup=args.warmup,
+        import_rows=args.import_rows,
+        only=args.only,
+        seed=args.seed,
+        keep_data=args.keep_data,
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    print(output)
+    if args.baseline:
+        print(compare(report, json.loads(args.baseline.read_text())))
+
+
+if __name__ == "__main__":
+    main()
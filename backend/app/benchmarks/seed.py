@@ -0,0 +1,302 @@
+"""
+Synthetic benchmark data.
+
+Every seeded row is tagged with ``PREFIX`` (client userIds, user emails) so it
+can be removed again without touching anything else in the database.
+"""
+import random
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, delete, insert, text
+from sqlmodel import Session, SQLModel, col, select
+
+from app.core.security import get_password_hash
+from app.graph import refresh_components
+from app.models import Clients, Item, Relations, User
+
+PREFIX = "bench-"
+PASSWORD = "benchmark-password"
+BATCH_SIZE = 5_000
+
+
+@dataclass
+class SeededData:
+    client_user_ids: list[str] = field(default_factory=list)
+    user_emails: list[str] = field(default_factory=list)
+    relations: int = 0
+    items: int = 0
+
+
+def client_row(user_id: str, rng: random.Random, group_name: str) -> dict[str, object]:
+    return {
+        "name": f"Client {user_id}",
+        "nickname": user_id,
+        "instagram": "default.png",
+        "userId": user_id,
+        "openForConnections": rng.choice([0, 1, 2]),
+        "priority": rng.randint(0, 10),
+        "isReached": int(rng.random() < 0.2),
+        "status": 1,
+        "howHardToReach": rng.randint(1, 10),
+        "parameterOne": "lorem ipsum " * rng.randint(1, 20),
+        "parameterTwo": "dolor sit amet " * rng.randint(1, 20),
+        "parameterThree": None,
+        "groupName": group_name,
+    }
+
+
+def insert_batches(
+    session: Session, model: type[SQLModel], rows: list[dict[str, object]]
+) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(model), rows[start : start + BATCH_SIZE])
+
+
+def seed_database(
+    session: Session,
+    *,
+    clients: int,
+    relations: int,
+    users: int,
+    items: int,
+    groups: int = 10,
+    seed: int = 0,
+) -> SeededData:
+    """
+    Bulk insert clients, random relations between them, users and items.
+    """
+    rng = random.Random(seed)
+    seeded = SeededData()
+
+    seeded.client_user_ids = [f"{PREFIX}{i}" for i in range(clients)]
+    insert_batches(
+        session,
+        Clients,
+        [
+            client_row(user_id, rng, f"{PREFIX}group-{i % groups}")
+            for i, user_id in enumerate(seeded.client_user_ids)
+        ],
+    )
+
+    if clients > 1:
+        relation_rows: list[dict[str, object]] = []
+        for _ in range(relations):
+            from_id, to_id = rng.sample(seeded.client_user_ids, 2)
+            relation_rows.append(
+                {"fromClientId": from_id, "toClientId": to_id, "status": 1}
+            )
+        insert_batches(session, Relations, relation_rows)
+        seeded.relations = len(relation_rows)
+
+    # Hashing is the slow part of creating users, all of them share one password
+    hashed_password = get_password_hash(PASSWORD)
+    seeded.user_emails = [f"{PREFIX}{i}@example.com" for i in range(users)]
+    insert_batches(
+        session,
+        User,
+        [
+            {
+                "email": email,
+                "hashed_password": hashed_password,
+                "is_active": True,
+                "is_superuser": False,
+                "full_name": None,
+            }
+            for email in seeded.user_emails
+        ],
+    )
+    session.commit()
+
+    if users and items:
+        owner_ids = session.exec(
+            select(User.id).where(col(User.email).startswith(PREFIX))
+        ).all()
+        insert_batches(
+            session,
+            Item,
+            [
+                {
+                    "title": f"Item {i}",
+                    "description": "benchmark item",
+                    "owner_id": owner_ids[i % len(owner_ids)],
+                }
+                for i in range(items)
+            ],
+        )
+        seeded.items = items
+
+    session.commit()
+    refresh_components(session)
+    return seeded
+
+
+def remove_seeded_data(session: Session, prefix: str = PREFIX) -> None:
+    """
+    Delete everything seed_database (and the benchmark imports) created.
+    """
+    bench_client = f"{prefix}%"
+    session.execute(
+        delete(Relations).where(
+            col(Relations.fromClientId).like(bench_client)
+            | col(Relations.toClientId).like(bench_client)
+        )
+    )
+    session.execute(delete(Clients).where(col(Clients.userId).like(bench_client)))
+    bench_users = select(User.id).where(col(User.email).like(bench_client))
+    session.execute(delete(Item).where(col(Item.owner_id).in_(bench_users)))
+    session.execute(delete(User).where(col(User.email).like(bench_client)))
+    session.commit()
+
+
+# SQLite equivalents of the Postgres triggers filling the relations' client keys,
+# maintaining relations_listing, bumping client_groups versions and counting
+# reached neighbours
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_fill_client_pks AFTER INSERT ON relations
+    WHEN NEW.from_client_pk IS NULL OR NEW.to_client_pk IS NULL
+    BEGIN
+        UPDATE relations
+        SET from_client_pk = (SELECT id FROM clients WHERE "userId" = NEW."fromClientId"),
+            to_client_pk = (SELECT id FROM clients WHERE "userId" = NEW."toClientId")
+        WHERE id = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_listing_insert AFTER INSERT ON relations
+    BEGIN
+        INSERT OR REPLACE INTO relations_listing
+            (id, "fromClientId", "toClientId", from_client_pk, to_client_pk, status,
+             from_client_name, to_client_name, "fromClientInstagram", "toClientInstagram")
+        SELECT NEW.id, NEW."fromClientId", NEW."toClientId", f.id, t.id, NEW.status,
+               f.name, t.name, f.instagram, t.instagram
+        FROM clients f, clients t
+        WHERE f."userId" = NEW."fromClientId" AND t."userId" = NEW."toClientId";
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_listing_delete AFTER DELETE ON relations
+    BEGIN
+        DELETE FROM relations_listing WHERE id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_listing_client_update
+    AFTER UPDATE OF name, instagram ON clients
+    BEGIN
+        UPDATE relations_listing
+        SET from_client_name = NEW.name, "fromClientInstagram" = NEW.instagram
+        WHERE from_client_pk = NEW.id;
+        UPDATE relations_listing
+        SET to_client_name = NEW.name, "toClientInstagram" = NEW.instagram
+        WHERE to_client_pk = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_group_versions_insert AFTER INSERT ON clients
+    WHEN NEW."groupName" IS NOT NULL
+    BEGIN
+        INSERT INTO client_groups (name, version) VALUES (NEW."groupName", 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_group_versions_update
+    AFTER UPDATE OF "groupName", "userId", name, instagram ON clients
+    BEGIN
+        INSERT INTO client_groups (name, version)
+        SELECT DISTINCT name, 1 FROM (
+            SELECT OLD."groupName" AS name
+            UNION SELECT NEW."groupName"
+            UNION SELECT c."groupName" FROM relations r JOIN clients c ON c.id = r.to_client_pk
+            WHERE r.from_client_pk = NEW.id
+            UNION SELECT c."groupName" FROM relations r JOIN clients c ON c.id = r.from_client_pk
+            WHERE r.to_client_pk = NEW.id
+        )
+        WHERE name IS NOT NULL
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_group_versions_delete AFTER DELETE ON clients
+    WHEN OLD."groupName" IS NOT NULL
+    BEGIN
+        INSERT INTO client_groups (name, version) VALUES (OLD."groupName", 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_group_versions_insert AFTER INSERT ON relations
+    BEGIN
+        INSERT INTO client_groups (name, version)
+        SELECT DISTINCT "groupName", 1 FROM clients
+        WHERE "userId" IN (NEW."fromClientId", NEW."toClientId") AND "groupName" IS NOT NULL
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_group_versions_delete AFTER DELETE ON relations
+    BEGIN
+        INSERT INTO client_groups (name, version)
+        SELECT DISTINCT "groupName", 1 FROM clients
+        WHERE "userId" IN (OLD."fromClientId", OLD."toClientId") AND "groupName" IS NOT NULL
+        ON CONFLICT (name) DO UPDATE SET version = version + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_reached_neighbours_insert AFTER INSERT ON relations
+    BEGIN
+        UPDATE clients SET "reachedNeighbours" = "reachedNeighbours" + 1
+        WHERE (("userId" = NEW."fromClientId"
+                AND (SELECT "isReached" FROM clients WHERE "userId" = NEW."toClientId") = 1)
+            OR ("userId" = NEW."toClientId"
+                AND (SELECT "isReached" FROM clients WHERE "userId" = NEW."fromClientId") = 1))
+          AND NOT EXISTS (
+              SELECT 1 FROM relations r
+              WHERE r.id <> NEW.id
+                AND ((r."fromClientId" = NEW."fromClientId" AND r."toClientId" = NEW."toClientId")
+                     OR (r."fromClientId" = NEW."toClientId" AND r."toClientId" = NEW."fromClientId"))
+          );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS relations_reached_neighbours_delete AFTER DELETE ON relations
+    BEGIN
+        UPDATE clients SET "reachedNeighbours" = "reachedNeighbours" - 1
+        WHERE (("userId" = OLD."fromClientId"
+                AND (SELECT "isReached" FROM clients WHERE "userId" = OLD."toClientId") = 1)
+            OR ("userId" = OLD."toClientId"
+                AND (SELECT "isReached" FROM clients WHERE "userId" = OLD."fromClientId") = 1))
+          AND NOT EXISTS (
+              SELECT 1 FROM relations r
+              WHERE (r."fromClientId" = OLD."fromClientId" AND r."toClientId" = OLD."toClientId")
+                 OR (r."fromClientId" = OLD."toClientId" AND r."toClientId" = OLD."fromClientId")
+          );
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS clients_reached_neighbours AFTER UPDATE OF "isReached" ON clients
+    WHEN (OLD."isReached" IS 1) <> (NEW."isReached" IS 1)
+    BEGIN
+        UPDATE clients
+        SET "reachedNeighbours" = "reachedNeighbours"
+            + (CASE WHEN NEW."isReached" IS 1 THEN 1 ELSE -1 END)
+        WHERE "userId" IN (
+            SELECT "toClientId" FROM relations WHERE "fromClientId" = NEW."userId"
+            UNION SELECT "fromClientId" FROM relations WHERE "toClientId" = NEW."userId"
+        );
+    END
+    """,
+]
+
+
+def prepare_sqlite(engine: Engine) -> None:
+    """
+    Create the schema on a SQLite stand-in database.
+
+    Tables come from the models instead of the (Postgres only) migrations.
+    """
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for trigger in SQLITE_TRIGGERS:
+            connection.execute(text(trigger))
@@ -0,0 +1,125 @@
+"""
+Startup benchmark.
+
+Starts a fresh interpreter like a new worker process would and reports how
+long importing the app takes (with the slowest top level packages, from
+``python -X importtime``), running its startup (lifespan) and answering the
+first request:
+
+    python -m app.benchmarks.startup --target 1.5
+
+Exits with status 1 when the time to the first request, measured from
+launching the interpreter, is above ``--target`` seconds.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any
+
+# Printed by the child after importing the app, ends the -X importtime output
+APP_IMPORTED = "app imported"
+
+# Runs in the child process. The start time comes from the parent, so
+# interpreter startup is included in the time to the first request
+CHILD = """
+import json, os, sys, time
+started = float(os.environ["STARTUP_BENCHMARK_STARTED"])
+
+t = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+app_modules = sorted(sys.modules)
+print("app imported", file=sys.stderr, flush=True)
+
+from fastapi.testclient import TestClient
+from app.core.config import settings
+
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    status = client.get(f"{settings.API_V1_STR}/clients/", params={"limit": 1})
+    answered = time.perf_counter()
+    time_to_first_request = time.time() - started
+
+print(json.dumps({
+    "import_seconds": imported - t,
+    "lifespan_seconds": ready - imported,
+    "first_request_seconds": answered - ready,
+    "time_to_first_request_seconds": time_to_first_request,
+    "status_code": status.status_code,
+    "modules": app_modules,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict[str, float]:
+    """
+    Cumulative import time in seconds per top level package and app module.
+
+    A package imported by another one counts for both. Only imports done while
+    importing the app count, not the ones of the benchmark itself.
+    """
+    modules: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if line == APP_IMPORTED:
+            break
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        if "." not in name or name.startswith("app."):
+            modules[name] = int(cumulative_us) / 1_000_000
+    return modules
+
+
+def measure_startup() -> dict[str, Any]:
+    env = {**os.environ, "STARTUP_BENCHMARK_STARTED": repr(time.time())}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=True,
+    )
+    report: dict[str, Any] = json.loads(result.stdout.strip().splitlines()[-1])
+    report["packages"] = parse_importtime(result.stderr)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--target",
+        type=float,
+        help="fail if the time to the first request is above this many seconds",
+    )
+    parser.add_argument("--top", type=int, default=15, help="packages to list")
+    parser.add_argument(
+        "--runs", type=int, default=3, help="report the fastest of this many runs"
+    )
+    args = parser.parse_args()
+
+    # The first run also warms the OS file cache, like a worker restart would
+    runs = [measure_startup() for _ in range(max(args.runs, 1))]
+    report = min(runs, key=lambda run: run["time_to_first_request_seconds"])
+    packages = sorted(report.pop("packages").items(), key=lambda item: -item[1])
+    report.pop("modules")
+    report = {key: round(value, 3) for key, value in report.items()}
+    report["slowest_imports"] = {
+        name: round(seconds, 3) for name, seconds in packages[: args.top]
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.target is not None:
+        seconds = report["time_to_first_request_seconds"]
+        if seconds > args.target:
+            print(
+                f"Time to first request {seconds}s is above the {args.target}s target"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Live change feed.
+
+Write endpoints describe what they changed with ``notify_change``, which
+sends a Postgres ``NOTIFY`` in the same transaction: it is delivered to
+listeners when the transaction commits, and not at all if it rolls back.
+Every worker process runs a ``ChangeFeed`` thread that ``LISTEN``s on its own
+connection and hands the events to the subscribers of that process, the
+``/changes/`` Server-Sent Events streams. So a change made through any worker
+reaches the streams of all of them.
+
+Events are small JSON objects:
+
+    {"entity": "clients", "op": "update", "id": 12, "clientIds": ["abc"],
+     "groupNames": ["batch-1"], "data": {...}}
+
+``op`` is one of create, update, delete and import (a bulk change, with no
+data: refetch). A ``resync`` event means events may have been missed, after a
+lost database connection or a subscriber that couldn't keep up.
+"""
+import asyncio
+import json
+import logging
+import select as select_module
+import threading
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import psycopg
+from sqlalchemy import func, select
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "app_changes"
+# NOTIFY payloads must be shorter than 8000 bytes
+MAX_PAYLOAD_BYTES = 7_900
+RESYNC: dict[str, Any] = {"entity": None, "op": "resync"}
+
+
+def notify_change(
+    session: Session,
+    entity: str,
+    op: str,
+    *,
+    id: int | None = None,
+    client_ids: Iterable[str | None] = (),
+    group_names: Iterable[str | None] = (),
+    data: dict[str, Any] | None = None,
+) -> None:
+    """
+    Queue a change event, sent when the session's transaction commits.
+    """
+    if (
+        not settings.CHANGE_FEED_ENABLED
+        or session.get_bind().dialect.name != "postgresql"
+    ):
+        return
+    event = {
+        "entity": entity,
+        "op": op,
+        "id": id,
+        "clientIds": sorted({client_id for client_id in client_ids if client_id}),
+        "groupNames": sorted({name for name in group_names if name}),
+        "data": data,
+    }
+    payload = json.dumps(event, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES:
+        # Subscribers refetch the row instead
+        event["data"] = None
+        payload = json.dumps(event, default=str)
+    session.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+def matches(
+    event: dict[str, Any], group_name: str | None, client_id: str | None
+) -> bool:
+    if event["op"] == "resync":
+        return True
+    if group_name is not None and group_name not in event["groupNames"]:
+        return False
+    if client_id is not None and client_id not in event["clientIds"]:
+        return False
+    return True
+
+
+def format_event(event: dict[str, Any]) -> str:
+    """
+    The event as a Server-Sent Events message, named after its entity.
+    """
+    name = event["entity"] or event["op"]
+    return f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class ChangeFeed:
+    """
+    Listens for change events and fans them out to the subscribers of this
+    process, each an asyncio queue read on its own event loop.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: set[
+            tuple[asyncio.AbstractEventLoop, asyncio.Queue[dict[str, Any]]]
+        ] = set()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Set while LISTENing, events sent before are not received
+        self.listening = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None or not settings.CHANGE_FEED_ENABLED:
+            return
+        if engine.dialect.name != "postgresql":
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="change-feed", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @contextmanager
+    def subscribe(self) -> Iterator["asyncio.Queue[dict[str, Any]]"]:
+        """
+        Receive events on a queue for the duration of the block. Must be used
+        from a running event loop.
+        """
+        queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(
+            maxsize=settings.CHANGE_FEED_QUEUE_SIZE
+        )
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+    def publish(self, event: dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, event)
+            except RuntimeError:
+                # The subscriber's loop is closed, it's going away
+                pass
+
+    @staticmethod
+    def _put(queue: "asyncio.Queue[dict[str, Any]]", event: dict[str, Any]) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop what's pending, the subscriber resyncs
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    def _on_notify(self, notify: psycopg.Notify) -> None:
+        try:
+            event = json.loads(notify.payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed change event: {notify.payload}")
+            return
+        self.publish(event)
+
+    def _listen(self, resync: bool) -> None:
+        url = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        with psycopg.connect(url, autocommit=True) as connection:
+            connection.add_notify_handler(self._on_notify)
+            connection.execute(f"LISTEN {CHANNEL}")
+            if resync:
+                # Whatever was sent while reconnecting is lost
+                self.publish(RESYNC)
+            self.listening.set()
+            try:
+                while not self._stopping.is_set():
+                    readable, _, _ = select_module.select(
+                        [connection.fileno()], [], [], 1.0
+                    )
+                    if readable:
+                        # Reading the results delivers the pending notifications
+                        connection.execute("SELECT 1")
+            finally:
+                self.listening.clear()
+
+    def _run(self) -> None:
+        resync = False
+        while not self._stopping.is_set():
+            try:
+                self._listen(resync)
+            except Exception:
+                logger.exception("Change feed connection failed, reconnecting")
+                self._stopping.wait(settings.CHANGE_FEED_RECONNECT_SECONDS)
+                resync = True
+
+
+change_feed = ChangeFeed()
@@ -0,0 +1,241 @@
+"""
+Response compression.
+
+``CompressionMiddleware`` compresses responses with Brotli or gzip, whichever
+the client prefers in its ``Accept-Encoding``. Complete responses are only
+compressed from ``COMPRESSION_MINIMUM_SIZE`` bytes on, below that the
+headers cost more than they save. Streaming responses are compressed chunk by
+chunk and every chunk is flushed, so nothing is held back waiting for more
+data. Event streams are left alone: each event would need its own flush,
+where compression gains nothing.
+
+Responses that are cached anyway can be served from a ``PrecompressedBody``,
+which compresses once per encoding at higher levels and keeps the result.
+The middleware passes responses that already have a ``Content-Encoding``
+through untouched.
+"""
+import gzip
+import threading
+import zlib
+from typing import Protocol
+
+import brotli
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+# In order of preference, when the client accepts both equally
+ENCODINGS = ("br", "gzip")
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/msgpack",
+    "application/x-msgpack",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+# Precompressed bodies are compressed once, slower levels pay off. Brotli 11
+# takes seconds for a large graph and is no smaller than 9 on them
+PRECOMPRESSED_GZIP_LEVEL = 9
+PRECOMPRESSED_BROTLI_QUALITY = 9
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    The encoding of ``ENCODINGS`` with the highest q-value in an
+    ``Accept-Encoding`` header, or None if none is accepted.
+    """
+    weights: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    content_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+    if content_type == "text/event-stream":
+        return False
+    return (
+        content_type.startswith("text/")
+        or content_type.endswith("+json")
+        or content_type in COMPRESSIBLE_TYPES
+    )
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes:
+        """Compress a chunk, returning everything that can be decoded so far."""
+
+    def finish(self, data: bytes) -> bytes:
+        """Compress the last chunk and end the stream."""
+
+
+class GzipCompressor:
+    def __init__(self, level: int) -> None:
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int) -> None:
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        compressed: bytes = self._compressor.process(data) + self._compressor.flush()
+        return compressed
+
+    def finish(self, data: bytes) -> bytes:
+        compressed: bytes = self._compressor.process(data) + self._compressor.finish()
+        return compressed
+
+
+def make_compressor(encoding: str) -> Compressor:
+    if encoding == "br":
+        return BrotliCompressor(settings.COMPRESSION_BROTLI_QUALITY)
+    return GzipCompressor(settings.COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies as they are sent.
+
+    The response start is held back until the first body chunk, which tells
+    whether the response is complete (then it is compressed if big enough,
+    with its ``Content-Length`` updated) or streamed (then every chunk is
+    compressed and flushed on its own, without a ``Content-Length``).
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+        compressor: Compressor | None = None
+        passthrough = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                assert start is not None
+                headers = MutableHeaders(raw=start["headers"])
+                if not is_compressible(headers) or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    if is_compressible(headers):
+                        headers.add_vary_header("Accept-Encoding")
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                compressor = make_compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    body = compressor.compress(body)
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+            elif more_body:
+                body = compressor.compress(body)
+            else:
+                body = compressor.finish(body)
+            await send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class PrecompressedBody:
+    """
+    A response body kept together with its compressed variants, each made
+    the first time a client asks for it.
+    """
+
+    def __init__(self, body: bytes, media_type: str) -> None:
+        self.body = body
+        self.media_type = media_type
+        self._variants: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: str) -> bytes:
+        with self._lock:
+            variant = self._variants.get(encoding)
+            if variant is None:
+                if encoding == "br":
+                    variant = brotli.compress(
+                        self.body, quality=PRECOMPRESSED_BROTLI_QUALITY
+                    )
+                else:
+                    variant = gzip.compress(
+                        self.body, compresslevel=PRECOMPRESSED_GZIP_LEVEL, mtime=0
+                    )
+                self._variants[encoding] = variant
+            return variant
+
+    def response(self, request: Request, vary: str | None = None) -> Response:
+        """
+        The body in the best encoding the request accepts. ``vary`` lists the
+        other request headers the body was chosen by.
+        """
+        headers = {"Vary": ", ".join(filter(None, (vary, "Accept-Encoding")))}
+        encoding = None
+        if (
+            settings.COMPRESSION_MINIMUM_SIZE is not None
+            and len(self.body) >= settings.COMPRESSION_MINIMUM_SIZE
+        ):
+            encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is None:
+            return Response(self.body, media_type=self.media_type, headers=headers)
+        headers["Content-Encoding"] = encoding
+        return Response(
+            self.encoded(encoding), media_type=self.media_type, headers=headers
+        )
@@ -0,0 +1,108 @@
+"""
+Sliding window rate limiting, used to throttle login attempts before any
+password hash is computed.
+
+``SlidingWindowLimiter`` keeps the attempt log in process memory, so limits
+apply per worker process. Set ``LOGIN_RATE_LIMIT_REDIS_URL`` (needs the
+``redis`` package) to share the log between all workers instead.
+"""
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from functools import lru_cache
+from typing import Any, Protocol
+from uuid import uuid4
+
+from app.core.config import settings
+
+
+class RateLimiter(Protocol):
+    def hit(self, key: str, limit: int, window_seconds: float) -> float:
+        """
+        Record an attempt for key.
+
+        Returns 0 if it is allowed, otherwise the number of seconds until the
+        next attempt would be; rejected attempts are not recorded.
+        """
+        ...
+
+    def undo(self, key: str) -> None:
+        """
+        Forget the most recent attempt recorded for key.
+        """
+        ...
+
+
+class SlidingWindowLimiter:
+    # Drop idle keys once the log holds this many of them
+    max_keys = 10_000
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._attempts: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> float:
+        now = self._clock()
+        with self._lock:
+            attempts = self._attempts.setdefault(key, deque())
+            while attempts and attempts[0] <= now - window_seconds:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                return attempts[-limit] + window_seconds - now
+            attempts.append(now)
+            if len(self._attempts) > self.max_keys:
+                self._sweep(now, window_seconds)
+        return 0
+
+    def undo(self, key: str) -> None:
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts:
+                attempts.pop()
+
+    def _sweep(self, now: float, window_seconds: float) -> None:
+        for key in [
+            key
+            for key, attempts in self._attempts.items()
+            if not attempts or attempts[-1] <= now - window_seconds
+        ]:
+            del self._attempts[key]
+
+
+class RedisSlidingWindowLimiter:
+    def __init__(self, url: str, prefix: str = "rate-limit:") -> None:
+        import redis  # type: ignore
+
+        self._redis: Any = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> float:
+        redis_key = self._prefix + key
+        now = time.time()
+        member = f"{now}:{uuid4().hex}"
+        # Add first and check afterwards, so concurrent workers can never let
+        # more than limit attempts through
+        pipe = self._redis.pipeline()
+        pipe.zremrangebyscore(redis_key, 0, now - window_seconds)
+        pipe.zadd(redis_key, {member: now})
+        pipe.zrange(redis_key, -limit - 1, -limit - 1, withscores=True)
+        pipe.expire(redis_key, int(window_seconds) + 1)
+        _, _, over_limit, _ = pipe.execute()
+        if not over_limit:
+            return 0
+        self._redis.zrem(redis_key, member)
+        return float(over_limit[0][1]) + window_seconds - now
+
+    def undo(self, key: str) -> None:
+        self._redis.zpopmax(self._prefix + key)
+
+
+@lru_cache
+def get_login_limiter() -> RateLimiter:
+    if settings.LOGIN_RATE_LIMIT_REDIS_URL:
+        return RedisSlidingWindowLimiter(
+            settings.LOGIN_RATE_LIMIT_REDIS_URL, prefix="login-throttle:"
+        )
+    return SlidingWindowLimiter()
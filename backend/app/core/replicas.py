@@ -0,0 +1,147 @@
+"""
+Read replicas.
+
+With ``DATABASE_REPLICA_URLS`` set, the read-only listing endpoints take
+their session from ``get_read_db`` (``ReadSessionDep``), which picks the
+healthy replicas in turn. Everything else, and every read when no replica is
+healthy, stays on the primary ``engine``.
+
+A background thread checks every replica each ``REPLICA_HEALTH_CHECK_SECONDS``:
+a replica is healthy when it answers and replays the primary's changes with
+less than ``REPLICA_MAX_LAG_SECONDS`` of delay.
+
+Replicas lag behind, so a client that just wrote something would not always
+see it on the next read. ``ReadYourWritesMiddleware`` marks clients that made a
+successful write request with a short-lived cookie, and their reads go to
+the primary until it expires.
+"""
+import itertools
+import logging
+import threading
+
+from sqlalchemy import Engine, create_engine, text
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+READ_PRIMARY_COOKIE = "read_primary"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Seconds behind the primary, 0 when all the WAL received has been replayed
+# (an idle primary doesn't move the replay timestamp), NULL on a primary
+LAG_QUERY = text(
+    """
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+    """
+)
+
+
+class ReplicaSet:
+    """
+    The replica engines, with their health checked in a background thread and
+    handed out round robin.
+    """
+
+    def __init__(self, urls: list[str]) -> None:
+        self.engines = [
+            create_engine(url, pool_pre_ping=True, connect_args={"connect_timeout": 2})
+            for url in urls
+        ]
+        # Unhealthy until checked
+        self.healthy = [False] * len(self.engines)
+        self._turn = itertools.count()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None or not self.engines:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="replica-health", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self.check()
+            self._stopping.wait(settings.REPLICA_HEALTH_CHECK_SECONDS)
+
+    def check(self) -> None:
+        for index, replica in enumerate(self.engines):
+            try:
+                with replica.connect() as connection:
+                    lag = connection.execute(LAG_QUERY).scalar()
+                healthy = lag is None or lag <= settings.REPLICA_MAX_LAG_SECONDS
+                reason = f"{lag:.1f}s behind" if lag is not None else "up"
+            except Exception as e:
+                healthy = False
+                reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+            if healthy != self.healthy[index]:
+                state = "healthy" if healthy else "unhealthy"
+                logger.warning(f"Replica {replica.url.host} is {state}: {reason}")
+            self.healthy[index] = healthy
+
+    def choose(self) -> Engine | None:
+        """
+        The next healthy replica, or None to read from the primary.
+        """
+        healthy = [
+            replica
+            for replica, ok in zip(self.engines, self.healthy, strict=True)
+            if ok
+        ]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def engine_for(self, connection: HTTPConnection, primary: Engine) -> Engine:
+        """
+        Where a read-only request should read from: the primary for clients
+        that wrote recently, else a healthy replica if there is one.
+        """
+        if READ_PRIMARY_COOKIE in connection.cookies:
+            return primary
+        return self.choose() or primary
+
+
+class ReadYourWritesMiddleware:
+    """
+    Sets the cookie sending a client's reads to the primary on every
+    successful request that is not a GET, HEAD or OPTIONS.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{READ_PRIMARY_COOKIE}=1; Max-Age={settings.REPLICA_READ_YOUR_WRITES_SECONDS}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+replicas = ReplicaSet([str(url) for url in settings.DATABASE_REPLICA_URLS])
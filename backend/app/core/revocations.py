@@ -0,0 +1,178 @@
+"""
+Revocation of self-contained access tokens.
+
+With ``ACCESS_TOKEN_CLAIMS`` set, access tokens carry the user's email,
+``is_active`` and ``is_superuser``, and endpoints depending on
+``CurrentClaims`` take them from the token instead of loading the user.
+Tokens already handed out keep their claims until they expire, so
+``revoke_tokens`` is called whenever a user is deactivated, deleted or has
+their email or privileges changed. From then on the tokens issued before are
+checked against the database again, like tokens without claims, which also
+refuses them for inactive or deleted users.
+
+Every worker keeps the last revocation time of each user in memory, and only
+for ``ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES``, after which the tokens it applies
+to have expired. Revocations are stamped and sent to the other workers with a
+Postgres ``NOTIFY`` once the revoking transaction has committed, so that
+tokens issued meanwhile, with the claims from before the change, are revoked
+too. Each worker ``LISTEN``s on a connection of its own. The ones sent while a worker wasn't listening are
+lost to it, so it doesn't trust the claims of tokens issued before it
+started listening.
+"""
+import json
+import logging
+import select as select_module
+import threading
+import time
+from typing import Any
+
+import psycopg
+from sqlalchemy import event, func, select
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "token_revocations"
+RECONNECT_SECONDS = 5
+# Session.info key of the users whose revocations are sent on commit
+PENDING = "token_revocations"
+# User attributes copied into access tokens
+CLAIMED_FIELDS = ("email", "is_active", "is_superuser")
+
+
+class TokenRevocations:
+    """
+    The users whose tokens were revoked lately, by revocation time, kept in
+    sync with the other workers by a listening thread.
+    """
+
+    def __init__(self) -> None:
+        self._revoked: dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Tokens issued before are not trusted, revocations may have been missed
+        self._not_before = 0.0
+        self.listening = threading.Event()
+
+    def start(self) -> None:
+        if self._thread is not None or not settings.ACCESS_TOKEN_CLAIMS:
+            return
+        if engine.dialect.name != "postgresql":
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="token-revocations", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def add(self, user_id: int, revoked_at: float) -> None:
+        cutoff = time.time() - settings.ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES * 60
+        with self._lock:
+            self._revoked[user_id] = max(revoked_at, self._revoked.get(user_id, 0.0))
+            # Tokens issued before the cutoff have expired
+            for expired in [key for key, at in self._revoked.items() if at < cutoff]:
+                del self._revoked[expired]
+
+    def trusts(self, user_id: int, issued_at: float) -> bool:
+        """
+        Whether the claims of a token issued at ``issued_at`` still hold.
+        """
+        if self._thread is not None and not self.listening.is_set():
+            return False
+        with self._lock:
+            revoked_at = self._revoked.get(user_id, 0.0)
+        return issued_at > max(revoked_at, self._not_before)
+
+    def _on_notify(self, notify: psycopg.Notify) -> None:
+        try:
+            revocation = json.loads(notify.payload)
+            self.add(int(revocation["userId"]), float(revocation["revokedAt"]))
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed token revocation: {notify.payload}")
+
+    def _listen(self) -> None:
+        url = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        with psycopg.connect(url, autocommit=True) as connection:
+            connection.add_notify_handler(self._on_notify)
+            connection.execute(f"LISTEN {CHANNEL}")
+            self._not_before = time.time()
+            self.listening.set()
+            try:
+                while not self._stopping.is_set():
+                    readable, _, _ = select_module.select(
+                        [connection.fileno()], [], [], 1.0
+                    )
+                    if readable:
+                        # Reading the results delivers the pending notifications
+                        connection.execute("SELECT 1")
+            finally:
+                self.listening.clear()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Token revocations connection failed, reconnecting")
+                self._stopping.wait(RECONNECT_SECONDS)
+
+
+token_revocations = TokenRevocations()
+
+
+def revoke_tokens(session: Session, user_id: int) -> None:
+    """
+    Stop trusting the claims of the user's tokens issued until the session's
+    transaction commits, in this worker right away and in the others once it
+    has committed.
+    """
+    if not settings.ACCESS_TOKEN_CLAIMS:
+        return
+    token_revocations.add(user_id, time.time())
+    session.info.setdefault(PENDING, set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _send_revocations(session: Session) -> None:
+    user_ids = session.info.pop(PENDING, None)
+    if not user_ids:
+        return
+    # Tokens issued before the commit may carry the claims from before it
+    revoked_at = time.time()
+    for user_id in user_ids:
+        token_revocations.add(user_id, revoked_at)
+    bind = session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    # The session's connection can't be used again until the commit is over
+    with bind.engine.connect() as connection:
+        for user_id in user_ids:
+            payload = json.dumps({"userId": user_id, "revokedAt": revoked_at})
+            connection.execute(select(func.pg_notify(CHANNEL, payload)))
+        connection.commit()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_revocations(session: Session) -> None:
+    session.info.pop(PENDING, None)
+
+
+def claims_changed(user: User, update: dict[str, Any]) -> bool:
+    return any(
+        name in update and update[name] != getattr(user, name)
+        for name in CLAIMED_FIELDS
+    )
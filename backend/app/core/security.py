@@ -1,27 +1,119 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Any
 
 from jose import jwt
 from passlib.context import CryptContext
+from passlib.hash import argon2
 
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+if settings.PASSWORD_HASH_SCHEME == "argon2" and not argon2.has_backend():
+    raise RuntimeError("PASSWORD_HASH_SCHEME=argon2 requires the argon2-cffi package")
+
+# Hashes with another scheme or other cost parameters than the configured ones
+# are reported as needing an update by verify_and_update_password
+pwd_context = CryptContext(
+    schemes=[settings.PASSWORD_HASH_SCHEME]
+    + [
+        scheme
+        for scheme in ("bcrypt", "argon2")
+        if scheme != settings.PASSWORD_HASH_SCHEME
+    ],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
+
+# bcrypt and argon2 release the GIL, so a thread pool is enough to cap how many
+# hashes burn CPU at once, whatever the number of request threads
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
 
 
 ALGORITHM = "HS256"
 
 
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
+REFRESH_TOKEN_TYPE = "refresh"
+
+
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    claims: dict[str, Any] | None = None,
+) -> str:
     expire = datetime.utcnow() + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+    # iat with sub-second precision, compared to revocation times
+    to_encode = {
+        "exp": expire,
+        "iat": time.time(),
+        "sub": str(subject),
+        **(claims or {}),
+    }
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def create_refresh_token(subject: str | Any, expires_delta: timedelta) -> str:
+    return create_access_token(subject, expires_delta, {"typ": REFRESH_TOKEN_TYPE})
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    verified: bool = _hash_executor.submit(
+        pwd_context.verify, plain_password, hashed_password
+    ).result()
+    return verified
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    """
+    Verify a password, also returning a new hash when the stored one is outdated.
+    """
+    result: tuple[bool, str | None] = _hash_executor.submit(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    ).result()
+    return result
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    hashed: str = _hash_executor.submit(pwd_context.hash, password).result()
+    return hashed
+
+
+# The versions for async endpoints wait for the hash without holding a thread:
+# the sync ones block the threadpool thread running the endpoint until the
+# hashing pool gets to it, which is what runs out under a burst of logins
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    verified: bool = await asyncio.wrap_future(
+        _hash_executor.submit(pwd_context.verify, plain_password, hashed_password)
+    )
+    return verified
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    result: tuple[bool, str | None] = await asyncio.wrap_future(
+        _hash_executor.submit(
+            pwd_context.verify_and_update, plain_password, hashed_password
+        )
+    )
+    return result
+
+
+async def get_password_hash_async(password: str) -> str:
+    hashed: str = await asyncio.wrap_future(
+        _hash_executor.submit(pwd_context.hash, password)
+    )
+    return hashed
@@ -1,8 +1,13 @@
 from typing import Any
 
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
 
-from app.core.security import get_password_hash, verify_password
+from app.core.security import (
+    get_password_hash,
+    verify_and_update_password,
+    verify_and_update_password_async,
+)
 from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
 
 
@@ -40,11 +45,49 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, db_user.hashed_password)
+    if not verified:
         return None
+    if new_hash:
+        update_password_hash(session=session, db_user=db_user, hashed_password=new_hash)
     return db_user
 
 
+async def authenticate_async(
+    *, session: Session, email: str, password: str
+) -> User | None:
+    """
+    ``authenticate`` for async endpoints, with the queries in the threadpool
+    and the hash awaited from the hashing pool.
+    """
+    db_user = await run_in_threadpool(get_user_by_email, session=session, email=email)
+    if not db_user:
+        return None
+    verified, new_hash = await verify_and_update_password_async(
+        password, db_user.hashed_password
+    )
+    if not verified:
+        return None
+    if new_hash:
+        await run_in_threadpool(
+            update_password_hash,
+            session=session,
+            db_user=db_user,
+            hashed_password=new_hash,
+        )
+    return db_user
+
+
+def update_password_hash(
+    *, session: Session, db_user: User, hashed_password: str
+) -> None:
+    # Also when the hashing scheme or cost changed since the password was stored
+    db_user.hashed_password = hashed_password
+    session.add(db_user)
+    session.commit()
+    session.refresh(db_user)
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: int) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
@@ -0,0 +1,202 @@
+"""
+Outbound email queue.
+
+Request handlers store emails in the ``email_outbox`` table with
+``enqueue_email`` and return right away. A background worker thread, started
+with the app, sends due emails in batches over a single reused SMTP
+connection and retries failures with exponential backoff. Batches are claimed
+with ``FOR UPDATE SKIP LOCKED``, so every worker process can run its own
+worker thread.
+
+Bodies can hold secrets (passwords of new accounts, password reset tokens), so
+they are cleared as soon as an email is sent or given up on, and the rows
+themselves are deleted after ``EMAIL_QUEUE_RETENTION_DAYS``.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from sqlmodel import Session, col, delete, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import EmailOutbox
+from app.utils import build_email_message, get_smtp_options
+
+if TYPE_CHECKING:
+    from emails.backend import SMTPBackend  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL_SECONDS = 3600
+
+
+def enqueue_email(
+    *, session: Session, email_to: str, subject: str, html_content: str
+) -> EmailOutbox:
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    email = EmailOutbox(email_to=email_to, subject=subject, html_content=html_content)
+    session.add(email)
+    session.commit()
+    session.refresh(email)
+    email_worker.wake()
+    return email
+
+
+def get_smtp_backend() -> "SMTPBackend":
+    from emails.backend import SMTPBackend
+
+    return SMTPBackend(**get_smtp_options())
+
+
+def _schedule_retry(email: EmailOutbox, error: str, now: datetime) -> None:
+    email.attempts += 1
+    email.last_error = error
+    if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+        email.status = "failed"
+        email.html_content = ""
+        logger.error(f"Giving up on email {email.id} to {email.email_to}: {error}")
+        return
+    delay = settings.EMAIL_QUEUE_RETRY_SECONDS * 2 ** (email.attempts - 1)
+    email.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def send_due_emails(session: Session, backend: "SMTPBackend | None" = None) -> int:
+    """
+    Send one batch of due emails and commit. Returns the number of emails tried.
+
+    Pass a backend to keep its SMTP connection open across batches, otherwise a
+    connection is opened for this batch only.
+    """
+    now = datetime.utcnow()
+    statement = (
+        select(EmailOutbox)
+        .where(EmailOutbox.status == "pending")
+        .where(col(EmailOutbox.next_attempt_at) <= now)
+        .order_by(col(EmailOutbox.next_attempt_at))
+        .limit(settings.EMAIL_QUEUE_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    outbox = session.exec(statement).all()
+    if not outbox:
+        session.rollback()
+        return 0
+
+    smtp = backend or get_smtp_backend()
+    try:
+        for email in outbox:
+            message = build_email_message(
+                subject=email.subject, html_content=email.html_content
+            )
+            try:
+                response = message.send(to=email.email_to, smtp=smtp)
+            except Exception as e:
+                _schedule_retry(email, repr(e), now)
+            else:
+                if response.success:
+                    email.status = "sent"
+                    email.sent_at = datetime.utcnow()
+                    email.html_content = ""
+                else:
+                    error = response.error or response.status_text
+                    _schedule_retry(email, repr(error), now)
+            session.add(email)
+    finally:
+        if backend is None:
+            smtp.close()
+    session.commit()
+    return len(outbox)
+
+
+def purge_old_emails(session: Session) -> int:
+    """
+    Delete the sent and failed emails older than the retention period and
+    commit. Returns the number of emails deleted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=settings.EMAIL_QUEUE_RETENTION_DAYS)
+    statement = (
+        delete(EmailOutbox)
+        .where(col(EmailOutbox.status).in_(["sent", "failed"]))
+        .where(col(EmailOutbox.created_at) < cutoff)
+    )
+    result = session.exec(statement)  # type: ignore
+    session.commit()
+    return int(result.rowcount)
+
+
+class EmailWorker:
+    """
+    Background thread draining the outbox.
+
+    Keeps one SMTP connection open while there is work and closes it when the
+    queue is idle. ``wake`` makes it look for new emails immediately instead of
+    waiting for the next poll.
+    """
+
+    def __init__(self) -> None:
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="email-worker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def _purge(self) -> None:
+        try:
+            with Session(engine) as session:
+                purged = purge_old_emails(session)
+        except Exception:
+            logger.exception("Purging old emails failed")
+            return
+        if purged:
+            logger.info(f"Purged {purged} old emails from the outbox")
+
+    def _run(self) -> None:
+        backend: "SMTPBackend | None" = None
+        next_purge = 0.0
+        while not self._stopping.is_set():
+            if time.monotonic() >= next_purge:
+                self._purge()
+                next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+            tried = 0
+            if settings.emails_enabled:
+                backend = backend or get_smtp_backend()
+                try:
+                    with Session(engine) as session:
+                        tried = send_due_emails(session, backend)
+                except Exception:
+                    logger.exception("Sending queued emails failed")
+            if not tried:
+                if backend is not None:
+                    backend.close()
+                    backend = None
+                self._wakeup.wait(settings.EMAIL_QUEUE_POLL_SECONDS)
+                self._wakeup.clear()
+        if backend is not None:
+            backend.close()
+
+
+email_worker = EmailWorker()
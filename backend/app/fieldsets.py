@@ -0,0 +1,79 @@
+"""
+Sparse fieldsets.
+
+List, detail and graph endpoints take a ``fields`` query parameter, a comma
+separated list of the attributes to return (``?fields=id,name,userId``).
+Only those columns are selected and serialized, with a response model made
+for that set of fields the first time it is asked for and cached.
+"""
+from functools import lru_cache
+from typing import Any
+
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel, create_model
+
+FieldSet = tuple[str, ...]
+
+
+def fields_query(model: type[BaseModel]) -> Any:
+    """
+    The ``fields`` query parameter of an endpoint returning ``model``, as in
+    ``fields: Annotated[str | None, fields_query(Clients)] = None``.
+    """
+    return Query(
+        description="Comma separated attributes to return, of: "
+        + ", ".join(model.model_fields)
+    )
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> FieldSet | None:
+    """
+    The requested fields of ``model`` in its own order, so every set of
+    fields has one model whatever the order asked in, or None for all.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        raise HTTPException(status_code=400, detail="No fields requested")
+    unknown = requested - model.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return tuple(name for name in model.model_fields if name in requested)
+
+
+@lru_cache(maxsize=256)
+def sparse_model(model: type[BaseModel], fields: FieldSet) -> type[BaseModel]:
+    """
+    A model with only ``fields`` of ``model``, all of them required.
+    """
+    definitions: dict[str, Any] = {
+        name: (model.model_fields[name].annotation, ...) for name in fields
+    }
+    return create_model(f"{model.__name__}[{','.join(fields)}]", **definitions)
+
+
+@lru_cache(maxsize=256)
+def sparse_page_model(model: type[BaseModel], fields: FieldSet) -> type[BaseModel]:
+    """
+    A page of ``sparse_model(model, fields)``, ``data`` and ``count`` as in
+    the full list responses.
+    """
+    item = sparse_model(model, fields)
+    return create_model(
+        f"{item.__name__}Page",
+        data=(list[item], ...),  # type: ignore[valid-type]
+        count=(int, ...),
+    )
+
+
+def sparse_response(model: type[BaseModel], content: dict[str, Any]) -> Response:
+    """
+    ``content`` serialized by a sparse model. Returned as a response, the
+    endpoint's full ``response_model`` would ask for the missing fields.
+    """
+    return Response(
+        model.model_validate(content).model_dump_json(), media_type="application/json"
+    )
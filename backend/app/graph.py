@@ -0,0 +1,343 @@
+"""
+Connected component labelling and introduction paths for the client graph.
+
+Every client stores the id of the component it belongs to in ``componentId``.
+Relation inserts merge components in place (the smaller one is relabelled).
+Deletes can split a component, so they only clear the labels of the affected
+component; clients with a NULL ``componentId`` are relabelled lazily with a
+union-find pass the next time components are read.
+
+Introduction chains are the cheapest paths from reached clients to a target,
+found with a shortest path search over the neighbourhood of the target,
+loaded one hop at a time.
+"""
+import heapq
+from collections import defaultdict
+from collections.abc import Iterable
+
+from sqlalchemy import Integer, any_, bindparam, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import Session, col, func, select
+
+from app.models import ClientComponent, Clients, Relations
+
+
+class UnionFind:
+    """Disjoint sets with union by size and path compression."""
+
+    def __init__(self) -> None:
+        self.parent: dict[int, int] = {}
+        self.size: dict[int, int] = {}
+
+    def add(self, x: int) -> None:
+        if x not in self.parent:
+            self.parent[x] = x
+            self.size[x] = 1
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int) -> int:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+
+def invalidate_components(
+    session: Session, component_ids: Iterable[int | None]
+) -> None:
+    """
+    Clear the labels of whole components so they get recomputed on next read.
+    """
+    ids = {component_id for component_id in component_ids if component_id is not None}
+    if ids:
+        session.execute(
+            update(Clients)
+            .where(col(Clients.componentId).in_(ids))
+            .values(componentId=None)
+        )
+
+
+def merge_components(session: Session, from_client_pk: int, to_client_pk: int) -> None:
+    """
+    Update component labels after a relation between two clients was added.
+
+    Does not commit, so the caller can keep it in the same transaction as the
+    relation insert.
+    """
+    rows = session.exec(
+        select(Clients.id, Clients.componentId).where(
+            col(Clients.id).in_([from_client_pk, to_client_pk])
+        )
+    ).all()
+    labels = dict(rows)
+    from_component = labels.get(from_client_pk)
+    to_component = labels.get(to_client_pk)
+    if from_component == to_component:
+        return
+    if from_component is None or to_component is None:
+        # One side is already waiting for a recompute, pull the other one in so
+        # unlabelled clients never have edges into labelled components
+        invalidate_components(session, [from_component, to_component])
+        return
+
+    sizes = dict(
+        session.exec(
+            select(Clients.componentId, func.count())
+            .where(col(Clients.componentId).in_([from_component, to_component]))
+            .group_by(col(Clients.componentId))
+        ).all()
+    )
+    keep, relabel = from_component, to_component
+    if sizes.get(keep, 0) < sizes.get(relabel, 0):
+        keep, relabel = relabel, keep
+    session.execute(
+        update(Clients)
+        .where(col(Clients.componentId) == relabel)
+        .values(componentId=keep)
+    )
+
+
+def join_components(
+    session: Session, client: Clients, neighbour_components: Iterable[int | None]
+) -> None:
+    """
+    Label a new client related to clients of the given components.
+
+    All of them end up in the largest one, as merge_components would do for
+    every relation one by one, but with a fixed number of statements. Does not
+    commit.
+    """
+    components = set(neighbour_components)
+    if not components:
+        client.componentId = client.id
+        return
+    if None in components:
+        invalidate_components(session, components)
+        client.componentId = None
+        return
+
+    sizes = dict(
+        session.exec(
+            select(Clients.componentId, func.count())
+            .where(col(Clients.componentId).in_(components))
+            .group_by(col(Clients.componentId))
+        ).all()
+    )
+    keep = max(components, key=lambda component: sizes.get(component, 0))
+    if len(components) > 1:
+        session.execute(
+            update(Clients)
+            .where(col(Clients.componentId).in_(components - {keep}))
+            .values(componentId=keep)
+        )
+    client.componentId = keep
+
+
+def refresh_components(session: Session) -> int:
+    """
+    Label every client whose componentId is NULL and commit.
+
+    Unlabelled clients only have edges among themselves, so only their
+    relations are loaded. Returns the number of relabelled clients.
+    """
+    client_ids = [
+        client_id
+        for client_id in session.exec(
+            select(Clients.id).where(col(Clients.componentId).is_(None))
+        ).all()
+        if client_id is not None
+    ]
+    if not client_ids:
+        return 0
+
+    sets = UnionFind()
+    for client_id in client_ids:
+        sets.add(client_id)
+
+    edges = session.exec(
+        select(Relations.from_client_pk, Relations.to_client_pk)
+        .join(Clients, col(Relations.from_client_pk) == col(Clients.id))
+        .where(col(Clients.componentId).is_(None))
+    ).all()
+    for from_client_pk, to_client_pk in edges:
+        if from_client_pk in sets.parent and to_client_pk in sets.parent:
+            sets.union(from_client_pk, to_client_pk)
+
+    session.execute(
+        update(Clients),
+        [
+            {"id": client_id, "componentId": sets.find(client_id)}
+            for client_id in client_ids
+        ],
+    )
+    session.commit()
+    return len(client_ids)
+
+
+def get_components(
+    session: Session, skip: int = 0, limit: int = 100
+) -> tuple[list[ClientComponent], int]:
+    """
+    Return components ordered by size (largest first) and the total number of them.
+    """
+    refresh_components(session)
+
+    count = session.exec(select(func.count(func.distinct(Clients.componentId)))).one()
+    size = func.count().label("size")
+    rows = session.exec(
+        select(Clients.componentId, size)
+        .group_by(col(Clients.componentId))
+        .order_by(size.desc(), col(Clients.componentId))
+        .offset(skip)
+        .limit(limit)
+    ).all()
+    data = [
+        ClientComponent(componentId=component_id, size=component_size)
+        for component_id, component_size in rows
+    ]
+    return data, count
+
+
+# Longest introduction chain searched, in relations. The neighbourhood loaded
+# grows quickly with it
+MAX_INTRODUCTION_DEPTH = 6
+
+
+class NeighbourhoodTooLarge(Exception):
+    pass
+
+
+class Neighbourhood:
+    """Clients within some hops of a target, with the relations among them."""
+
+    def __init__(self) -> None:
+        self.neighbours: dict[int, set[int]] = defaultdict(set)
+        self.how_hard_to_reach: dict[int, int] = {}
+        self.reached: set[int] = set()
+
+    def add_client(
+        self, client_pk: int, how_hard_to_reach: int | None, is_reached: int | None
+    ) -> None:
+        self.how_hard_to_reach[client_pk] = max(how_hard_to_reach or 0, 0)
+        if is_reached == 1:
+            self.reached.add(client_pk)
+
+
+def load_neighbourhood(
+    session: Session, target: Clients, depth: int, max_relations: int
+) -> Neighbourhood:
+    """
+    Load the clients up to ``depth`` relations away from the target, one query
+    per hop. Paths don't continue past reached clients, so neither does this.
+
+    Raises ``NeighbourhoodTooLarge`` rather than load more than
+    ``max_relations`` relations: each hop can multiply them in dense graphs.
+    """
+    assert target.id is not None
+    neighbourhood = Neighbourhood()
+    neighbourhood.add_client(target.id, target.howHardToReach, target.isReached)
+    frontier = [target.id]
+    loaded = 0
+    for _ in range(depth):
+        if not frontier:
+            break
+        frontier_param = bindparam("frontier", frontier, type_=ARRAY(Integer))
+        # Both directions as (near, other) pairs. One query per direction is
+        # much faster than an OR for large frontiers
+        pairs = union_all(
+            select(
+                col(Relations.from_client_pk).label("near"),
+                col(Relations.to_client_pk).label("other"),
+            ).where(col(Relations.from_client_pk) == any_(frontier_param)),
+            select(Relations.to_client_pk, Relations.from_client_pk).where(
+                col(Relations.to_client_pk) == any_(frontier_param)
+            ),
+        ).subquery()
+        # Plain rows, without the ORM's per row overhead: there can be many
+        rows = (
+            session.connection()
+            .execute(
+                select(
+                    pairs.c.near,
+                    pairs.c.other,
+                    Clients.howHardToReach,
+                    Clients.isReached,
+                )
+                .join(Clients, col(Clients.id) == pairs.c.other)
+                .limit(max_relations - loaded + 1)
+            )
+            .all()
+        )
+        loaded += len(rows)
+        if loaded > max_relations:
+            raise NeighbourhoodTooLarge
+
+        frontier = []
+        for near_pk, other_pk, how_hard_to_reach, is_reached in rows:
+            neighbourhood.neighbours[near_pk].add(other_pk)
+            neighbourhood.neighbours[other_pk].add(near_pk)
+            if other_pk not in neighbourhood.how_hard_to_reach:
+                neighbourhood.add_client(other_pk, how_hard_to_reach, is_reached)
+                if other_pk not in neighbourhood.reached:
+                    frontier.append(other_pk)
+    return neighbourhood
+
+
+def find_introductions(
+    neighbourhood: Neighbourhood, target_pk: int, k: int, max_depth: int
+) -> list[tuple[int, list[int]]]:
+    """
+    The ``k`` cheapest introduction chains to the target, one per reached
+    client, as (cost, client keys from the reached client to the target).
+
+    The cost of a chain is the sum of howHardToReach of the clients between
+    its ends; equally cheap chains come shortest first. Searching backwards
+    from the target gives the same paths as a search from all reached clients
+    at once, and stops after the k-th of them. A client is searched again
+    when found in fewer hops, so a cheap but long path to it doesn't hide a
+    shorter one that still fits in ``max_depth``. Chains never pass through
+    another reached client: that one would be the better introduction.
+    """
+    # Search labels: (client, label of the next client towards the target)
+    labels: list[tuple[int, int | None]] = []
+    fewest_hops: dict[int, int] = {}
+    heap: list[tuple[int, int, int, int | None]] = [(0, 0, target_pk, None)]
+    chains: list[tuple[int, list[int]]] = []
+    found: set[int] = set()
+    while heap and len(chains) < k:
+        cost, hops, client_pk, towards_target = heapq.heappop(heap)
+        if hops >= fewest_hops.get(client_pk, max_depth + 1):
+            continue
+        fewest_hops[client_pk] = hops
+        labels.append((client_pk, towards_target))
+        label: int | None = len(labels) - 1
+
+        if client_pk != target_pk and client_pk in neighbourhood.reached:
+            if client_pk not in found:
+                found.add(client_pk)
+                chain = []
+                while label is not None:
+                    chain_pk, label = labels[label]
+                    chain.append(chain_pk)
+                chains.append((cost, chain))
+            continue
+        if hops == max_depth:
+            continue
+
+        step = (
+            0 if client_pk == target_pk else neighbourhood.how_hard_to_reach[client_pk]
+        )
+        for neighbour_pk in neighbourhood.neighbours[client_pk]:
+            heapq.heappush(heap, (cost + step, hops + 1, neighbour_pk, label))
+    return chains
@@ -0,0 +1,231 @@
+"""
+Compact graph payloads.
+
+Instead of one object per relation repeating both clients' name and image,
+graph endpoints return a node table with every client listed once and the
+edges as parallel arrays of indexes into it (see ``ClientGraph``). Clients
+asking for ``application/msgpack`` in their ``Accept`` header get the same
+structure encoded as MessagePack, which is smaller and faster to decode than
+JSON for large neighbourhoods.
+
+Group graphs are cached per process under the group's version, which database
+triggers bump on every change to the group, so entries never go stale. They
+are cached encoded, with their compressed variants (see ``app.compression``).
+"""
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable, Sequence
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+import msgpack
+from fastapi import Request, Response
+from pydantic import BaseModel, create_model
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from app.compression import PrecompressedBody
+from app.core.config import settings
+from app.fieldsets import FieldSet, sparse_model
+from app.models import ClientGraph, GraphEdges, GraphNodes, RelationsListing
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+
+# For the ``responses`` argument of graph routes, documents the binary variant
+GRAPH_RESPONSES: dict[int | str, dict[str, Any]] = {
+    200: {
+        "content": {MSGPACK_MEDIA_TYPE: {}},
+        "description": f"JSON, or MessagePack with `Accept: {MSGPACK_MEDIA_TYPE}`",
+    }
+}
+
+
+NODE_FIELDS: FieldSet = tuple(GraphNodes.model_fields)
+# The relations_listing columns holding each node field, of the from and the
+# to side
+NODE_COLUMNS = {
+    "userId": ("fromClientId", "toClientId"),
+    "name": ("from_client_name", "to_client_name"),
+    "instagram": ("fromClientInstagram", "toClientInstagram"),
+}
+
+
+def relation_columns(node_fields: FieldSet) -> LoaderOption:
+    """
+    Loads only the relations_listing columns a graph with ``node_fields``
+    needs. GraphBuilder never touches the others.
+    """
+    node_columns = [column for name in node_fields for column in NODE_COLUMNS[name]]
+    return load_only(
+        *(
+            getattr(RelationsListing, column)
+            for column in (
+                "id",
+                "from_client_pk",
+                "to_client_pk",
+                "status",
+                *node_columns,
+            )
+        )
+    )
+
+
+class GraphBuilder:
+    """
+    Collects nodes and edges, each node and each relation once. Nodes only
+    get the ``node_fields`` columns, the others stay empty.
+    """
+
+    def __init__(self, node_fields: FieldSet = NODE_FIELDS) -> None:
+        self.node_fields = node_fields
+        self.nodes = GraphNodes()
+        self.edges = GraphEdges()
+        self._node_index: dict[int, int] = {}
+        self._edge_ids: set[int] = set()
+        self._node_lists = [getattr(self.nodes, name) for name in node_fields]
+
+    def add_node(self, client_pk: int, values: Sequence[Any]) -> int:
+        """
+        Add a node with its ``node_fields`` values, in that order.
+        """
+        index = self._node_index.get(client_pk)
+        if index is None:
+            index = self._node_index[client_pk] = len(self._node_index)
+            for node_list, value in zip(self._node_lists, values, strict=True):
+                node_list.append(value)
+        return index
+
+    def _add_relation_end(
+        self, client_pk: int, relation: RelationsListing, side: int
+    ) -> int:
+        index = self._node_index.get(client_pk)
+        if index is None:
+            values = [
+                getattr(relation, NODE_COLUMNS[name][side]) for name in self.node_fields
+            ]
+            index = self.add_node(client_pk, values)
+        return index
+
+    def add_relation(self, relation: RelationsListing, depth: int) -> None:
+        if relation.id in self._edge_ids:
+            return
+        self._edge_ids.add(relation.id)
+        source = self._add_relation_end(relation.from_client_pk, relation, 0)
+        target = self._add_relation_end(relation.to_client_pk, relation, 1)
+        self.edges.id.append(relation.id)
+        self.edges.source.append(source)
+        self.edges.target.append(target)
+        self.edges.status.append(relation.status)
+        self.edges.depth.append(depth)
+
+    def add_relations(self, relations: Iterable[RelationsListing], depth: int) -> None:
+        for relation in relations:
+            self.add_relation(relation, depth)
+
+    def build(self, count: int) -> ClientGraph:
+        return ClientGraph(nodes=self.nodes, edges=self.edges, count=count)
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class GraphCache:
+    """
+    Least recently used encoded graphs, with the same ``cache_info`` as
+    ``functools.lru_cache`` so the cache shows up in the metrics.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._graphs: OrderedDict[Hashable, PrecompressedBody] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> PrecompressedBody | None:
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._graphs.move_to_end(key)
+            return graph
+
+    def put(self, key: Hashable, graph: PrecompressedBody) -> None:
+        with self._lock:
+            self._graphs[key] = graph
+            self._graphs.move_to_end(key)
+            while len(self._graphs) > self.maxsize:
+                self._graphs.popitem(last=False)
+
+    def cache_info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._graphs))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graphs.clear()
+            self.hits = self.misses = 0
+
+
+group_graph_cache = GraphCache(settings.GROUP_GRAPH_CACHE_SIZE)
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def graph_media_type(request: Request) -> str:
+    return MSGPACK_MEDIA_TYPE if wants_msgpack(request) else "application/json"
+
+
+@lru_cache(maxsize=64)
+def sparse_graph_model(
+    graph_model: type[ClientGraph], node_fields: FieldSet
+) -> type[BaseModel]:
+    """
+    ``graph_model`` with only the ``node_fields`` node columns.
+    """
+    definitions: dict[str, Any] = {
+        name: (field.annotation, ...)
+        for name, field in graph_model.model_fields.items()
+    }
+    definitions["nodes"] = (sparse_model(GraphNodes, node_fields), ...)
+    return create_model(
+        f"{graph_model.__name__}[{','.join(node_fields)}]", **definitions
+    )
+
+
+def encode_graph(
+    graph: ClientGraph, media_type: str, node_fields: FieldSet = NODE_FIELDS
+) -> bytes:
+    model: BaseModel = graph
+    if node_fields != NODE_FIELDS:
+        model = sparse_graph_model(type(graph), node_fields).model_validate(
+            graph.model_dump()
+        )
+    if media_type == MSGPACK_MEDIA_TYPE:
+        packed: bytes = msgpack.packb(model.model_dump())
+        return packed
+    return model.model_dump_json().encode()
+
+
+def graph_response(
+    request: Request, graph: ClientGraph, node_fields: FieldSet = NODE_FIELDS
+) -> Response:
+    """
+    The graph as MessagePack if the client accepts it, else as JSON.
+    """
+    media_type = graph_media_type(request)
+    return Response(
+        encode_graph(graph, media_type, node_fields),
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
@@ -1,9 +1,11 @@
-import requests
 import os
 from urllib.parse import urlparse, unquote
 
 
 def download_image(url, save_name):
+    # requests is slow to import and only needed here, keep it out of startup
+    import requests
+
     save_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../static")
     print(save_directory)
 
@@ -1,13 +1,21 @@
 import base64
 import os
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 
-import sentry_sdk
 from fastapi import FastAPI, HTTPException
 from fastapi.routing import APIRoute
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.main import api_router
 from app.core.config import settings
+from app.core.replicas import ReadYourWritesMiddleware, replicas
+from app.change_feed import change_feed
+from app.core.revocations import token_revocations
+from app.compression import CompressionMiddleware
+from app.email_queue import email_worker
+from app.metrics import PrometheusMiddleware, metrics
+from app.query_stats import QueryStatsMiddleware
 from starlette.responses import JSONResponse
 
 
@@ -16,12 +24,28 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 
 
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
+    import sentry_sdk
+
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    email_worker.start()
+    change_feed.start()
+    replicas.start()
+    token_revocations.start()
+    yield
+    token_revocations.stop()
+    replicas.stop()
+    change_feed.stop()
+    email_worker.stop()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 origins = [
@@ -38,6 +62,20 @@ if settings.BACKEND_CORS_ORIGINS:
         expose_headers=["*"],
     )
 
+# Inside the other middlewares, the metrics record the compressed sizes
+if settings.COMPRESSION_MINIMUM_SIZE is not None:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MINIMUM_SIZE)
+
+if replicas.engines:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+app.add_middleware(QueryStatsMiddleware, routes=app.routes)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(PrometheusMiddleware, routes=app.routes)
+    # Not under /api, so it isn't routed to from outside the Docker network
+    app.add_route("/metrics", metrics, include_in_schema=False)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 # Correctly locate the static files directory
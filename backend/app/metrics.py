@@ -0,0 +1,262 @@
+"""
+Prometheus metrics.
+
+``PrometheusMiddleware`` records request counts, latency, in-flight requests
+and response sizes per route, labelled with the route's unique id (the same
+``<tag>-<name>`` used for the OpenAPI operation ids). ``AppCollector`` reports
+the database connection pool, in-process caches and the email queue whenever
+``/metrics`` is scraped.
+
+Metrics are kept per process. When running several workers, point
+``PROMETHEUS_MULTIPROCESS_DIR`` to an empty directory shared by them to
+aggregate the request metrics over all workers.
+"""
+import logging
+import os
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine, func
+from sqlmodel import Session, col, select
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.db import engine
+from app.core.replicas import replicas
+from app.email_queue import email_worker
+from app.fieldsets import sparse_model
+from app.graph_payload import group_graph_cache
+from app.models import EmailOutbox
+from app.utils import get_email_templates
+
+logger = logging.getLogger(__name__)
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route, method and status code.",
+    ["route", "method", "status"],
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response body has been sent.",
+    ["route", "method"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled.",
+    ["route", "method"],
+    multiprocess_mode="livesum",
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Size of the response body.",
+    ["route", "method"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000),
+)
+
+# Requests not matching any route, labelled together to bound the cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_label(route: BaseRoute) -> str:
+    # APIRoute.unique_id comes from custom_generate_unique_id
+    label = getattr(route, "unique_id", None) or getattr(route, "name", None)
+    return str(label or UNMATCHED_ROUTE)
+
+
+def find_route_label(routes: list[BaseRoute], scope: Scope) -> str:
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route_label(route)
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    # Partial matches are answered with 405 by the route's path
+    return route_label(partial) if partial is not None else UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware timing every HTTP request until its last body chunk.
+
+    Streaming responses are measured as they are sent, nothing is buffered.
+    """
+
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]) -> None:
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (find_route_label(self.routes, scope), scope["method"])
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(*labels)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(*labels).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(*labels).observe(size)
+            REQUESTS.labels(*labels, str(status)).inc()
+            in_progress.dec()
+
+
+# functools.lru_cache functions (or objects with the same cache_info) reported
+# as caches, by name
+CACHES: dict[str, Any] = {
+    "email_templates": get_email_templates,
+    "group_graphs": group_graph_cache,
+    "sparse_models": sparse_model,
+}
+
+
+class AppCollector(Collector):
+    """
+    Gauges read when metrics are collected: connection pool, replicas, caches,
+    email queue.
+    """
+
+    def __init__(self, db_engine: Engine = engine) -> None:
+        self.db_engine = db_engine
+
+    def describe(self) -> Iterator[Any]:
+        # Without it, registering collects once, querying the email queue on
+        # import
+        return iter(())
+
+    def collect(self) -> Iterator[Any]:
+        yield from self.collect_pool()
+        yield from self.collect_replicas()
+        yield from self.collect_caches()
+        yield from self.collect_email_queue()
+
+    def collect_pool(self) -> Iterator[Any]:
+        pool: Any = self.db_engine.pool
+        # Only QueuePool keeps these counters, e.g. SQLite's StaticPool doesn't
+        if not hasattr(pool, "checkedout"):
+            return
+        for name, documentation, value in [
+            ("db_pool_size", "Configured pool size.", pool.size()),
+            ("db_pool_checked_out", "Connections in use.", pool.checkedout()),
+            ("db_pool_checked_in", "Idle connections.", pool.checkedin()),
+            (
+                "db_pool_overflow",
+                "Connections opened beyond the pool size.",
+                pool.overflow(),
+            ),
+        ]:
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+    def collect_replicas(self) -> Iterator[Any]:
+        if not replicas.engines:
+            return
+        healthy = GaugeMetricFamily(
+            "db_replica_healthy",
+            "Read replicas in use (1) or skipped (0).",
+            labels=["replica"],
+        )
+        for index, ok in enumerate(replicas.healthy):
+            healthy.add_metric([str(index)], int(ok))
+        yield healthy
+
+    def collect_caches(self) -> Iterator[Any]:
+        hits = CounterMetricFamily("app_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily(
+            "app_cache_misses", "Cache misses.", labels=["cache"]
+        )
+        size = GaugeMetricFamily(
+            "app_cache_size", "Entries in the cache.", labels=["cache"]
+        )
+        for name, cached in CACHES.items():
+            info = cached.cache_info()
+            hits.add_metric([name], info.hits)
+            misses.add_metric([name], info.misses)
+            size.add_metric([name], info.currsize)
+        yield from (hits, misses, size)
+
+    def collect_email_queue(self) -> Iterator[Any]:
+        yield GaugeMetricFamily(
+            "email_worker_running",
+            "Whether this process runs the email queue worker.",
+            value=int(email_worker.running),
+        )
+        try:
+            with Session(self.db_engine) as session:
+                counts = session.exec(
+                    select(
+                        EmailOutbox.status,
+                        func.count(),
+                        func.min(EmailOutbox.next_attempt_at),
+                    )
+                    # Sent emails are kept for a while, only count the open ones
+                    .where(col(EmailOutbox.status).in_(["pending", "failed"]))
+                    .group_by(col(EmailOutbox.status))
+                ).all()
+        except Exception:
+            logger.exception("Reading the email queue for metrics failed")
+            return
+        emails = GaugeMetricFamily(
+            "email_queue_emails", "Emails in the outbox by status.", labels=["status"]
+        )
+        oldest_pending = 0.0
+        for status, count, next_attempt_at in counts:
+            emails.add_metric([status], count)
+            if status == "pending" and next_attempt_at is not None:
+                oldest_pending = max(
+                    (datetime.utcnow() - next_attempt_at).total_seconds(), 0
+                )
+        yield emails
+        yield GaugeMetricFamily(
+            "email_queue_oldest_pending_seconds",
+            "How long the most overdue pending email has been waiting.",
+            value=oldest_pending,
+        )
+
+
+app_collector = AppCollector()
+REGISTRY.register(app_collector)
+
+
+def get_registry() -> CollectorRegistry:
+    if "PROMETHEUS_MULTIPROCESS_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)  # type: ignore[no-untyped-call]
+    registry.register(app_collector)
+    return registry
+
+
+def metrics(_request: Request) -> Response:
+    return Response(generate_latest(get_registry()), media_type=CONTENT_TYPE_LATEST)
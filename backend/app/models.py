@@ -1,5 +1,7 @@
+from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Column, Computed, Integer
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -103,11 +105,32 @@ class Message(SQLModel):
 class Token(SQLModel):
     access_token: str
     token_type: str = "bearer"
+    # With ACCESS_TOKEN_CLAIMS, to get new tokens from /login/refresh-token
+    refresh_token: str | None = None
+
+
+class TokenRefresh(SQLModel):
+    refresh_token: str
 
 
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: int | None = None
+    iat: float | None = None
+    # "refresh" for refresh tokens
+    typ: str | None = None
+    # Claims of self-contained access tokens
+    email: str | None = None
+    is_active: bool | None = None
+    is_superuser: bool | None = None
+
+
+# The user as known from the access token, without a database query
+class TokenClaims(SQLModel):
+    id: int
+    email: str
+    is_active: bool
+    is_superuser: bool
 
 
 class NewPassword(SQLModel):
@@ -115,6 +138,23 @@ class NewPassword(SQLModel):
     new_password: str
 
 
+# Outgoing emails waiting to be sent by app.email_queue
+class EmailOutbox(SQLModel, table=True):
+    __tablename__ = "email_outbox"
+
+    id: int | None = Field(default=None, primary_key=True)
+    email_to: str
+    subject: str
+    html_content: str
+    # pending, sent or failed (gave up after EMAIL_QUEUE_MAX_ATTEMPTS)
+    status: str = Field(default="pending")
+    attempts: int = 0
+    last_error: str | None = None
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: datetime | None = None
+
+
 class ClientBase(SQLModel):
     id: int | None = Field(default=None, primary_key=True)
     name: str
@@ -144,6 +184,20 @@ class ClientCreate(ClientBase):
     groupName: str | None = Field(default=None)
 
 
+# Rank of a client in the "next to reach" queue, higher first: important, easy
+# to reach clients open for connections with reached clients among their
+# neighbours. NULL once reached. A generated column, so writes to the inputs
+# (patch_client, relation triggers maintaining reachedNeighbours) update it
+NEXT_SCORE = """
+CASE WHEN "isReached" = 1 THEN NULL ELSE
+    100 * COALESCE(priority, 0)
+    - 40 * COALESCE("howHardToReach", 0)
+    + CASE "openForConnections" WHEN 1 THEN 50 WHEN 2 THEN 20 ELSE 0 END
+    + 30 * CASE WHEN "reachedNeighbours" > 5 THEN 5 ELSE "reachedNeighbours" END
+END
+"""
+
+
 # Database model, database table inferred from class name
 class Clients(ClientBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
@@ -160,6 +214,13 @@ class Clients(ClientBase, table=True):
     parameterTwo: str | None = Field(default=None)
     parameterThree: str | None = Field(default=None)
     groupName: str | None = Field(default=None)
+    componentId: int | None = Field(default=None, index=True)
+    # Relations to clients with isReached = 1, maintained by database triggers
+    reachedNeighbours: int = Field(default=0)
+    nextScore: int | None = Field(
+        default=None,
+        sa_column=Column("nextScore", Integer, Computed(NEXT_SCORE, persisted=True)),
+    )
 
 
 class ClientsPublic(SQLModel):
@@ -182,6 +243,56 @@ class ClientPublic(ClientBase):
     parameterTwo: str | None = Field(default=None)
     parameterThree: str | None = Field(default=None)
     groupName: str | None = Field(default=None)
+    componentId: int | None = Field(default=None)
+
+
+class ClientNext(ClientPublic):
+    reachedNeighbours: int
+    nextScore: int
+
+
+class ClientsNextPublic(SQLModel):
+    # No total: counting the whole queue would cost more than reading a page
+    data: list[ClientNext]
+
+
+class IntroductionChain(SQLModel):
+    # Sum of howHardToReach of the clients between the two ends
+    cost: int
+    # From the reached client to the target
+    clients: list[ClientPublic]
+
+
+class IntroductionsPublic(SQLModel):
+    data: list[IntroductionChain]
+    count: int
+
+
+# Most clients looked up by one POST /clients/batch, of each kind of key
+MAX_BATCH_LOOKUP = 5000
+
+
+class ClientsBatchLookup(SQLModel):
+    userIds: list[str] = Field(default=[], max_length=MAX_BATCH_LOOKUP)
+    ids: list[int] = Field(default=[], max_length=MAX_BATCH_LOOKUP)
+
+
+class ClientsBatchPublic(SQLModel):
+    # The clients found, by the key they were asked for
+    byUserId: dict[str, ClientPublic]
+    byId: dict[int, ClientPublic]
+    missingUserIds: list[str]
+    missingIds: list[int]
+
+
+class ClientComponent(SQLModel):
+    componentId: int
+    size: int
+
+
+class ClientComponentsPublic(SQLModel):
+    data: list[ClientComponent]
+    count: int
 
 
 class ClientUpdate(ClientBase):
@@ -210,9 +321,30 @@ class Relations(RelationsBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     fromClientId: str
     toClientId: str
+    # clients.id of both sides, the keys graph queries join and filter on.
+    # Filled in by a trigger when only the userIds are given
+    from_client_pk: int | None = Field(default=None, foreign_key="clients.id", index=True)
+    to_client_pk: int | None = Field(default=None, foreign_key="clients.id", index=True)
     status: int | None = Field(default=1)
 
 
+# Denormalised relation rows with both clients' name and image, kept in sync by
+# database triggers (see the relations_listing migration), read-only from the app
+class RelationsListing(SQLModel, table=True):
+    __tablename__ = "relations_listing"
+
+    id: int = Field(primary_key=True, foreign_key="relations.id")
+    fromClientId: str
+    toClientId: str
+    from_client_pk: int = Field(index=True)
+    to_client_pk: int = Field(index=True)
+    status: int | None = Field(default=1)
+    from_client_name: str
+    to_client_name: str
+    fromClientInstagram: str | None = Field(default=None)
+    toClientInstagram: str | None = Field(default=None)
+
+
 class RelationPublic(RelationsBase):
     id: int
     fromClientId: str
@@ -230,6 +362,47 @@ class RelationsPublic(SQLModel):
     count: int
 
 
+# Compact graph payload: every node listed once, edges as parallel arrays of
+# indexes into the node table
+class GraphNodes(SQLModel):
+    userId: list[str] = []
+    name: list[str] = []
+    instagram: list[str | None] = []
+
+
+class GraphEdges(SQLModel):
+    id: list[int] = []
+    source: list[int] = []
+    target: list[int] = []
+    status: list[int | None] = []
+    # 1 for the client's own relations, 2 for the relations of its neighbours
+    depth: list[int] = []
+
+
+class ClientGraph(SQLModel):
+    nodes: GraphNodes
+    edges: GraphEdges
+    # Total number of the client's own relations, edges only holds one page
+    count: int
+
+
+class GroupGraph(ClientGraph):
+    # Bumped by database triggers whenever the group's graph changes
+    version: int
+    # The first ``members`` nodes are the group members on this page, the
+    # others are the far ends of edges from them
+    members: int
+
+
+# Version of each groupName's graph, maintained by database triggers (see the
+# client_groups migration), read-only from the app
+class ClientGroup(SQLModel, table=True):
+    __tablename__ = "client_groups"
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=1)
+
+
 class RelationsCreate(SQLModel):
     fromClientUsername: str
     toClientUsername: str
@@ -241,3 +414,18 @@ class RelationsUpdate(RelationsBase):
 
 class RelationWithRelations(RelationPublic):
     relations: list[RelationPublic] = []
+
+
+class SlowQuery(SQLModel):
+    statement: str
+    parameters: str
+    duration_ms: float
+    route: str | None
+    created_at: datetime
+    # EXPLAIN (ANALYZE, BUFFERS) output, for the sampled SELECT statements
+    plan: str | None = None
+
+
+class SlowQueriesPublic(SQLModel):
+    data: list[SlowQuery]
+    count: int
@@ -0,0 +1,183 @@
+"""
+Per-request SQL statistics.
+
+SQLAlchemy engine events count the statements executed, the time spent in
+the database and the rows returned while a request is handled.
+``QueryStatsMiddleware`` reports them in a ``Server-Timing`` response header
+and one log line per request, and warns when the same statement runs many
+times in one request, the usual sign of an N+1 query.
+
+Endpoints can declare how many statements they may execute with
+``query_budget``. Going over it is logged, or raises ``QueryBudgetExceeded``
+when ``QUERY_BUDGET_ENFORCED`` is set (as in the tests).
+"""
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.routing import BaseRoute
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.metrics import find_route_label
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class QueryStats:
+    queries: int = 0
+    duration: float = 0.0
+    rows: int = 0
+    statements: Counter[str] = field(default_factory=Counter)
+    route: str | None = None
+
+    def most_repeated(self) -> tuple[str, int] | None:
+        if not self.statements:
+            return None
+        return self.statements.most_common(1)[0]
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    _conn: Any,
+    _cursor: Any,
+    _statement: str,
+    _parameters: Any,
+    context: Any,
+    _many: bool,
+) -> None:
+    if _current_stats.get() is not None:
+        context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    _conn: Any, cursor: Any, statement: str, _parameters: Any, context: Any, _many: bool
+) -> None:
+    stats = _current_stats.get()
+    start = getattr(context, "query_start", None)
+    if stats is None or start is None:
+        return
+    stats.duration += time.perf_counter() - start
+    stats.queries += 1
+    stats.rows += max(cursor.rowcount, 0)
+    stats.statements[statement] += 1
+
+
+def current_route() -> str | None:
+    """
+    Label of the route whose request is being handled, if any.
+    """
+    stats = _current_stats.get()
+    return stats.route if stats is not None else None
+
+
+@contextmanager
+def capture_queries(route: str | None = None) -> Generator[QueryStats, None, None]:
+    """
+    Collect statistics for the statements executed inside the block.
+
+    Statements run in threads started from the block count as well, as long as
+    they copy the context (like Starlette's threadpool for sync endpoints).
+    """
+    stats = QueryStats(route=route)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(queries: int) -> Callable[[F], F]:
+    """
+    Declare the maximum number of statements an endpoint executes per request.
+
+    Put it below the route decorator:
+
+        @router.get("/")
+        @query_budget(2)
+        def get_clients(...): ...
+    """
+
+    def decorate(endpoint: F) -> F:
+        endpoint.query_budget = queries  # type: ignore[attr-defined]
+        return endpoint
+
+    return decorate
+
+
+def server_timing(stats: QueryStats) -> str:
+    return f'db;dur={stats.duration * 1000:.1f};desc="{stats.queries} queries"'
+
+
+class QueryStatsMiddleware:
+    def __init__(self, app: ASGIApp, routes: list[BaseRoute]) -> None:
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Statements run after this point (e.g. closing the session)
+                # only show up in the log line
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing(stats))
+            await send(message)
+
+        route = find_route_label(self.routes, scope)
+        with capture_queries(route) as stats:
+            await self.app(scope, receive, send_wrapper)
+        self.report(scope, route, stats)
+
+    def report(self, scope: Scope, route: str, stats: QueryStats) -> None:
+        logger.info(
+            f"{scope['method']} {route}: {stats.queries} queries, "
+            f"{stats.duration * 1000:.1f} ms, {stats.rows} rows",
+            extra={
+                "route": route,
+                "db_queries": stats.queries,
+                "db_time_ms": round(stats.duration * 1000, 3),
+                "db_rows": stats.rows,
+            },
+        )
+
+        repeated = stats.most_repeated()
+        if repeated and repeated[1] >= settings.QUERY_REPEATED_WARNING:
+            statement, times = repeated
+            logger.warning(
+                f"Possible N+1 query in {route}, statement executed {times} times: "
+                f"{statement}"
+            )
+
+        # The router stores the matched endpoint in the (shared) scope
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        if budget is not None and stats.queries > budget:
+            message = (
+                f"{route} executed {stats.queries} queries, its budget is {budget}"
+            )
+            if settings.QUERY_BUDGET_ENFORCED:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
@@ -0,0 +1,154 @@
+"""
+Slow query log.
+
+Statements executed through the app's engine that take longer than
+``SLOW_QUERY_THRESHOLD_MS`` are logged with their parameters, duration and
+the route that ran them, and kept in an in-memory ring buffer of the last
+``SLOW_QUERY_LOG_SIZE`` entries (per process), served to superusers on
+``/utils/slow-queries/``. Values bound to ``REDACTED_COLUMNS`` are left out.
+
+For a sample (``SLOW_QUERY_EXPLAIN_SAMPLE_RATE``) of the slow SELECT
+statements an ``EXPLAIN (ANALYZE, BUFFERS)`` plan is captured on a background
+thread, on its own connection and in a transaction that is rolled back, so the
+request that ran the statement doesn't wait for it. Other statements are
+never explained: ANALYZE executes them.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Engine, event
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import SlowQuery
+from app.query_stats import current_route
+
+logger = logging.getLogger(__name__)
+
+# Parameters can be whole CSV rows or long texts, keep the log readable
+MAX_PARAMETERS_LENGTH = 1_000
+# Values bound to these columns are never logged: password hashes, and email
+# bodies holding passwords of new accounts and password reset links
+REDACTED_COLUMNS = frozenset({"hashed_password", "html_content"})
+REDACTED = "<redacted>"
+
+
+def redact_parameters(parameters: Any) -> Any:
+    """
+    The parameters with the values bound to ``REDACTED_COLUMNS`` replaced,
+    also in the numbered ones of multi-row inserts (``hashed_password__0``).
+    """
+    if isinstance(parameters, dict):
+        return {
+            name: REDACTED if re.sub(r"__\d+$", "", name) in REDACTED_COLUMNS else value
+            for name, value in parameters.items()
+        }
+    if isinstance(parameters, list | tuple):
+        return type(parameters)(redact_parameters(item) for item in parameters)
+    return parameters
+
+
+class SlowQueryLog:
+    def __init__(self, db_engine: Engine) -> None:
+        self.db_engine = db_engine
+        self._entries: deque[SlowQuery] = deque(maxlen=settings.SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
+        # One thread: plans are a debugging aid and must not load the database
+        self._explain_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="explain"
+        )
+
+    def entries(self) -> list[SlowQuery]:
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def record(self, statement: str, parameters: Any, duration: float) -> SlowQuery:
+        entry = SlowQuery(
+            statement=statement,
+            parameters=repr(redact_parameters(parameters))[:MAX_PARAMETERS_LENGTH],
+            duration_ms=round(duration * 1000, 3),
+            route=current_route(),
+            created_at=datetime.utcnow(),
+        )
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            f"Slow query ({entry.duration_ms} ms) in {entry.route}: {statement} "
+            f"with {entry.parameters}"
+        )
+        if self.should_explain(statement):
+            self._explain_executor.submit(self.explain, entry, statement, parameters)
+        return entry
+
+    def should_explain(self, statement: str) -> bool:
+        return (
+            self.db_engine.dialect.name == "postgresql"
+            and statement.lstrip()[:6].upper() == "SELECT"
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+        )
+
+    def explain(self, entry: SlowQuery, statement: str, parameters: Any) -> None:
+        try:
+            with self.db_engine.connect() as connection:
+                # Info lives as long as the pooled DBAPI connection
+                connection.info["explaining"] = True
+                try:
+                    rows = connection.exec_driver_sql(
+                        f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters
+                    ).all()
+                finally:
+                    connection.rollback()
+                    del connection.info["explaining"]
+        except Exception:
+            logger.exception(f"Explaining slow query failed: {statement}")
+            return
+        entry.plan = "\n".join(row[0] for row in rows)
+
+    def before_cursor_execute(
+        self,
+        _conn: Any,
+        _cursor: Any,
+        _statement: str,
+        _parameters: Any,
+        context: Any,
+        _many: bool,
+    ) -> None:
+        context.slow_query_start = time.perf_counter()
+
+    def after_cursor_execute(
+        self,
+        conn: Any,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        _many: bool,
+    ) -> None:
+        start = getattr(context, "slow_query_start", None)
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if start is None or threshold is None or conn.info.get("explaining"):
+            return
+        duration = time.perf_counter() - start
+        if duration * 1000 >= threshold:
+            self.record(statement, parameters, duration)
+
+    def install(self) -> None:
+        event.listen(
+            self.db_engine, "before_cursor_execute", self.before_cursor_execute
+        )
+        event.listen(self.db_engine, "after_cursor_execute", self.after_cursor_execute)
+
+
+slow_query_log = SlowQueryLog(engine)
+slow_query_log.install()
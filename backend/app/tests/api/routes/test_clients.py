@@ -0,0 +1,557 @@
+from typing import Any
+from unittest.mock import patch
+
+import msgpack
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.graph_payload import group_graph_cache
+from app.models import Clients, Relations
+from app.tests.utils.client import create_random_client, create_relation
+from app.tests.utils.utils import random_lower_string
+
+
+def _component_of(db: Session, client: Clients) -> int | None:
+    db.expire_all()
+    return db.exec(select(Clients.componentId).where(Clients.id == client.id)).one()
+
+
+def test_create_client_joins_component_of_relations(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_client(db)
+    data = {
+        "name": "Foo",
+        "nickname": random_lower_string(),
+        "instagram": "default.png",
+        "userId": random_lower_string(),
+        "howHardToReach": 1,
+        "otherRelations": [other.userId],
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/clients/", headers=superuser_token_headers, json=data
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert "componentId" in content
+
+    r = client.get(f"{settings.API_V1_STR}/clients/components", params={"limit": 1000})
+    assert r.status_code == 200
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/",
+        params={"component_id": _component_of(db, other)},
+    )
+    assert r.status_code == 200
+    members = {c["userId"] for c in r.json()["data"]}
+    assert members == {data["userId"], other.userId}
+
+
+def test_relation_insert_merges_and_delete_splits_components(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+    third = create_random_client(db)
+    create_relation(db, first, second)
+
+    r = client.get(f"{settings.API_V1_STR}/clients/components", params={"limit": 1000})
+    assert r.status_code == 200
+    assert _component_of(db, first) == _component_of(db, second)
+    assert _component_of(db, first) != _component_of(db, third)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/relations/",
+        headers=superuser_token_headers,
+        json={
+            "fromClientUsername": second.nickname,
+            "toClientUsername": third.nickname,
+        },
+    )
+    assert r.status_code == 200
+    relation_id = r.json()["id"]
+    component_id = _component_of(db, first)
+    assert component_id is not None
+    assert _component_of(db, third) == component_id
+
+    r = client.get(f"{settings.API_V1_STR}/clients/components", params={"limit": 1000})
+    sizes = {c["componentId"]: c["size"] for c in r.json()["data"]}
+    assert sizes[component_id] == 3
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/relations/{relation_id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert _component_of(db, third) is None
+
+    r = client.get(f"{settings.API_V1_STR}/clients/components", params={"limit": 1000})
+    assert r.status_code == 200
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/",
+        params={"component_id": _component_of(db, third)},
+    )
+    assert [c["userId"] for c in r.json()["data"]] == [third.userId]
+    assert _component_of(db, first) == _component_of(db, second)
+
+
+def test_create_client_with_many_relations(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    others = [create_random_client(db) for _ in range(30)]
+    # Two of them are related already, so several components get merged
+    create_relation(db, others[0], others[1])
+    client.get(f"{settings.API_V1_STR}/clients/components", params={"limit": 1})
+    data = {
+        "name": "Foo",
+        "nickname": random_lower_string(),
+        "instagram": "default.png",
+        "userId": random_lower_string(),
+        "howHardToReach": 1,
+        "otherRelations": [other.userId for other in others] + [others[0].userId],
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/clients/", headers=superuser_token_headers, json=data
+    )
+    assert r.status_code == 200
+    assert r.json()["userId"] == data["userId"]
+
+    db.expire_all()
+    to_client_ids = db.exec(
+        select(Relations.toClientId).where(Relations.fromClientId == data["userId"])
+    ).all()
+    assert sorted(to_client_ids) == sorted(other.userId for other in others)
+    components = {_component_of(db, other) for other in others}
+    assert len(components) == 1
+    assert components.pop() is not None
+
+
+def test_create_client_reports_all_missing_relations(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    other = create_random_client(db)
+    missing = [random_lower_string(), random_lower_string()]
+    data = {
+        "name": "Foo",
+        "nickname": random_lower_string(),
+        "instagram": "default.png",
+        "userId": random_lower_string(),
+        "howHardToReach": 1,
+        "otherRelations": [missing[0], other.userId, missing[1]],
+    }
+    r = client.post(
+        f"{settings.API_V1_STR}/clients/", headers=superuser_token_headers, json=data
+    )
+    assert r.status_code == 400
+    assert (
+        r.json()["detail"]
+        == f"Clients with ids {missing[0]}, {missing[1]} do not exist"
+    )
+
+    # Nothing was created
+    assert (
+        db.exec(select(Clients).where(Clients.userId == data["userId"])).first() is None
+    )
+
+
+def test_get_client_by_id(client: TestClient, db: Session) -> None:
+    created = create_random_client(db)
+    r = client.get(f"{settings.API_V1_STR}/clients/{created.userId}")
+    assert r.status_code == 200
+    assert r.json()["id"] == created.id
+
+
+def test_get_client_graph(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    first = create_random_client(db)
+    second = create_random_client(db)
+    outer = create_random_client(db)
+    create_relation(db, center, first)
+    create_relation(db, second, center)
+    # Shared by both neighbours' second hop, listed once
+    between = create_relation(db, first, second)
+    create_relation(db, second, outer)
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{center.userId}/graph")
+    assert r.status_code == 200
+    graph = r.json()
+    assert graph["count"] == 2
+    nodes = graph["nodes"]
+    assert nodes["userId"][0] == center.userId
+    assert sorted(nodes["userId"]) == sorted(
+        c.userId for c in (center, first, second, outer)
+    )
+    assert nodes["name"][nodes["userId"].index(outer.userId)] == outer.name
+
+    edges = graph["edges"]
+    pairs = {
+        (nodes["userId"][source], nodes["userId"][target], depth)
+        for source, target, depth in zip(
+            edges["source"], edges["target"], edges["depth"], strict=True
+        )
+    }
+    assert pairs == {
+        (center.userId, first.userId, 1),
+        (second.userId, center.userId, 1),
+        (first.userId, second.userId, 2),
+        (second.userId, outer.userId, 2),
+    }
+    assert edges["id"].count(between.id) == 1
+
+
+def test_get_clients_sparse_fields(client: TestClient, db: Session) -> None:
+    created = create_random_client(db)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/",
+        params={"fields": "userId, name", "limit": 10000},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert {"name": created.name, "userId": created.userId} in content["data"]
+    assert all(row.keys() == {"name", "userId"} for row in content["data"])
+    assert content["count"] == len(content["data"])
+
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/", params={"fields": "name,password"}
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Unknown fields: password"
+    # Only the fields of ClientPublic
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/", params={"fields": "name,nextScore"}
+    )
+    assert r.status_code == 400
+
+
+def test_get_clients_batch(client: TestClient, db: Session) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+    unknown = random_lower_string()
+
+    r = client.post(
+        f"{settings.API_V1_STR}/clients/batch",
+        json={"userIds": [first.userId, unknown, first.userId], "ids": [second.id, -1]},
+    )
+    assert r.status_code == 200
+    content = r.json()
+    assert list(content["byUserId"]) == [first.userId]
+    assert content["byUserId"][first.userId]["name"] == first.name
+    assert content["byId"][str(second.id)]["userId"] == second.userId
+    assert content["missingUserIds"] == [unknown]
+    assert content["missingIds"] == [-1]
+
+    r = client.post(f"{settings.API_V1_STR}/clients/batch", json={})
+    assert r.json() == {
+        "byUserId": {},
+        "byId": {},
+        "missingUserIds": [],
+        "missingIds": [],
+    }
+
+    r = client.post(
+        f"{settings.API_V1_STR}/clients/batch", json={"ids": list(range(5001))}
+    )
+    assert r.status_code == 422
+
+
+def test_get_client_by_id_sparse_fields(client: TestClient, db: Session) -> None:
+    created = create_random_client(db, priority=3)
+    url = f"{settings.API_V1_STR}/clients/{created.userId}"
+
+    r = client.get(url, params={"fields": "priority,name"})
+    assert r.status_code == 200
+    assert r.json() == {"name": created.name, "priority": 3}
+
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/{random_lower_string()}",
+        params={"fields": "name"},
+    )
+    assert r.status_code == 404
+
+
+def test_get_client_graph_sparse_fields(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    neighbour = create_random_client(db)
+    relation = create_relation(db, center, neighbour)
+    url = f"{settings.API_V1_STR}/clients/{center.userId}/graph"
+
+    r = client.get(url, params={"fields": "userId"})
+    assert r.status_code == 200
+    graph = r.json()
+    assert graph["nodes"] == {"userId": [center.userId, neighbour.userId]}
+    assert graph["edges"]["id"] == [relation.id]
+
+    r = client.get(
+        url, params={"fields": "name"}, headers={"Accept": "application/msgpack"}
+    )
+    assert msgpack.unpackb(r.content)["nodes"] == {
+        "name": [center.name, neighbour.name]
+    }
+
+
+def test_get_client_graph_msgpack(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    create_relation(db, center, create_random_client(db))
+    url = f"{settings.API_V1_STR}/clients/{center.userId}/graph"
+
+    r = client.get(url, headers={"Accept": "application/msgpack"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(r.content) == client.get(url).json()
+
+
+def test_get_client_graph_without_relations(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    r = client.get(f"{settings.API_V1_STR}/clients/{center.userId}/graph")
+    assert r.status_code == 200
+    graph = r.json()
+    assert graph["count"] == 0
+    assert graph["nodes"]["userId"] == [center.userId]
+    assert graph["edges"]["id"] == []
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{random_lower_string()}/graph")
+    assert r.status_code == 404
+
+
+def test_get_group_graph(client: TestClient, db: Session) -> None:
+    group = random_lower_string()
+    first, second, third = (create_random_client(db, groupName=group) for _ in range(3))
+    outsider = create_random_client(db)
+    create_relation(db, first, second)
+    create_relation(db, third, first)
+    create_relation(db, second, outsider)
+    create_relation(db, outsider, third)
+    url = f"{settings.API_V1_STR}/clients/groups/{group}/graph"
+
+    def edges(graph: dict[str, Any]) -> set[tuple[str, str]]:
+        user_ids = graph["nodes"]["userId"]
+        return {
+            (user_ids[source], user_ids[target])
+            for source, target in zip(
+                graph["edges"]["source"], graph["edges"]["target"], strict=True
+            )
+        }
+
+    r = client.get(url)
+    assert r.status_code == 200
+    graph = r.json()
+    assert graph["count"] == graph["members"] == 3
+    assert graph["nodes"]["userId"] == [first.userId, second.userId, third.userId]
+    assert edges(graph) == {(first.userId, second.userId), (third.userId, first.userId)}
+
+    r = client.get(url, params={"include_external": True})
+    graph = r.json()
+    assert graph["members"] == 3
+    assert graph["nodes"]["userId"][3:] == [outsider.userId]
+    assert len(edges(graph)) == 4
+
+    # Pages split the members, every relation shows up on exactly one page
+    pages = [
+        client.get(
+            url, params={"skip": skip, "limit": 2, "include_external": True}
+        ).json()
+        for skip in (0, 2)
+    ]
+    assert [page["members"] for page in pages] == [2, 1]
+    assert sum(len(page["edges"]["id"]) for page in pages) == 4
+    assert set().union(*(edges(page) for page in pages)) == edges(graph)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/clients/groups/{random_lower_string()}/graph"
+    )
+    assert r.status_code == 404
+
+
+def test_get_group_graph_sparse_fields(client: TestClient, db: Session) -> None:
+    group = random_lower_string()
+    first, second = (create_random_client(db, groupName=group) for _ in range(2))
+    create_relation(db, first, second)
+    url = f"{settings.API_V1_STR}/clients/groups/{group}/graph"
+
+    sparse = client.get(url, params={"fields": "name"}).json()
+    assert sparse["nodes"] == {"name": [first.name, second.name]}
+    # Cached separately from the full graph
+    full = client.get(url).json()
+    assert full["nodes"]["userId"] == [first.userId, second.userId]
+    assert sparse["edges"] == full["edges"]
+
+
+def test_group_graph_cache_follows_group_version(
+    client: TestClient, db: Session
+) -> None:
+    group = random_lower_string()
+    first, second = (create_random_client(db, groupName=group) for _ in range(2))
+    url = f"{settings.API_V1_STR}/clients/groups/{group}/graph"
+
+    graph = client.get(url).json()
+    hits = group_graph_cache.cache_info().hits
+    assert client.get(url).json() == graph
+    assert group_graph_cache.cache_info().hits == hits + 1
+
+    create_relation(db, first, second)
+    changed = client.get(url).json()
+    assert changed["version"] > graph["version"]
+    assert changed["edges"]["id"] != []
+
+    first.name = random_lower_string()
+    db.add(first)
+    db.commit()
+    renamed = client.get(url).json()
+    assert renamed["version"] > changed["version"]
+    assert renamed["nodes"]["name"][0] == first.name
+
+
+def test_group_graph_cache_follows_external_neighbours(
+    client: TestClient, db: Session
+) -> None:
+    group = random_lower_string()
+    member = create_random_client(db, groupName=group)
+    neighbour = create_random_client(db, groupName=random_lower_string())
+    create_relation(db, member, neighbour)
+    url = f"{settings.API_V1_STR}/clients/groups/{group}/graph?include_external=true"
+
+    graph = client.get(url).json()
+    neighbour.name = random_lower_string()
+    db.add(neighbour)
+    db.commit()
+    renamed = client.get(url).json()
+    assert renamed["version"] > graph["version"]
+    nodes = renamed["nodes"]
+    assert nodes["name"][nodes["userId"].index(neighbour.userId)] == neighbour.name
+
+
+def test_get_next_clients(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    important = create_random_client(db, priority=3, openForConnections=1)
+    hard = create_random_client(db, priority=3, openForConnections=1, howHardToReach=3)
+    connected = create_random_client(
+        db, priority=3, openForConnections=1, howHardToReach=3
+    )
+    reached = create_random_client(db, priority=3, isReached=1)
+    also_reached = create_random_client(db, isReached=1)
+    create_relation(db, connected, reached)
+    # Related both ways, still one neighbour
+    create_relation(db, reached, connected)
+    create_relation(db, also_reached, connected)
+    ours = {
+        important.userId,
+        hard.userId,
+        connected.userId,
+        reached.userId,
+        also_reached.userId,
+    }
+
+    def queue() -> list[dict[str, Any]]:
+        r = client.get(f"{settings.API_V1_STR}/clients/next", params={"limit": 10000})
+        assert r.status_code == 200
+        data = r.json()["data"]
+        scores = [c["nextScore"] for c in data]
+        assert scores == sorted(scores, reverse=True)
+        return [c for c in data if c["userId"] in ours]
+
+    ranked = queue()
+    # Two reached neighbours make up for being hard to reach, reached clients are done
+    assert [c["userId"] for c in ranked] == [
+        important.userId,
+        connected.userId,
+        hard.userId,
+    ]
+    assert ranked[1]["reachedNeighbours"] == 2
+
+    # Reaching a client moves its neighbours up
+    r = client.patch(
+        f"{settings.API_V1_STR}/clients/{important.id}",
+        headers=superuser_token_headers,
+        json={"isReached": 1},
+    )
+    assert r.status_code == 200
+    assert r.json()["isReached"] == 1
+    r = client.post(
+        f"{settings.API_V1_STR}/relations/",
+        headers=superuser_token_headers,
+        json={
+            "fromClientUsername": hard.nickname,
+            "toClientUsername": important.nickname,
+        },
+    )
+    assert r.status_code == 200
+    ranked = queue()
+    assert [c["userId"] for c in ranked] == [connected.userId, hard.userId]
+    assert ranked[1]["reachedNeighbours"] == 1
+
+    # And becoming unreached or losing the relations moves them down again,
+    # the relation left to reached keeps it a neighbour
+    for relation in db.exec(
+        select(Relations).where(Relations.toClientId == connected.userId)
+    ).all():
+        db.delete(relation)
+    db.commit()
+    by_user_id = {c["userId"]: c for c in queue()}
+    assert by_user_id[connected.userId]["reachedNeighbours"] == 1
+    reached.isReached = 0
+    db.add(reached)
+    db.commit()
+    by_user_id = {c["userId"]: c for c in queue()}
+    assert by_user_id[connected.userId]["reachedNeighbours"] == 0
+    assert by_user_id[reached.userId]["nextScore"] is not None
+
+
+def test_get_client_introductions(client: TestClient, db: Session) -> None:
+    target = create_random_client(db)
+    direct = create_random_client(db, isReached=1)
+    create_relation(db, direct, target)
+    # Behind a reached client: direct is the better introduction
+    behind_direct = create_random_client(db, isReached=1)
+    create_relation(db, behind_direct, direct)
+    # Via one client hard to reach: cost 3
+    via_hard = create_random_client(db, isReached=1)
+    hard = create_random_client(db, howHardToReach=3)
+    create_relation(db, via_hard, hard)
+    create_relation(db, target, hard)
+    # Via two easy clients: cost 2, three relations
+    via_easy = create_random_client(db, isReached=1)
+    easy_one = create_random_client(db, howHardToReach=1)
+    easy_two = create_random_client(db, howHardToReach=1)
+    create_relation(db, via_easy, easy_one)
+    create_relation(db, easy_one, easy_two)
+    create_relation(db, easy_two, target)
+    # Four relations away: cost 3
+    far = create_random_client(db, isReached=1)
+    far_chain = [create_random_client(db, howHardToReach=1) for _ in range(3)]
+    for a, b in zip([far, *far_chain], [*far_chain, target], strict=True):
+        create_relation(db, a, b)
+    url = f"{settings.API_V1_STR}/clients/{target.userId}/introductions"
+
+    def chains(**params: int) -> list[tuple[int, list[str]]]:
+        r = client.get(url, params=params)
+        assert r.status_code == 200
+        return [
+            (chain["cost"], [c["userId"] for c in chain["clients"]])
+            for chain in r.json()["data"]
+        ]
+
+    assert chains() == [
+        (0, [direct.userId, target.userId]),
+        (2, [via_easy.userId, easy_one.userId, easy_two.userId, target.userId]),
+        (3, [via_hard.userId, hard.userId, target.userId]),
+    ]
+    assert [cost for cost, _ in chains(k=2)] == [0, 2]
+    # Equally cheap, the shorter chain first
+    assert [chain[0] for _, chain in chains(max_depth=4)] == [
+        direct.userId,
+        via_easy.userId,
+        via_hard.userId,
+        far.userId,
+    ]
+    assert chains(max_depth=1) == [(0, [direct.userId, target.userId])]
+
+    r = client.get(url, params={"max_depth": 100})
+    assert r.status_code == 422
+
+    # The target has four relations, the second hop loads more
+    with patch("app.core.config.settings.INTRODUCTION_MAX_RELATIONS", 4):
+        assert chains(max_depth=1) == [(0, [direct.userId, target.userId])]
+        r = client.get(url, params={"max_depth": 2})
+        assert r.status_code == 422
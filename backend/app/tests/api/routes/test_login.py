@@ -1,8 +1,15 @@
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 
 from fastapi.testclient import TestClient
+from httpx import Response
+from sqlmodel import Session
+from starlette.types import Receive, Scope, Send
 
+from app import crud
 from app.core.config import settings
+from app.main import app
+from app.models import UserCreate
+from app.tests.utils.utils import random_email, random_lower_string
 from app.utils import generate_password_reset_token
 
 
@@ -27,6 +34,68 @@ def test_get_access_token_incorrect_password(client: TestClient) -> None:
     assert r.status_code == 400
 
 
+def test_get_access_token_throttled(client: TestClient) -> None:
+    username = random_email()
+    with patch("app.core.config.settings.LOGIN_RATE_LIMIT_PER_USERNAME", 2):
+        for _ in range(2):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token",
+                data={"username": username, "password": "incorrect"},
+            )
+            assert r.status_code == 400
+        with patch("app.crud.authenticate_async", AsyncMock()) as authenticate:
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token",
+                data={"username": username.upper(), "password": "incorrect"},
+            )
+        assert r.status_code == 429
+        assert int(r.headers["Retry-After"]) > 0
+        authenticate.assert_not_awaited()
+
+
+def test_get_access_token_throttled_per_client_behind_proxy() -> None:
+    async def behind_proxy(scope: Scope, receive: Receive, send: Send) -> None:
+        await app({**scope, "client": ("172.18.0.2", 40000)}, receive, send)
+
+    def login(forwarded_for: str) -> int:
+        r = proxy_client.post(
+            f"{settings.API_V1_STR}/login/access-token",
+            data={"username": random_email(), "password": "incorrect"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+        return r.status_code
+
+    proxy_client = TestClient(behind_proxy)
+    with patch("app.core.config.settings.LOGIN_RATE_LIMIT_PER_IP", 2), patch(
+        "app.core.config.settings.TRUSTED_PROXY_IPS", ["172.16.0.0/12"]
+    ):
+        assert [login("203.0.113.7") for _ in range(3)] == [400, 400, 429]
+        assert login("203.0.113.8") == 400
+        # Addresses before the one the proxy added can be forged
+        assert login("203.0.113.8, 203.0.113.7") == 429
+
+    with patch("app.core.config.settings.LOGIN_RATE_LIMIT_PER_IP", 2), patch(
+        "app.core.config.settings.TRUSTED_PROXY_IPS", []
+    ):
+        assert [login(f"198.51.100.{i}") for i in range(3)] == [400, 400, 429]
+
+
+def test_successful_logins_are_not_throttled(client: TestClient, db: Session) -> None:
+    login_data = {"username": random_email(), "password": random_lower_string()}
+    crud.create_user(
+        session=db,
+        user_create=UserCreate(
+            email=login_data["username"], password=login_data["password"]
+        ),
+    )
+    with patch("app.core.config.settings.LOGIN_RATE_LIMIT_PER_USERNAME", 1):
+        for _ in range(3):
+            r = client.post(
+                f"{settings.API_V1_STR}/login/access-token", data=login_data
+            )
+            assert r.status_code == 200
+
+
 def test_use_access_token(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -94,3 +163,92 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def claims_login(client: TestClient, db: Session) -> tuple[int, dict[str, str]]:
+    email, password = random_email(), random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    r = client.post(
+        f"{settings.API_V1_STR}/login/access-token",
+        data={"username": email, "password": password},
+    )
+    assert r.status_code == 200
+    assert user.id is not None
+    return user.id, r.json()
+
+
+def queries(r: Response) -> int:
+    # Server-Timing: db;dur=1.2;desc="2 queries"
+    return int(r.headers["server-timing"].split('desc="')[1].split()[0])
+
+
+def test_claims_token_skips_user_query(client: TestClient, db: Session) -> None:
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        _, tokens = claims_login(client, db)
+        claims_headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        with_claims = client.get(
+            f"{settings.API_V1_STR}/items/", headers=claims_headers
+        )
+
+        # Tokens without claims keep working, looking the user up
+        with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", False):
+            _, plain_tokens = claims_login(client, db)
+        plain_headers = {"Authorization": f"Bearer {plain_tokens['access_token']}"}
+        without_claims = client.get(
+            f"{settings.API_V1_STR}/items/", headers=plain_headers
+        )
+
+    assert with_claims.status_code == without_claims.status_code == 200
+    assert queries(with_claims) == queries(without_claims) - 1
+    assert plain_tokens["refresh_token"] is None
+
+
+def test_refresh_token(client: TestClient, db: Session) -> None:
+    url = f"{settings.API_V1_STR}/login/refresh-token"
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        _, tokens = claims_login(client, db)
+        r = client.post(url, json={"refresh_token": tokens["refresh_token"]})
+        assert r.status_code == 200
+        refreshed = r.json()
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers={"Authorization": f"Bearer {refreshed['access_token']}"},
+        )
+        assert r.status_code == 200
+
+        # Neither kind of token passes for the other
+        r = client.post(url, json={"refresh_token": tokens["access_token"]})
+        assert r.status_code == 403
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers={"Authorization": f"Bearer {tokens['refresh_token']}"},
+        )
+        assert r.status_code == 403
+
+
+def test_deactivation_revokes_claims(
+    client: TestClient, db: Session, superuser_token_headers: dict[str, str]
+) -> None:
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        user_id, tokens = claims_login(client, db)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+        assert (
+            client.get(f"{settings.API_V1_STR}/items/", headers=headers).status_code
+            == 200
+        )
+
+        r = client.patch(
+            f"{settings.API_V1_STR}/users/{user_id}",
+            headers=superuser_token_headers,
+            json={"is_active": False},
+        )
+        assert r.status_code == 200
+        r = client.get(f"{settings.API_V1_STR}/items/", headers=headers)
+        assert r.status_code == 400
+        r = client.post(
+            f"{settings.API_V1_STR}/login/refresh-token",
+            json={"refresh_token": tokens["refresh_token"]},
+        )
+        assert r.status_code == 400
@@ -0,0 +1,146 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.tests.utils.client import create_random_client, create_relation
+
+
+def test_get_relations_with_client_names(client: TestClient, db: Session) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+    relation = create_relation(db, first, second)
+
+    r = client.get(f"{settings.API_V1_STR}/relations/", params={"limit": 1000})
+    assert r.status_code == 200
+    content = r.json()
+    listed = {row["id"]: row for row in content["data"]}
+    assert content["count"] >= 1
+    assert listed[relation.id]["from_client_name"] == first.name
+    assert listed[relation.id]["to_client_name"] == second.name
+    assert listed[relation.id]["toClientInstagram"] == second.instagram
+
+
+def test_get_relations_sparse_fields(client: TestClient, db: Session) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+    relation = create_relation(db, first, second)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/relations/",
+        params={"fields": "to_client_name,id", "limit": 1000},
+    )
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert {"id": relation.id, "to_client_name": second.name} in data
+    assert all(row.keys() == {"id", "to_client_name"} for row in data)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/relations/",
+        params={"fields": "relations,id", "limit": 1000},
+    )
+    assert r.status_code == 200
+    assert {"id": relation.id, "relations": []} in r.json()["data"]
+    # Only the fields of RelationPublic
+    r = client.get(
+        f"{settings.API_V1_STR}/relations/", params={"fields": "id,from_client_pk"}
+    )
+    assert r.status_code == 400
+
+
+def test_relation_listing_follows_client_rename(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+    relation = create_relation(db, first, second)
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/clients/{second.id}",
+        headers=superuser_token_headers,
+        json={"name": "Renamed"},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{first.userId}/relations")
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert [row["id"] for row in data] == [relation.id]
+    assert data[0]["to_client_name"] == "Renamed"
+
+
+def test_get_client_relations_two_levels(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    neighbour = create_random_client(db)
+    second_hop = create_random_client(db)
+    relation = create_relation(db, center, neighbour)
+    inner_relation = create_relation(db, second_hop, neighbour)
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{center.userId}/relations")
+    assert r.status_code == 200
+    content = r.json()
+    assert content["count"] == 1
+    assert content["data"][0]["id"] == relation.id
+    inner = content["data"][0]["relations"]
+    assert [row["id"] for row in inner] == [inner_relation.id]
+    assert inner[0]["from_client_name"] == second_hop.name
+
+
+def test_get_client_relations_sparse_fields(client: TestClient, db: Session) -> None:
+    center = create_random_client(db)
+    neighbour = create_random_client(db)
+    second_hop = create_random_client(db)
+    relation = create_relation(db, center, neighbour)
+    inner_relation = create_relation(db, second_hop, neighbour)
+    url = f"{settings.API_V1_STR}/clients/{center.userId}/relations"
+
+    # Without relations among the fields, the second hop is not loaded
+    r = client.get(url, params={"fields": "to_client_name,id"})
+    assert r.status_code == 200
+    assert r.json() == {
+        "data": [{"id": relation.id, "to_client_name": neighbour.name}],
+        "count": 1,
+    }
+    assert r.headers["server-timing"].endswith('desc="3 queries"')
+
+    r = client.get(url, params={"fields": "id,relations"})
+    assert r.status_code == 200
+    row = r.json()["data"][0]
+    assert row.keys() == {"id", "relations"}
+    assert [inner["id"] for inner in row["relations"]] == [inner_relation.id]
+
+
+def test_get_client_relations_without_relations(
+    client: TestClient, db: Session
+) -> None:
+    lonely = create_random_client(db)
+    r = client.get(f"{settings.API_V1_STR}/clients/{lonely.userId}/relations")
+    assert r.status_code == 200
+    assert r.json()["userId"] == lonely.userId
+
+
+def test_relation_client_keys(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    first = create_random_client(db)
+    second = create_random_client(db)
+
+    # Inserts giving only the userIds get the integer keys filled in
+    relation = create_relation(db, first, second)
+    assert (relation.from_client_pk, relation.to_client_pk) == (first.id, second.id)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/relations/",
+        headers=superuser_token_headers,
+        json={
+            "fromClientUsername": second.nickname,
+            "toClientUsername": first.nickname,
+        },
+    )
+    assert r.status_code == 200
+    created = r.json()
+    assert created["fromClientId"] == second.userId
+    assert (created["from_client_pk"], created["to_client_pk"]) == (second.id, first.id)
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{first.userId}/relations")
+    assert r.status_code == 200
+    assert {row["id"] for row in r.json()["data"]} == {relation.id, created["id"]}
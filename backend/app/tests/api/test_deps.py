@@ -0,0 +1,48 @@
+from typing import Any
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, model_validator
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.api.deps import SessionDep, SessionReleasingRoute, get_current_user
+from app.core.config import settings
+from app.core.db import engine
+
+
+def test_sessions_are_closed_before_serialization() -> None:
+    sessions: list[Session] = []
+    in_transaction: list[bool] = []
+
+    class Answer(BaseModel):
+        value: int
+
+        @model_validator(mode="before")
+        @classmethod
+        def record(cls, data: Any) -> Any:
+            in_transaction.append(sessions[0].in_transaction())
+            return data
+
+    router = APIRouter(route_class=SessionReleasingRoute)
+
+    @router.get("/answer", response_model=Answer)
+    def answer(session: SessionDep) -> Any:
+        sessions.append(session)
+        return {"value": session.execute(text("SELECT 42")).scalar_one()}
+
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as test_client:
+        assert test_client.get("/answer").json() == {"value": 42}
+    assert in_transaction == [False]
+
+
+def test_current_user_gives_the_connection_back(
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    token = normal_user_token_headers["Authorization"].removeprefix("Bearer ")
+    with Session(engine) as session:
+        user = get_current_user(session, token)
+        assert not session.in_transaction()
+    assert user.email == settings.EMAIL_TEST_USER
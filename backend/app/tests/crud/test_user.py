@@ -1,8 +1,13 @@
+import asyncio
+
+import pytest
 from fastapi.encoders import jsonable_encoder
+from passlib.hash import argon2, bcrypt
 from sqlmodel import Session
 
 from app import crud
-from app.core.security import verify_password
+from app.core.config import settings
+from app.core.security import verify_password, verify_password_async
 from app.models import User, UserCreate, UserUpdate
 from app.tests.utils.utils import random_email, random_lower_string
 
@@ -33,6 +38,64 @@ def test_not_authenticate_user(db: Session) -> None:
     assert user is None
 
 
+def test_authenticate_user_rehashes_outdated_bcrypt_cost(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    user.hashed_password = bcrypt.using(rounds=4).hash(password)
+    db.add(user)
+    db.commit()
+
+    authenticated_user = crud.authenticate(session=db, email=email, password=password)
+    assert authenticated_user
+    assert authenticated_user.hashed_password.startswith(
+        f"$2b${settings.BCRYPT_ROUNDS:02d}$"
+    )
+    assert verify_password(password, authenticated_user.hashed_password)
+
+
+def test_authenticate_async_rehashes_outdated_bcrypt_cost(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    user.hashed_password = bcrypt.using(rounds=4).hash(password)
+    db.add(user)
+    db.commit()
+
+    assert not asyncio.run(
+        crud.authenticate_async(session=db, email=email, password="wrong")
+    )
+    authenticated_user = asyncio.run(
+        crud.authenticate_async(session=db, email=email, password=password)
+    )
+    assert authenticated_user
+    assert authenticated_user.hashed_password.startswith(
+        f"$2b${settings.BCRYPT_ROUNDS:02d}$"
+    )
+    assert asyncio.run(verify_password_async(password, user.hashed_password))
+
+
+@pytest.mark.skipif(not argon2.has_backend(), reason="argon2-cffi not installed")
+def test_authenticate_user_rehashes_other_scheme(db: Session) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = crud.create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    user.hashed_password = argon2.using(memory_cost=1024, time_cost=1).hash(password)
+    db.add(user)
+    db.commit()
+
+    authenticated_user = crud.authenticate(session=db, email=email, password=password)
+    assert authenticated_user
+    assert not authenticated_user.hashed_password.startswith("$argon2")
+    assert crud.authenticate(session=db, email=email, password=password)
+
+
 def test_check_if_user_is_active(db: Session) -> None:
     email = random_email()
     password = random_lower_string()
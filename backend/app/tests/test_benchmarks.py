@@ -0,0 +1,107 @@
+import itertools
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, select
+
+from app.benchmarks.generate import generate_graph, write_csv_files
+from app.benchmarks.run import create_sqlite_engine, run_benchmark
+from app.benchmarks.seed import prepare_sqlite
+from app.benchmarks.startup import measure_startup
+from app.core.config import settings
+from app.models import Clients, Relations
+from app.tests.utils.utils import random_lower_string
+
+
+def test_benchmark_runs_on_sqlite() -> None:
+    engine = create_sqlite_engine(None)
+    prepare_sqlite(engine)
+
+    report = run_benchmark(
+        db_engine=engine,
+        clients=20,
+        relations=40,
+        users=1,
+        items=5,
+        requests=2,
+        warmup=0,
+        import_rows=3,
+    )
+
+    assert report["database"] == "sqlite"
+    assert set(report["results"]) == {
+        "get_clients",
+        "get_relations",
+        "get_client_relations",
+        "login",
+        "create_clients_from_file",
+    }
+    for result in report["results"].values():
+        assert result["errors"] == 0
+        assert result["p50_ms"] <= result["p99_ms"]
+
+
+def test_generate_graph_power_law_with_hubs() -> None:
+    graph = generate_graph(clients=2_000, avg_degree=4, hubs=2, hub_degree=500)
+
+    degrees = Counter(itertools.chain.from_iterable(graph.edges))
+    assert len({tuple(sorted(edge)) for edge in graph.edges}) == len(graph.edges)
+    assert all(a != b for a, b in graph.edges)
+    assert degrees["synthetic-0"] >= 500
+    assert degrees["synthetic-1"] >= 500
+    assert len(graph.edges) >= 2_000 * 4 / 2
+    assert len(set(graph.groups.values())) > 10
+
+
+def test_generated_csv_files_import_every_relation(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    tmp_path: Path,
+) -> None:
+    prefix = f"{random_lower_string()[:8]}-"
+    graph = generate_graph(
+        clients=40, avg_degree=3, groups=4, hubs=1, hub_degree=10, prefix=prefix
+    )
+
+    files = write_csv_files(graph, tmp_path)
+    with patch("app.api.routes.clients.download_image", return_value=None):
+        for path in files:
+            group = path.stem.split("-", 1)[1]
+            r = client.post(
+                f"{settings.API_V1_STR}/clients/file",
+                params={"group_name": group},
+                files={"file": (path.name, path.read_bytes(), "text/csv")},
+                headers=superuser_token_headers,
+            )
+            assert r.status_code == 200
+
+    imported = db.exec(
+        select(Relations.fromClientId, Relations.toClientId).where(
+            col(Relations.fromClientId).startswith(prefix)
+        )
+    ).all()
+    assert {frozenset(edge) for edge in imported} == {
+        frozenset(edge) for edge in graph.edges
+    }
+    groups = dict(
+        db.exec(
+            select(Clients.userId, Clients.groupName).where(
+                col(Clients.userId).startswith(prefix)
+            )
+        ).all()
+    )
+    assert groups == graph.groups
+
+
+def test_startup_imports_heavy_modules_lazily() -> None:
+    report = measure_startup()
+
+    assert report["status_code"] == 200
+    assert report["time_to_first_request_seconds"] > report["import_seconds"] > 0
+    assert "app.main" in report["packages"]
+    # Only needed to send emails, download images or report to Sentry
+    for module in ("emails", "jinja2", "requests", "sentry_sdk"):
+        assert module not in report["modules"]
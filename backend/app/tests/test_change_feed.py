@@ -0,0 +1,76 @@
+import asyncio
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from app.change_feed import RESYNC, ChangeFeed, change_feed, format_event, matches
+from app.core.config import settings
+from app.tests.utils.client import create_random_client
+from app.tests.utils.utils import random_lower_string
+
+
+def event(**kwargs: Any) -> dict[str, Any]:
+    return {
+        "entity": "clients",
+        "op": "update",
+        "id": 1,
+        "clientIds": ["a"],
+        "groupNames": ["g"],
+    } | kwargs
+
+
+def test_matches_filters_by_group_and_client() -> None:
+    assert matches(event(), None, None)
+    assert matches(event(), "g", "a")
+    assert not matches(event(), "other", None)
+    assert not matches(event(), None, "b")
+    assert matches(RESYNC, "other", "b")
+
+
+def test_format_event() -> None:
+    assert format_event(event()).startswith("event: clients\ndata: {")
+    assert format_event(RESYNC).startswith("event: resync\n")
+    assert format_event(event()).endswith("\n\n")
+
+
+def test_slow_subscriber_gets_resync() -> None:
+    feed = ChangeFeed()
+
+    async def overflow() -> list[dict[str, Any]]:
+        with feed.subscribe() as queue:
+            for i in range(settings.CHANGE_FEED_QUEUE_SIZE + 1):
+                feed.publish(event(id=i))
+            await asyncio.sleep(0.1)
+            return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    assert asyncio.run(overflow()) == [RESYNC]
+
+
+def test_change_reaches_subscribers(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    group_name = random_lower_string()
+    target = create_random_client(db, groupName=group_name)
+    assert change_feed.listening.wait(5)
+
+    async def receive() -> dict[str, Any]:
+        with change_feed.subscribe() as queue:
+            r = await asyncio.to_thread(
+                client.patch,
+                f"{settings.API_V1_STR}/clients/{target.id}",
+                headers=superuser_token_headers,
+                json={"priority": 7},
+            )
+            assert r.status_code == 200
+            while True:
+                received = await asyncio.wait_for(queue.get(), timeout=5)
+                if matches(received, group_name, None):
+                    return received
+
+    received = asyncio.run(receive())
+    assert received["entity"] == "clients"
+    assert received["op"] == "update"
+    assert received["id"] == target.id
+    assert received["clientIds"] == [target.userId]
+    assert received["data"]["priority"] == 7
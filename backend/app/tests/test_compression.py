@@ -0,0 +1,156 @@
+import asyncio
+import gzip
+import zlib
+
+import brotli
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from starlette.types import Message, Receive, Scope, Send
+
+from app.compression import CompressionMiddleware, PrecompressedBody, negotiate_encoding
+from app.core.config import settings
+from app.tests.utils.client import create_random_client
+from app.tests.utils.utils import random_lower_string
+
+LARGE = b'{"data": "' + b"x" * 5000 + b'"}'
+
+
+def test_negotiate_encoding() -> None:
+    assert negotiate_encoding("gzip, deflate, br") == "br"
+    assert negotiate_encoding("gzip, br;q=0.5") == "gzip"
+    assert negotiate_encoding("br;q=0, gzip") == "gzip"
+    assert negotiate_encoding("*") == "br"
+    assert negotiate_encoding("*, br;q=0") == "gzip"
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("") is None
+
+
+def compression_app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
+    @app.get("/large")
+    def large() -> Response:
+        return Response(LARGE, media_type="application/json")
+
+    @app.get("/small")
+    def small() -> Response:
+        return Response(b'{"data": 1}', media_type="application/json")
+
+    @app.get("/image")
+    def image() -> Response:
+        return Response(LARGE, media_type="image/png")
+
+    @app.get("/precompressed")
+    def precompressed(request: Request) -> Response:
+        return PrecompressedBody(LARGE, "application/json").response(request)
+
+    return app
+
+
+def test_compresses_large_responses_only() -> None:
+    with TestClient(compression_app()) as test_client:
+        r = test_client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["content-encoding"] == "gzip"
+        assert r.headers["vary"] == "Accept-Encoding"
+        assert r.content == LARGE
+        assert int(r.headers["content-length"]) == r.num_bytes_downloaded < len(LARGE)
+
+        r = test_client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+        assert r.headers["content-encoding"] == "br"
+        assert r.content == LARGE
+
+        r = test_client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in r.headers
+        assert r.content == LARGE
+
+        r = test_client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+        assert r.headers["vary"] == "Accept-Encoding"
+
+        r = test_client.get("/image", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+
+
+def test_precompressed_body_is_passed_through() -> None:
+    with TestClient(compression_app()) as test_client:
+        r = test_client.get("/precompressed", headers={"Accept-Encoding": "br"})
+        assert r.headers["content-encoding"] == "br"
+        assert r.num_bytes_downloaded == len(brotli.compress(LARGE, quality=9))
+        assert r.content == LARGE
+
+        r = test_client.get("/precompressed", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["content-encoding"] == "gzip"
+        assert r.content == LARGE
+
+
+def test_streaming_chunks_are_flushed() -> None:
+    chunks = [b"id,name\n", b"1,Anna\n" * 200, b"2,Bob\n" * 200]
+
+    async def app(scope: Scope, receive: Receive, send: Send) -> None:
+        await StreamingResponse(iter(chunks), media_type="text/csv")(
+            scope, receive, send
+        )
+
+    messages: list[Message] = []
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    async def receive() -> Message:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    scope: Scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(b"accept-encoding", b"gzip")],
+    }
+    asyncio.run(CompressionMiddleware(app)(scope, receive, send))
+
+    start, *bodies = messages
+    headers = dict(start["headers"])
+    assert headers[b"content-encoding"] == b"gzip"
+    assert b"content-length" not in headers
+    # Every chunk decodes as soon as it arrives
+    decompressor = zlib.decompressobj(31)
+    received = [decompressor.decompress(body["body"]) for body in bodies]
+    assert received[: len(chunks)] == chunks
+    assert b"".join(received) == b"".join(chunks)
+
+
+def test_event_streams_are_not_compressed() -> None:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/events")
+    def events() -> StreamingResponse:
+        return StreamingResponse(
+            iter(["data: 1\n\n"] * 500), media_type="text/event-stream"
+        )
+
+    with TestClient(app) as test_client:
+        r = test_client.get("/events", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in r.headers
+
+
+def test_group_graph_is_served_precompressed(client: TestClient, db: Session) -> None:
+    group = random_lower_string()
+    for _ in range(30):
+        create_random_client(db, groupName=group)
+    url = f"{settings.API_V1_STR}/clients/groups/{group}/graph"
+
+    r = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["vary"] == "Accept, Accept-Encoding"
+    assert r.json()["members"] == 30
+
+    raw = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert raw.json() == r.json()
+    assert r.num_bytes_downloaded == len(
+        gzip.compress(raw.content, compresslevel=9, mtime=0)
+    )
@@ -0,0 +1,127 @@
+from collections.abc import Generator
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlmodel import Session, delete, select
+
+from app.core.config import settings
+from app.email_queue import enqueue_email, purge_old_emails, send_due_emails
+from app.models import EmailOutbox
+from app.tests.utils.smtp import DebuggingSMTPServer
+from app.tests.utils.utils import random_email
+
+
+@pytest.fixture()
+def smtp_server() -> Generator[DebuggingSMTPServer, None, None]:
+    with (
+        DebuggingSMTPServer() as server,
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.core.config.settings.SMTP_PORT", server.port),
+        patch("app.core.config.settings.SMTP_TLS", False),
+        patch("app.core.config.settings.SMTP_USER", None),
+        patch("app.core.config.settings.SMTP_PASSWORD", None),
+    ):
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def empty_outbox(db: Session) -> None:
+    db.execute(delete(EmailOutbox))
+    db.commit()
+
+
+def test_send_due_emails_reuses_one_connection(
+    db: Session, smtp_server: DebuggingSMTPServer
+) -> None:
+    recipients = [random_email() for _ in range(3)]
+    emails = [
+        enqueue_email(session=db, email_to=email_to, subject="Hi", html_content="<p/>")
+        for email_to in recipients
+    ]
+
+    assert send_due_emails(db) == 3
+
+    assert smtp_server.messages == recipients
+    assert smtp_server.connections == 1
+    for email in emails:
+        db.refresh(email)
+        assert email.status == "sent"
+        assert email.sent_at is not None
+        assert email.html_content == ""
+    assert send_due_emails(db) == 0
+
+
+def test_send_due_emails_retries_with_backoff(db: Session) -> None:
+    with (
+        patch("app.core.config.settings.SMTP_HOST", "127.0.0.1"),
+        patch("app.core.config.settings.SMTP_PORT", 9),
+        patch("app.core.config.settings.SMTP_TLS", False),
+        patch("app.core.config.settings.EMAIL_QUEUE_MAX_ATTEMPTS", 2),
+    ):
+        email = enqueue_email(
+            session=db, email_to=random_email(), subject="Hi", html_content="<p/>"
+        )
+        queued_at = email.next_attempt_at
+
+        assert send_due_emails(db) == 1
+        db.refresh(email)
+        assert email.status == "pending"
+        assert email.attempts == 1
+        assert email.last_error
+        assert (email.next_attempt_at - queued_at).total_seconds() >= (
+            settings.EMAIL_QUEUE_RETRY_SECONDS
+        )
+        # Not due yet
+        assert send_due_emails(db) == 0
+
+        email.next_attempt_at = queued_at
+        db.add(email)
+        db.commit()
+        assert send_due_emails(db) == 1
+        db.refresh(email)
+        assert email.status == "failed"
+        assert email.attempts == 2
+        assert email.html_content == ""
+
+
+def test_enqueue_requires_email_settings(db: Session) -> None:
+    with (
+        patch("app.core.config.settings.SMTP_HOST", None),
+        pytest.raises(AssertionError),
+    ):
+        enqueue_email(
+            session=db, email_to=random_email(), subject="Hi", html_content="<p/>"
+        )
+
+
+def test_purge_old_emails(db: Session) -> None:
+    old = datetime.utcnow() - timedelta(days=settings.EMAIL_QUEUE_RETENTION_DAYS + 1)
+    emails = {
+        "old sent": EmailOutbox(
+            email_to=random_email(),
+            subject="Hi",
+            html_content="",
+            status="sent",
+            created_at=old,
+        ),
+        "old failed": EmailOutbox(
+            email_to=random_email(),
+            subject="Hi",
+            html_content="",
+            status="failed",
+            created_at=old,
+        ),
+        "old pending": EmailOutbox(
+            email_to=random_email(), subject="Hi", html_content="<p/>", created_at=old
+        ),
+        "new sent": EmailOutbox(
+            email_to=random_email(), subject="Hi", html_content="", status="sent"
+        ),
+    }
+    db.add_all(emails.values())
+    db.commit()
+
+    assert purge_old_emails(db) == 2
+    remaining = set(db.exec(select(EmailOutbox.email_to)).all())
+    assert remaining == {emails["old pending"].email_to, emails["new sent"].email_to}
@@ -0,0 +1,34 @@
+from app.graph import Neighbourhood, find_introductions
+
+
+def neighbourhood(
+    relations: list[tuple[int, int]], how_hard: dict[int, int], reached: set[int]
+) -> Neighbourhood:
+    graph = Neighbourhood()
+    for client_pk in {pk for relation in relations for pk in relation}:
+        graph.add_client(
+            client_pk, how_hard.get(client_pk, 1), int(client_pk in reached)
+        )
+    for a, b in relations:
+        graph.neighbours[a].add(b)
+        graph.neighbours[b].add(a)
+    return graph
+
+
+def test_cheap_long_path_does_not_hide_short_one() -> None:
+    # 1 is the target. 4 is reached cheaply over 2 and 3, but from there the
+    # reached client 6 is past the depth cap; over 5 it fits
+    graph = neighbourhood(
+        [(1, 2), (2, 3), (3, 4), (1, 5), (5, 4), (4, 6)],
+        how_hard={5: 5, 4: 1},
+        reached={6},
+    )
+    assert find_introductions(graph, 1, k=5, max_depth=3) == [(6, [6, 4, 5, 1])]
+    assert find_introductions(graph, 1, k=5, max_depth=4) == [(3, [6, 4, 3, 2, 1])]
+
+
+def test_each_reached_client_once() -> None:
+    graph = neighbourhood(
+        [(1, 2), (1, 3), (2, 4), (3, 4)], how_hard={2: 1, 3: 2}, reached={4}
+    )
+    assert find_introductions(graph, 1, k=5, max_depth=3) == [(1, [4, 2, 1])]
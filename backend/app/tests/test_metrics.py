@@ -0,0 +1,124 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlmodel import Session, delete
+
+from app.core.config import settings
+from app.main import custom_generate_unique_id
+from app.metrics import PrometheusMiddleware, find_route_label
+from app.models import EmailOutbox
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_request_metrics_are_labelled_by_route(client: TestClient) -> None:
+    labels = {"route": "clients-get_clients", "method": "GET", "status": "200"}
+    before = sample("http_requests_total", **labels)
+
+    r = client.get(f"{settings.API_V1_STR}/clients/")
+    assert r.status_code == 200
+
+    assert sample("http_requests_total", **labels) == before + 1
+    assert (
+        sample(
+            "http_response_size_bytes_sum", route="clients-get_clients", method="GET"
+        )
+        >= r.num_bytes_downloaded
+    )
+    assert (
+        sample(
+            "http_request_duration_seconds_count",
+            route="clients-get_clients",
+            method="GET",
+        )
+        >= 1
+    )
+
+
+def test_unknown_paths_share_one_label(client: TestClient) -> None:
+    before = sample(
+        "http_requests_total", route="unmatched", method="GET", status="404"
+    )
+    client.get("/no-such-page/1")
+    client.get("/no-such-page/2")
+    assert (
+        sample("http_requests_total", route="unmatched", method="GET", status="404")
+        == before + 2
+    )
+
+
+def test_find_route_label_for_wrong_method(client: TestClient) -> None:
+    scope = {
+        "type": "http",
+        "method": "PATCH",
+        "path": f"{settings.API_V1_STR}/clients/",
+        "root_path": "",
+    }
+    assert find_route_label(client.app.routes, scope) == "clients-get_clients"  # type: ignore[attr-defined]
+
+
+def test_streaming_response_is_measured_until_the_end() -> None:
+    app = FastAPI(generate_unique_id_function=custom_generate_unique_id)
+    app.add_middleware(PrometheusMiddleware, routes=app.routes)
+
+    @app.get("/stream", tags=["test"])
+    def stream() -> StreamingResponse:
+        return StreamingResponse(iter([b"a" * 10, b"b" * 20, b"c" * 30]))
+
+    labels = {"route": "test-stream", "method": "GET"}
+    before = sample("http_response_size_bytes_sum", **labels)
+    in_progress = sample("http_requests_in_progress", **labels)
+
+    with TestClient(app) as test_client:
+        assert test_client.get("/stream").content == b"a" * 10 + b"b" * 20 + b"c" * 30
+
+    assert sample("http_response_size_bytes_sum", **labels) == before + 60
+    assert sample("http_requests_in_progress", **labels) == in_progress
+
+
+def test_metrics_endpoint(client: TestClient, db: Session) -> None:
+    db.add(
+        EmailOutbox(email_to="metrics@example.com", subject="Hi", html_content="<p/>")
+    )
+    db.commit()
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert "db_pool_checked_out " in body
+    assert 'app_cache_hits_total{cache="email_templates"}' in body
+    assert 'email_queue_emails{status="pending"}' in body
+    assert "email_queue_oldest_pending_seconds " in body
+
+    db.execute(delete(EmailOutbox))
+    db.commit()
+
+
+def test_importing_metrics_runs_no_query() -> None:
+    script = """
+import sys
+from sqlalchemy import event
+from app.core.db import engine
+
+statements = []
+event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+import app.metrics
+
+sys.exit(len(statements))
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).parents[2],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,85 @@
+import logging
+from unittest.mock import patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app.api.deps import SessionDep
+from app.core.config import settings
+from app.main import custom_generate_unique_id
+from app.models import Clients
+from app.query_stats import (
+    QueryBudgetExceeded,
+    QueryStatsMiddleware,
+    capture_queries,
+    query_budget,
+)
+from app.tests.utils.client import create_random_client, create_relation
+
+
+def test_capture_queries(db: Session) -> None:
+    create_random_client(db)
+    create_random_client(db)
+
+    with capture_queries() as stats:
+        db.exec(select(Clients).limit(2)).all()
+        db.exec(select(Clients).limit(2)).all()
+
+    assert stats.queries == 2
+    assert stats.rows == 4
+    assert stats.duration > 0
+    assert stats.most_repeated() is not None
+    assert stats.most_repeated()[1] == 2  # type: ignore[index]
+
+    # Nothing is counted outside the block
+    db.exec(select(Clients).limit(1)).all()
+    assert stats.queries == 2
+
+
+def test_server_timing_header(client: TestClient, db: Session) -> None:
+    a = create_random_client(db)
+    create_relation(db, a, create_random_client(db))
+
+    r = client.get(f"{settings.API_V1_STR}/clients/{a.userId}/relations")
+    assert r.status_code == 200
+    assert r.headers["server-timing"].startswith("db;dur=")
+    assert r.headers["server-timing"].endswith('desc="4 queries"')
+
+
+def make_app(queries: int, budget: int) -> FastAPI:
+    app = FastAPI(generate_unique_id_function=custom_generate_unique_id)
+    app.add_middleware(QueryStatsMiddleware, routes=app.routes)
+
+    @app.get("/clients", tags=["test"])
+    @query_budget(budget)
+    def get_clients(session: SessionDep) -> int:
+        for _ in range(queries):
+            session.exec(select(Clients.id).limit(1)).all()
+        return queries
+
+    return app
+
+
+def test_query_budget_is_enforced() -> None:
+    with TestClient(make_app(queries=1, budget=1)) as test_client:
+        assert test_client.get("/clients").status_code == 200
+
+    with TestClient(make_app(queries=2, budget=1)) as test_client:
+        with pytest.raises(QueryBudgetExceeded, match="test-get_clients"):
+            test_client.get("/clients")
+
+
+def test_query_budget_is_logged_when_not_enforced(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    with (
+        patch("app.core.config.settings.QUERY_BUDGET_ENFORCED", False),
+        TestClient(make_app(queries=12, budget=1)) as test_client,
+    ):
+        assert test_client.get("/clients").status_code == 200
+
+    warnings = [r.message for r in caplog.records if r.levelno == logging.WARNING]
+    assert "test-get_clients executed 12 queries, its budget is 1" in warnings
+    assert any(message.startswith("Possible N+1 query") for message in warnings)
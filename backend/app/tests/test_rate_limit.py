@@ -0,0 +1,33 @@
+from app.core.rate_limit import SlidingWindowLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sliding_window_limiter() -> None:
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(clock=clock)
+
+    assert limiter.hit("key", 2, 60) == 0
+    clock.now += 10
+    assert limiter.hit("key", 2, 60) == 0
+    assert limiter.hit("key", 2, 60) == 50
+    assert limiter.hit("other", 2, 60) == 0
+
+    # The first attempt leaves the window
+    clock.now += 50
+    assert limiter.hit("key", 2, 60) == 0
+    assert limiter.hit("key", 2, 60) == 10
+
+
+def test_sliding_window_limiter_undo() -> None:
+    limiter = SlidingWindowLimiter(clock=FakeClock())
+    assert limiter.hit("key", 1, 60) == 0
+    limiter.undo("key")
+    assert limiter.hit("key", 1, 60) == 0
+    assert limiter.hit("key", 1, 60) > 0
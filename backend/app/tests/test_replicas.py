@@ -0,0 +1,63 @@
+from typing import cast
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import QueuePool
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.replicas import READ_PRIMARY_COOKIE, ReadYourWritesMiddleware, ReplicaSet
+
+PRIMARY_URL = engine.url.render_as_string(hide_password=False)
+UNREACHABLE_URL = engine.url.set(port=1).render_as_string(hide_password=False)
+
+
+def test_unhealthy_replicas_are_skipped() -> None:
+    replicas = ReplicaSet([PRIMARY_URL, UNREACHABLE_URL, PRIMARY_URL])
+    assert replicas.choose() is None
+
+    replicas.check()
+    assert replicas.healthy == [True, False, True]
+    first, _, third = replicas.engines
+    assert [replicas.choose() for _ in range(4)] == [first, third, first, third]
+
+
+def test_reads_go_to_replicas_unless_the_client_wrote(client: TestClient) -> None:
+    replicas = ReplicaSet([PRIMARY_URL])
+    replicas.check()
+    (replica,) = replicas.engines
+    url = f"{settings.API_V1_STR}/clients/"
+
+    with patch("app.api.deps.replicas", replicas):
+        assert client.get(url).status_code == 200
+        assert cast(QueuePool, replica.pool).checkedin() == 1
+
+        replica.dispose()
+        r = client.get(url, headers={"Cookie": f"{READ_PRIMARY_COOKIE}=1"})
+        assert r.status_code == 200
+        assert cast(QueuePool, replica.pool).checkedin() == 0
+
+
+def test_successful_writes_set_the_read_primary_cookie() -> None:
+    app = FastAPI()
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    @app.get("/read")
+    @app.post("/write")
+    def endpoint() -> dict[str, str]:
+        return {}
+
+    @app.post("/fail", status_code=400)
+    def fail() -> dict[str, str]:
+        return {}
+
+    with TestClient(app) as test_client:
+        assert READ_PRIMARY_COOKIE not in test_client.get("/read").cookies
+        assert READ_PRIMARY_COOKIE not in test_client.post("/fail").cookies
+        r = test_client.post("/write")
+        assert r.cookies[READ_PRIMARY_COOKIE] == "1"
+        assert (
+            f"Max-Age={settings.REPLICA_READ_YOUR_WRITES_SECONDS}"
+            in r.headers["set-cookie"]
+        )
@@ -0,0 +1,71 @@
+import time
+from collections.abc import Callable
+from unittest.mock import patch
+
+from sqlmodel import Session
+
+from app.core.db import engine
+from app.core.revocations import (
+    TokenRevocations,
+    revoke_tokens,
+    token_revocations,
+)
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_revocations_expire_with_the_tokens() -> None:
+    revocations = TokenRevocations()
+    issued_at = time.time()
+    assert revocations.trusts(1, issued_at)
+
+    revocations.add(1, issued_at + 1)
+    assert not revocations.trusts(1, issued_at)
+    assert revocations.trusts(1, issued_at + 2)
+    assert revocations.trusts(2, issued_at)
+
+    # Once the tokens it applies to have expired, a revocation is dropped
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS_EXPIRE_MINUTES", 1):
+        revocations.add(3, time.time() - 120)
+    assert revocations.trusts(3, time.time() - 180)
+    assert not revocations.trusts(1, issued_at)
+
+
+def test_revocations_reach_other_workers() -> None:
+    revocations = TokenRevocations()
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        revocations.start()
+        try:
+            assert revocations.listening.wait(5)
+            # Revocations sent before it listened are unknown to it
+            assert not revocations.trusts(1, time.time() - 60)
+            issued_at = time.time()
+            assert revocations.trusts(1, issued_at)
+
+            with Session(engine) as session:
+                revoke_tokens(session, 1)
+                time.sleep(0.1)
+                # Sent on commit only
+                assert revocations.trusts(1, issued_at)
+                session.commit()
+            assert wait_for(lambda: not revocations.trusts(1, issued_at))
+        finally:
+            revocations.stop()
+
+
+def test_revocations_cover_tokens_issued_before_commit() -> None:
+    with patch("app.core.config.settings.ACCESS_TOKEN_CLAIMS", True):
+        with Session(engine) as session:
+            revoke_tokens(session, 1)
+            # Issued with the claims from before the uncommitted change
+            issued_at = time.time()
+            time.sleep(0.01)
+            session.commit()
+        assert not token_revocations.trusts(1, issued_at)
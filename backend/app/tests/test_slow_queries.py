@@ -0,0 +1,99 @@
+import time
+from collections.abc import Generator
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from app import crud
+from app.core.config import settings
+from app.models import Clients, UserCreate
+from app.slow_queries import REDACTED, slow_query_log
+from app.tests.utils.client import create_random_client
+from app.tests.utils.utils import random_email, random_lower_string
+
+
+@pytest.fixture(autouse=True)
+def log_every_query() -> Generator[None, None, None]:
+    slow_query_log.clear()
+    with (
+        patch("app.core.config.settings.SLOW_QUERY_THRESHOLD_MS", 0),
+        patch("app.core.config.settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 1.0),
+    ):
+        yield
+    slow_query_log.clear()
+
+
+def wait_for_plan(statement_start: str) -> str:
+    for _ in range(100):
+        for entry in slow_query_log.entries():
+            if entry.statement.startswith(statement_start) and entry.plan:
+                return entry.plan
+        time.sleep(0.05)
+    raise AssertionError("No plan captured")
+
+
+def test_slow_select_is_explained(db: Session) -> None:
+    client = create_random_client(db)
+    slow_query_log.clear()
+
+    db.exec(select(Clients).where(Clients.userId == client.userId)).all()
+
+    [entry] = [e for e in slow_query_log.entries() if e.statement.startswith("SELECT")]
+    assert client.userId in entry.parameters
+    assert entry.duration_ms >= 0
+    assert entry.route is None
+    plan = wait_for_plan("SELECT")
+    assert "actual time=" in plan
+    assert "Buffers:" in plan or "Planning" in plan
+
+
+def test_writes_are_not_explained(db: Session) -> None:
+    create_random_client(db)
+
+    inserts = [e for e in slow_query_log.entries() if e.statement.startswith("INSERT")]
+    assert inserts
+    time.sleep(0.2)
+    assert all(entry.plan is None for entry in inserts)
+
+
+def test_sensitive_parameters_are_redacted(db: Session) -> None:
+    user = crud.create_user(
+        session=db,
+        user_create=UserCreate(email=random_email(), password=random_lower_string()),
+    )
+
+    [entry] = [e for e in slow_query_log.entries() if e.statement.startswith("INSERT")]
+    assert user.email in entry.parameters
+    assert user.hashed_password not in entry.parameters
+    assert REDACTED in entry.parameters
+
+
+def test_disabled_threshold(db: Session) -> None:
+    with patch("app.core.config.settings.SLOW_QUERY_THRESHOLD_MS", None):
+        db.exec(select(Clients).limit(1)).all()
+    assert slow_query_log.entries() == []
+
+
+def test_get_slow_queries(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+) -> None:
+    client.get(f"{settings.API_V1_STR}/clients/")
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/slow-queries/", headers=superuser_token_headers
+    )
+    assert r.status_code == 200
+    data = r.json()
+    assert data["count"] >= 2
+    routes = {entry["route"] for entry in data["data"]}
+    assert "clients-get_clients" in routes
+
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/slow-queries/",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 400
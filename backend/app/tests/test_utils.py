@@ -0,0 +1,24 @@
+from unittest.mock import patch
+
+from app.utils import generate_test_email, get_email_templates
+
+
+def test_email_templates_are_compiled_once() -> None:
+    first = generate_test_email(email_to="first@example.com")
+    with patch("jinja2.environment.Environment.compile") as compile_template:
+        second = generate_test_email(email_to="second@example.com")
+    compile_template.assert_not_called()
+    assert "first@example.com" in first.html_content
+    assert "second@example.com" in second.html_content
+
+
+def test_email_templates_reload_only_in_local_mode() -> None:
+    get_email_templates.cache_clear()
+    try:
+        with patch("app.core.config.settings.ENVIRONMENT", "production"):
+            assert get_email_templates().auto_reload is False
+        get_email_templates.cache_clear()
+        with patch("app.core.config.settings.ENVIRONMENT", "local"):
+            assert get_email_templates().auto_reload is True
+    finally:
+        get_email_templates.cache_clear()
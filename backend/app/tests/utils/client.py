@@ -0,0 +1,28 @@
+from sqlmodel import Session
+
+from app.models import Clients, Relations
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_client(db: Session, **kwargs: object) -> Clients:
+    user_id = random_lower_string()
+    kwargs.setdefault("howHardToReach", 1)
+    client = Clients(
+        name=random_lower_string(),
+        nickname=random_lower_string(),
+        instagram="default.png",
+        userId=user_id,
+        **kwargs,
+    )
+    db.add(client)
+    db.commit()
+    db.refresh(client)
+    return client
+
+
+def create_relation(db: Session, from_client: Clients, to_client: Clients) -> Relations:
+    relation = Relations(fromClientId=from_client.userId, toClientId=to_client.userId)
+    db.add(relation)
+    db.commit()
+    db.refresh(relation)
+    return relation
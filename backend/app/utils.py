@@ -1,15 +1,20 @@
 import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import emails  # type: ignore
-from jinja2 import Template
 from jose import JWTError, jwt
 
 from app.core.config import settings
 
+# emails and jinja2 are only needed once an email is sent, importing them
+# lazily keeps them out of every worker's startup
+if TYPE_CHECKING:
+    import emails  # type: ignore
+    from jinja2 import Environment
+
 
 @dataclass
 class EmailData:
@@ -17,27 +22,39 @@ class EmailData:
     subject: str
 
 
+@lru_cache
+def get_email_templates() -> "Environment":
+    """
+    Jinja2 environment for the built email templates.
+
+    Templates are compiled once per process and kept in memory; in local mode
+    they are checked for changes on disk on every render.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+    bytecode_cache = None
+    if settings.EMAIL_TEMPLATES_BYTECODE_CACHE_DIR:
+        bytecode_cache = FileSystemBytecodeCache(
+            settings.EMAIL_TEMPLATES_BYTECODE_CACHE_DIR
+        )
+    return Environment(
+        loader=FileSystemLoader(Path(__file__).parent / "email-templates" / "build"),
+        auto_reload=settings.ENVIRONMENT == "local",
+        bytecode_cache=bytecode_cache,
+    )
+
+
 def render_email_template(*, template_name: str, context: dict[str, Any]) -> str:
-    template_str = (
-        Path(__file__).parent / "email-templates" / "build" / template_name
-    ).read_text()
-    html_content = Template(template_str).render(context)
+    template = get_email_templates().get_template(template_name)
+    html_content = template.render(context)
     return html_content
 
 
-def send_email(
-    *,
-    email_to: str,
-    subject: str = "",
-    html_content: str = "",
-) -> None:
-    assert settings.emails_enabled, "no provided configuration for email variables"
-    message = emails.Message(
-        subject=subject,
-        html=html_content,
-        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
-    )
-    smtp_options = {"host": settings.SMTP_HOST, "port": settings.SMTP_PORT}
+def get_smtp_options() -> dict[str, Any]:
+    smtp_options: dict[str, Any] = {
+        "host": settings.SMTP_HOST,
+        "port": settings.SMTP_PORT,
+    }
     if settings.SMTP_TLS:
         smtp_options["tls"] = True
     elif settings.SMTP_SSL:
@@ -46,7 +63,33 @@ def send_email(
         smtp_options["user"] = settings.SMTP_USER
     if settings.SMTP_PASSWORD:
         smtp_options["password"] = settings.SMTP_PASSWORD
-    response = message.send(to=email_to, smtp=smtp_options)
+    return smtp_options
+
+
+def build_email_message(*, subject: str, html_content: str) -> "emails.Message":
+    import emails
+
+    return emails.Message(
+        subject=subject,
+        html=html_content,
+        mail_from=(settings.EMAILS_FROM_NAME, settings.EMAILS_FROM_EMAIL),
+    )
+
+
+def send_email(
+    *,
+    email_to: str,
+    subject: str = "",
+    html_content: str = "",
+) -> None:
+    """
+    Send an email right away, in the calling thread.
+
+    Request handlers should use app.email_queue.enqueue_email instead.
+    """
+    assert settings.emails_enabled, "no provided configuration for email variables"
+    message = build_email_message(subject=subject, html_content=html_content)
+    response = message.send(to=email_to, smtp=get_smtp_options())
     logging.info(f"send email result: {response}")
 
 
@@ -17,8 +17,10 @@ import {
 import {useNavigate} from "@tanstack/react-router";
 
 const CircleGraph = () => {
-    const [relations, setRelations] = useState([]);
+    const [graph, setGraph] = useState(null);
     const [clientData, setClientData] = useState(null);
+    // Details of every client in the graph by userId, fetched in one request
+    const [clientsByUserId, setClientsByUserId] = useState({});
     const [error, setError] = useState(null);
     // let [inputClientId, setInputClientId] = useState("");
     const [clientId, setClientId] = useState(new URLSearchParams(window.location.search).get('clientId'));
@@ -71,19 +73,25 @@ const CircleGraph = () => {
                 try {
                     const response = await __request(OpenAPI, {
                         method: 'GET',
-                        url: `/api/v1/clients/${clientId}/relations`,
+                        url: `/api/v1/clients/${clientId}/graph`,
                         mediaType: 'application/json',
                         errors: {
                             404: `Not Found`,
                             422: `Validation Error`,
                         },
                     });
-                    if (response.data) {
-                        setRelations(response.data);
-                    } else {
-                        setRelations(response);
-                    }
+                    setGraph(response);
                     setError(null); // Clear any previous error
+                    const clients = await __request(OpenAPI, {
+                        method: 'POST',
+                        url: '/api/v1/clients/batch',
+                        body: {userIds: response.nodes.userId},
+                        mediaType: 'application/json',
+                        errors: {
+                            422: `Validation Error`,
+                        },
+                    });
+                    setClientsByUserId(clients.byUserId);
                 } catch (error) {
                     if (error.status === 404) {
                         setError("Client not found. Please enter a valid client ID.");
@@ -106,6 +114,11 @@ const CircleGraph = () => {
     }
 
     const fetchClientData = async (nodeId) => {
+        if (clientsByUserId[nodeId]) {
+            setClientData(clientsByUserId[nodeId]);
+            onOpen();
+            return;
+        }
         try {
             const response = await __request(OpenAPI, {
                 method: 'GET',
@@ -139,116 +152,27 @@ const CircleGraph = () => {
         }
     };
 
-    // Function to convert relations data to graph nodes and links
+    // Function to convert the graph payload (node table and edge arrays) to graph nodes and links
     const convertToGraphData = () => {
-        const nodes = [];
-        const links = [];
-        if (!Array.isArray(relations) && clientId) {
-            console.log(relations)
-            // If there are no relations, add a single node for the client
-            nodes.push({
-                id: clientId,
-                label: relations.name,
-                // color: 'white',
-                svg: `http://localhost/api/v1/static/${relations.instagram}`,
-                // strokeColor: 'orange',
-                // strokeWidth: 5,
-                size: 500,
-                fontSize: 14,
-                // renderLabel: true,
-                labelProperty: 'label',
-                labelPosition: 'bottom',
-            });
-        } else {
-            relations.forEach(relation => {
-                const fromNode = {
-                    id: relation.fromClientId,
-                    label: relation.from_client_name,
-                    // color: 'white',
-                    // strokeColor: 'orange',
-                    // strokeWidth: 5,
-                    symbolType: 'circle',
-                    size: 500,
-                    fontSize: 14,
-                    // renderLabel: true,
-                    labelProperty: 'label',
-                    svg: `http://localhost/api/v1/static/${relation.fromClientInstagram}`,
-                    labelPosition: 'bottom',
-                };
-                const toNode = {
-                    id: relation.toClientId,
-                    label: relation.to_client_name,
-                    // color: 'white',
-                    // strokeColor: 'lightblue',
-                    // strokeWidth: 5,
-                    symbolType: 'circle',
-                    size: 500,
-                    fontSize: 14,
-                    // fontWeight: 'bold',
-                    // renderLabel: true,
-                    svg: `http://localhost/api/v1/static/${relation.toClientInstagram}`,
-                    labelProperty: 'label',
-                    labelPosition: 'bottom',
-                };
-
-                if (!nodes.find(node => node.id === fromNode.id)) {
-                    nodes.push(fromNode);
-                }
-                if (!nodes.find(node => node.id === toNode.id)) {
-                    nodes.push(toNode);
-                }
-
-                links.unshift({
-                    source: fromNode.id,
-                    target: toNode.id,
-                });
-
-                if (relation.relations) {
-                    relation.relations.forEach(subRelation => {
-                        const subFromNode = {
-                            id: subRelation.fromClientId,
-                            label: subRelation.from_client_name,
-                            size: 500,
-                            svg: `http://localhost/api/v1/static/${subRelation.fromClientInstagram}`,
-                            fontSize: 14,
-                            labelPosition: 'bottom',
-                            labelProperty: 'label',
-                            symbolType: 'circle',
-                        };
-                        const subToNode = {
-                            id: subRelation.toClientId,
-                            label: subRelation.to_client_name,
-                            // color: 'white',
-                            // strokeColor: 'pink',
-                            // strokeWidth: 5,
-                            size: 500,
-                            svg: `http://localhost/api/v1/static/${subRelation.toClientInstagram}`,
-                            fontSize: 14,
-                            // fontWeight: 'bold',
-                            labelPosition: 'bottom',
-                            labelProperty: 'label',
-                            symbolType: 'circle',
-                        };
-
-                        if (!nodes.find(node => node.id === subToNode.id)) {
-                            nodes.push(subToNode);
-                        }
-                        if (!nodes.find(node => node.id === subFromNode.id)) {
-                            nodes.push(subFromNode);
-                        }
-
-                        links.unshift({
-                            source: subFromNode.id,
-                            target: subToNode.id,
-                            color: "#3eef19"
-                        });
-                    });
-                }
-            });
+        if (!graph) {
+            return {nodes: [], links: []};
         }
-
-        console.log(links)
-        console.log(nodes)
+        const nodes = graph.nodes.userId.map((userId, index) => ({
+            id: userId,
+            label: graph.nodes.name[index],
+            symbolType: 'circle',
+            size: 500,
+            fontSize: 14,
+            labelProperty: 'label',
+            svg: `http://localhost/api/v1/static/${graph.nodes.instagram[index]}`,
+            labelPosition: 'bottom',
+        }));
+        // Second hop relations are drawn in green
+        const links = graph.edges.source.map((source, index) => ({
+            source: nodes[source].id,
+            target: nodes[graph.edges.target[index]].id,
+            ...(graph.edges.depth[index] === 2 ? {color: "#3eef19"} : {}),
+        }));
         return {
             nodes,
             links,